@@ -0,0 +1,146 @@
+"""以 NumPy 一次計算所有區域的語言統計指標
+
+各區域的語言比例整理成「區域 × 語言」矩陣後，以向量化運算同時算出：
+各顯示模式（排除不同語言群組）的主要語言、Shannon 與 Simpson 多樣性指數，
+以及各語言在所有區域中的排名與標準分數（z-score）；不同調查年份之間的
+變化同樣以矩陣相減一次算出。
+結果只計算一次，供樣式表與彈窗直接查詢。
+"""
+import numpy as np
+
+def language_matrix(language_data, languages=None, order=()):
+    """將 {區域代碼: {語言: 比例}} 轉為矩陣，返回 (區域代碼列表, 語言列表, 矩陣)
+
+    未指定 languages 時，order 中出現在數據裡的語言排在前面，其餘依第一次出現的順序排列；
+    缺少的數值為 NaN。
+    """
+    area_ids = list(language_data)
+    if languages is None:
+        found = []
+        for lang_data in language_data.values():
+            for lang in lang_data or {}:
+                if lang not in found:
+                    found.append(lang)
+        languages = [lang for lang in order if lang in found] + [lang for lang in found if lang not in order]
+    columns = {lang: index for index, lang in enumerate(languages)}
+    matrix = np.full((len(area_ids), len(languages)), np.nan)
+    for row, area_id in enumerate(area_ids):
+        for lang, value in (language_data[area_id] or {}).items():
+            if lang in columns and value is not None:
+                matrix[row, columns[lang]] = value
+    return area_ids, list(languages), matrix
+
+def _dominant(matrix, excluded):
+    """每列最大值所在的欄位，沒有可比較的數值時為 -1（同分時取排在前面的語言）"""
+    values = np.where(np.isnan(matrix), -np.inf, matrix)
+    if excluded:
+        values[:, excluded] = -np.inf
+    if not values.shape[1]:
+        return np.full(values.shape[0], -1)
+    dominant = values.argmax(axis=1)
+    dominant[np.isneginf(values.max(axis=1))] = -1
+    return dominant
+
+def _ranks(matrix):
+    """各語言在所有區域中的名次（1 為比例最高，同分同名次），沒有數值時為 0"""
+    ranks = np.zeros(matrix.shape, dtype=int)
+    for column in range(matrix.shape[1]):
+        values = matrix[:, column]
+        present = ~np.isnan(values)
+        ordered = np.sort(-values[present])
+        ranks[present, column] = np.searchsorted(ordered, -values[present], side='left') + 1
+    return ranks
+
+def _zscores(matrix):
+    """各語言比例的標準分數，所有區域數值相同時為 0，沒有數值時為 NaN"""
+    present = ~np.isnan(matrix)
+    counts = np.maximum(present.sum(axis=0), 1)
+    mean = np.where(present, matrix, 0.0).sum(axis=0) / counts
+    std = np.sqrt((np.where(present, matrix - mean, 0.0) ** 2).sum(axis=0) / counts)
+    zscores = (matrix - mean) / np.where(std > 0, std, 1)
+    return np.where(std > 0, zscores, np.where(present, 0.0, np.nan))
+
+def _diversity(matrix):
+    """以各語言比例佔該區域總和的比重計算 Shannon 指數 H 與 Simpson 指數 1 - Σp²
+
+    另外返回除以最大可能值（所有語言比重相同）後介於 0–1 的標準化指數。
+    語言比例是「會使用該語言的人口比例」（主要與次要使用之和），一個人可使用多種語言，
+    各語言相加通常遠超過 100，並不是互斥的分布；這裡的指數是正規化後的使用比重的多樣性，
+    不是說話者依單一主要語言分組的多樣性。
+    """
+    shares = np.clip(np.nan_to_num(matrix), 0, None)
+    totals = shares.sum(axis=1, keepdims=True)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        p = np.where(totals > 0, shares / totals, 0.0)
+        # 加 0.0 避免只有一種語言時出現 -0.0
+        shannon = -np.where(p > 0, p * np.log(p), 0.0).sum(axis=1) + 0.0
+    simpson = 1 - (p ** 2).sum(axis=1)
+    has_data = totals[:, 0] > 0
+    shannon[~has_data] = np.nan
+    simpson[~has_data] = np.nan
+    count = matrix.shape[1]
+    max_shannon = np.log(count) if count > 1 else 1.0
+    max_simpson = 1 - 1 / count if count > 1 else 1.0
+    return shannon, simpson, shannon / max_shannon, simpson / max_simpson
+
+def compute_analytics(language_data, languages=None, exclusions=None, order=()):
+    """一次計算所有區域的統計指標，返回以 NumPy 陣列保存的結果
+
+    陣列的列依 ids 排列；dominant 與 rank 等欄位索引對應 languages。
+    exclusions 為 {模式: 排除的語言}，dominant_modes[模式] 是排除這些語言後的主要語言。
+    """
+    area_ids, languages, matrix = language_matrix(language_data, languages, order)
+    shannon, simpson, evenness, simpson_norm = _diversity(matrix)
+    return {
+        'ids': area_ids,
+        'index': {area_id: row for row, area_id in enumerate(area_ids)},
+        'languages': languages,
+        'values': matrix,
+        'dominant': _dominant(matrix, []),
+        'dominant_modes': {mode: _dominant(matrix, [index for index, lang in enumerate(languages) if lang in excluded])
+                           for mode, excluded in (exclusions or {}).items()},
+        'shannon': shannon,
+        'simpson': simpson,
+        'evenness': evenness,
+        'simpson_norm': simpson_norm,
+        'rank': _ranks(matrix),
+        'zscore': _zscores(matrix)
+    }
+
+def compute_deltas(analytics, base):
+    """與另一次調查（base，同樣是 compute_analytics 的結果）相比各語言比例的變化（百分點）
+
+    返回的矩陣列與欄對應 analytics 的 ids 與 languages，任一方沒有數值時為 NaN。
+    """
+    rows = np.array([base['index'].get(area_id, -1) for area_id in analytics['ids']], dtype=int)
+    columns = np.array([base['languages'].index(lang) if lang in base['languages'] else -1
+                        for lang in analytics['languages']], dtype=int)
+    previous = np.full(analytics['values'].shape, np.nan)
+    previous[np.ix_(rows >= 0, columns >= 0)] = base['values'][np.ix_(rows[rows >= 0], columns[columns >= 0])]
+    return analytics['values'] - previous
+
+def dominant_language(analytics, area_id, mode=None):
+    """查詢區域在指定模式（exclusions 的鍵）下的主要語言名稱，沒有數據時返回None"""
+    row = analytics['index'].get(area_id)
+    if row is None:
+        return None
+    column = analytics['dominant_modes'].get(mode, analytics['dominant'])[row]
+    return analytics['languages'][column] if column >= 0 else None
+
+def area_metrics(analytics, digits=2):
+    """彈窗顯示的指標，返回 {區域代碼: 指標}，沒有數據的區域不列出"""
+    languages = analytics['languages']
+    metrics = {}
+    for row, area_id in enumerate(analytics['ids']):
+        if np.isnan(analytics['shannon'][row]):
+            continue
+        ranks = analytics['rank'][row]
+        zscores = analytics['zscore'][row]
+        metrics[area_id] = {
+            'shannon': round(float(analytics['shannon'][row]), digits),
+            'simpson': round(float(analytics['simpson'][row]), digits),
+            'rank': {lang: int(ranks[column]) for column, lang in enumerate(languages) if ranks[column]},
+            'zscore': {lang: round(float(zscores[column]), digits) for column, lang in enumerate(languages)
+                       if not np.isnan(zscores[column])}
+        }
+    return metrics
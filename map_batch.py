@@ -0,0 +1,154 @@
+"""批次產生多種版本的語言分布地圖
+
+地理數據與語言數據只載入、簡化一次，並寫成所有版本共用的 geometry.geojson；
+各版本（包含／排除華語、語言多樣性、單一語言分布圖、各區域）再由多個程序平行輸出到
+同一個目錄，最後以 manifest.json 記錄產生的檔案。
+"""
+import json
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import map_store
+import taiwan_language_map_new as language_map
+
+GEOMETRY_ASSET = 'geometry.geojson'
+MANIFEST_NAME = 'manifest.json'
+VARIANT_KINDS = ('modes', 'languages', 'regions')
+
+# Language_data 區域資料夾的中文名稱（語言與顯示模式的檔名代稱由語言登錄表設定）
+REGION_TITLES = {'Northern': '北部', 'Middle': '中部', 'Southern': '南部', 'Eastern&KinmenMatsu': '東部及金馬'}
+
+# 工作程序的共用狀態，由 _init_worker 在每個程序啟動時設定一次
+_worker_state = {}
+
+def _slug(text):
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+
+def county_regions(dataset):
+    """依活頁簿所在的區域資料夾分組縣市代碼，返回 {區域: [county_id]}（資料庫需已編譯）"""
+    store = map_store.read_store(dataset.store_path)
+    regions = {}
+    for county_id, county in store['counties'].items():
+        if county['region']:
+            regions.setdefault(county['region'], []).append(county_id)
+    return regions
+
+def plan_variants(dataset, kinds=VARIANT_KINDS):
+    """列出要產生的版本，每個版本是 create_language_map 的參數加上檔名"""
+    registry = language_map.get_language_registry()
+    variants = []
+    if 'modes' in kinds:
+        # 與頁面的模式切換相同：依主要語言填色的模式（例如排除華語）與各多樣性指數各一個版本
+        for mode, label in language_map.map_modes():
+            if mode == 'normal':
+                variants.append({'name': 'all', 'title': None, 'initial_mode': mode})
+            else:
+                variants.append({'name': registry['mode_slugs'].get(mode, _slug(mode)), 'title': label,
+                                 'initial_mode': mode})
+    if 'languages' in kinds:
+        languages = dataset.analytics['languages']
+        for index, language in enumerate(languages):
+            slug = registry['slugs'].get(language, f'language{index}')
+            variants.append({'name': f'language-{slug}', 'title': f'{language}使用比例', 'language': language})
+    if 'regions' in kinds:
+        for region, county_ids in sorted(county_regions(dataset).items()):
+            variants.append({'name': f'region-{_slug(region)}', 'title': REGION_TITLES.get(region, region),
+                             'counties': sorted(county_ids)})
+    return variants
+
+def _init_worker(taiwan_geojson, dataset, output_dir, township_url):
+    _worker_state.update(taiwan_geojson=taiwan_geojson, dataset=dataset, output_dir=output_dir,
+                         township_url=township_url)
+
+def _render_variant(variant):
+    """在工作程序中產生一個版本，返回 manifest 中的記錄"""
+    start = time.perf_counter()
+    output_dir = _worker_state['output_dir']
+    m = language_map.create_language_map(
+        _worker_state['taiwan_geojson'],
+        geometry_asset=os.path.join(output_dir, GEOMETRY_ASSET),
+        township_url=_worker_state['township_url'],
+        dataset=_worker_state['dataset'],
+        initial_mode=variant.get('initial_mode', 'normal'),
+        language=variant.get('language'),
+        counties=variant.get('counties'),
+        title=variant.get('title'),
+        prepared=True,
+        write_geometry=False
+    )
+    path = os.path.join(output_dir, variant['name'] + '.html')
+    m.save(path)
+    return {
+        'name': variant['name'],
+        'title': variant.get('title'),
+        'file': os.path.basename(path),
+        'bytes': os.path.getsize(path),
+        'seconds': round(time.perf_counter() - start, 3)
+    }
+
+def generate_variants(taiwan_geojson, output_dir, dataset=None, kinds=VARIANT_KINDS, workers=None,
+                      simplify_tolerance=None, precision=language_map.map_geometry.DEFAULT_PRECISION,
+                      simplify_method='dp', townships=False, offline=False,
+                      cache_dir=language_map.GEOJSON_CACHE_DIR,
+                      township_geojson_url=language_map.TOWNSHIP_GEOJSON_URL):
+    """載入一次數據並平行產生所有版本，返回 manifest
+
+    workers 為 1 時在目前程序中依序產生（方便除錯）。
+    """
+    dataset = dataset or language_map.get_dataset()
+    os.makedirs(output_dir, exist_ok=True)
+
+    # 先確認資料庫是最新的（重新編譯會清除已載入的數據），再載入數據與統計指標，
+    # 傳給工作程序時一併帶過去，不必各自重新讀取
+    dataset.compile()
+    dataset.language_data
+    dataset.analytics
+    taiwan_geojson = language_map.prepare_map_geometry(taiwan_geojson, simplify_tolerance, precision,
+                                                       simplify_method, dataset)
+    language_map.write_geometry_asset(taiwan_geojson, os.path.join(output_dir, GEOMETRY_ASSET))
+
+    township_url = None
+    if townships:
+        language_map.build_township_assets(os.path.join(output_dir, 'townships'), dataset, offline=offline,
+                                           cache_dir=cache_dir, precision=precision,
+                                           simplify_method=simplify_method, url=township_geojson_url)
+        township_url = 'townships/'
+
+    variants = plan_variants(dataset, kinds)
+    start = time.perf_counter()
+    initargs = (taiwan_geojson, dataset, output_dir, township_url)
+    if workers == 1:
+        _init_worker(*initargs)
+        results = [_render_variant(variant) for variant in variants]
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=initargs) as executor:
+            results = list(executor.map(_render_variant, variants))
+
+    manifest = {
+        'generated': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'geometry': GEOMETRY_ASSET,
+        'townships': township_url,
+        'variants': results
+    }
+    with open(os.path.join(output_dir, MANIFEST_NAME), 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+    print(f"已產生 {len(results)} 個版本的地圖到 '{output_dir}'（{time.perf_counter() - start:.1f} 秒）")
+    return manifest
+
+def run(args):
+    """batch 子命令：依命令列參數批次產生地圖"""
+    taiwan_geojson = language_map.download_taiwan_geojson(url=args.geojson_url, cache_dir=args.cache_dir,
+                                                          ttl=args.cache_ttl, offline=args.offline,
+                                                          timeout=args.timeout)
+    if not taiwan_geojson:
+        print("批次產生失敗：缺少地理數據")
+        return None
+    dataset = language_map.get_dataset(args.data_dir, args.counties)
+    return generate_variants(taiwan_geojson, args.output_dir, dataset,
+                             kinds=args.variants, workers=args.workers,
+                             simplify_tolerance=args.simplify_tolerance, precision=args.precision,
+                             simplify_method=args.simplify_method, townships=args.townships,
+                             offline=args.offline, cache_dir=args.cache_dir,
+                             township_geojson_url=args.township_geojson_url)
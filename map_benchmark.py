@@ -0,0 +1,289 @@
+"""地圖產生流程與頁面腳本的效能基準
+
+依序量測 folium 的載入、數據載入、統計指標、地理數據載入與簡化、建立 folium 圖層與
+輸出HTML各階段的耗時（重複多次，記錄最小值、中位數、平均與標準差），
+以及HTML與 gzip 壓縮後的大小。頁面腳本以 Node.js 執行：以極簡的
+Leaflet／DOM 替身取代瀏覽器，量測腳本載入、初始化（到首次繪製）、
+載入外部數據、切換各顯示模式與產生所有彈窗的時間。這些是替身環境中的腳本時間，不含瀏覽器的解析、排版與繪製，
+報告中另外標示。結果可保存為基準檔，之後的量測若明顯變慢或變大即視為失敗；
+耗時只能與同一台機器的基準比較，基準檔因此不納入版本控制（以 --baseline 指定位置）。
+"""
+import gzip
+import importlib
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+import taiwan_language_map_new as language_map
+
+BASELINE_PATH = os.path.join(language_map.BASE_DIR, 'benchmark_baseline.json')
+DEFAULT_ROUNDS = 5
+TIME_TOLERANCE = 0.5  # 中位數比基準慢超過此比例時視為退步
+TIME_FLOOR = 0.005  # 差距小於此秒數時不計（避免極短的階段受雜訊影響）
+SIZE_TOLERANCE = 0.02  # 大小比基準大超過此比例時視為退步
+NODE_TIMEOUT = 120
+JAVASCRIPT_ENVIRONMENT = 'Node.js + Leaflet/DOM 替身，非瀏覽器實測'
+
+# 以 Node.js 執行頁面中的內嵌腳本，輸出一行 JSON（毫秒）
+NODE_HARNESS = r'''
+const fs = require('fs');
+const path = require('path');
+const {performance} = require('perf_hooks');
+
+const pagePath = process.argv[2];
+const html = fs.readFileSync(pagePath, 'utf8');
+const scripts = [...html.matchAll(/<script>([\s\S]*?)<\/script>/g)].map(match => match[1]);
+
+// 沒有實作的屬性與方法一律返回可再呼叫的替身
+function stub() {
+    const target = function() { return proxy; };
+    const proxy = new Proxy(target, {
+        get: (t, key) => key === 'then' ? undefined : (key in t ? t[key] : proxy),
+        apply: () => proxy
+    });
+    return proxy;
+}
+
+function element(id, value) {
+    return {id: id, value: value || '', textContent: '', listeners: {},
+            addEventListener(event, listener) { this.listeners[event] = listener; }};
+}
+
+const ready = [];
+const elements = {};
+const radios = [...html.matchAll(/name="language_mode" value="([^"]+)"/g)].map(match => element('', match[1]));
+global.window = global;
+global.document = {
+    addEventListener: (event, listener) => { if (event === 'DOMContentLoaded') ready.push(listener); },
+    querySelectorAll: selector => selector.includes('language_mode') ? radios : [],
+    querySelector: () => null,
+    getElementById: id => elements[id] || (elements[id] = element(id)),
+    createElement: stub,
+    head: stub(),
+    body: stub(),
+    documentElement: stub()
+};
+
+// 外部資源（地理數據、語言數據等）從頁面所在目錄讀取
+function readAsset(url) {
+    return JSON.parse(fs.readFileSync(path.join(path.dirname(pagePath), url.split('?')[0]), 'utf8'));
+}
+global.fetch = url => Promise.resolve({ok: true, json: () => readAsset(url)});
+global.$ = global.jQuery = new Proxy({
+    ajax: url => ({done: callback => { callback(readAsset(url)); return stub(); }})
+}, {get: (t, key) => key in t ? t[key] : stub()});
+
+const groups = [];
+function makeLayer(feature) {
+    const classes = new Set();
+    const element = {classList: {add: name => classes.add(name), remove: name => classes.delete(name)}};
+    return {feature: feature, style: null, popup: null, options: {},
+            setStyle(style) { this.style = style; Object.assign(this.options, style); },
+            getElement() { return element; },
+            bindPopup(content) { this.popup = content; return this; },
+            on() { return this; }, addTo() { return this; }, getBounds: stub};
+}
+function geoJson(data, options) {
+    options = options || {};
+    const layers = [];
+    const group = {
+        options: options, _layers: layers,
+        addData(geojson) {
+            (geojson.features || [geojson]).forEach(feature => {
+                if (options.filter && !options.filter(feature)) return;
+                const layer = makeLayer(feature);
+                if (options.style) layer.setStyle(typeof options.style === 'function' ? options.style(feature) : options.style);
+                if (options.onEachFeature) options.onEachFeature(feature, layer);
+                layers.push(layer);
+            });
+            return group;
+        },
+        eachLayer(callback) { layers.slice().forEach(callback); },
+        removeLayer(layer) { const index = layers.indexOf(layer); if (index >= 0) layers.splice(index, 1); return group; },
+        setStyle(style) { layers.forEach(layer => layer.setStyle(typeof style === 'function' ? style(layer.feature) : style)); },
+        resetStyle(layer) { layer.setStyle(options.style(layer.feature)); },
+        addTo() { return group; }, on() { return group; }, getBounds: stub
+    };
+    if (data) group.addData(data);
+    groups.push(group);
+    return group;
+}
+global.L = new Proxy({geoJson: geoJson}, {get: (t, key) => key in t ? t[key] : stub()});
+
+const scriptStart = performance.now();
+for (const script of scripts) (0, eval)(script);
+const readyStart = performance.now();
+ready.forEach(listener => listener());
+const readyEnd = performance.now();
+
+// 等待以 fetch 載入的數據完成後再量測互動；首次繪製在初始化結束後，
+// loaded 為外部數據與地理數據區塊都套用完成
+setTimeout(() => {
+    const layers = groups.length ? groups[0]._layers : [];
+    const result = {script_ms: readyStart - scriptStart, ready_ms: readyEnd - readyStart, layers: layers.length,
+                    first_paint_ms: readyEnd - scriptStart, loaded_ms: performance.now() - scriptStart};
+    radios.concat(radios.slice(0, 1)).forEach(radio => {
+        const start = performance.now();
+        if (radio.listeners.change) radio.listeners.change.call(radio);
+        result['toggle_' + radio.value + '_ms'] = performance.now() - start;
+    });
+    const popupStart = performance.now();
+    layers.forEach(layer => { if (typeof layer.popup === 'function') layer.popup(); });
+    result.popup_ms = performance.now() - popupStart;
+    console.log(JSON.stringify(result));
+}, 0);
+'''
+
+def summarize(times):
+    """與 pytest-benchmark 相同的統計：最小、最大、平均、中位數、標準差（秒）與次數"""
+    return {
+        'min': min(times),
+        'max': max(times),
+        'mean': statistics.mean(times),
+        'median': statistics.median(times),
+        'stddev': statistics.stdev(times) if len(times) > 1 else 0.0,
+        'rounds': len(times)
+    }
+
+def measure(function, rounds):
+    """重複執行並記錄每次的耗時，返回 (最後一次的結果, 統計)"""
+    times = []
+    result = None
+    for _ in range(rounds):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return result, summarize(times)
+
+def run_page_script(page_path, rounds, node='node'):
+    """以 Node.js 多次執行頁面腳本，返回 {量測項目: 統計（秒）}，沒有 Node.js 時返回None"""
+    node = shutil.which(node)
+    if not node:
+        print("找不到 Node.js，略過頁面腳本的量測")
+        return None
+    with tempfile.NamedTemporaryFile('w', suffix='.js', delete=False, encoding='utf-8') as file:
+        file.write(NODE_HARNESS)
+        harness_path = file.name
+    samples = {}
+    try:
+        for _ in range(rounds):
+            completed = subprocess.run([node, harness_path, page_path], capture_output=True, text=True,
+                                       timeout=NODE_TIMEOUT)
+            lines = completed.stdout.strip().splitlines()
+            if completed.returncode != 0 or not lines:
+                print(f"頁面腳本執行失敗：{completed.stderr.strip()[-500:]}")
+                return None
+            for key, value in json.loads(lines[-1]).items():
+                if key.endswith('_ms'):
+                    samples.setdefault(key[:-3], []).append(value / 1000)
+    finally:
+        os.remove(harness_path)
+    return {key: summarize(values) for key, values in samples.items()}
+
+def _loaded_dataset(data_dir, counties_path):
+    """新建數據存取物件並實際載入數據（不使用 get_dataset 的快取）"""
+    dataset = language_map.LanguageDataset(data_dir, counties_path)
+    dataset.language_data
+    return dataset
+
+def run_benchmark(args, rounds=DEFAULT_ROUNDS, javascript=True):
+    """量測各階段耗時、輸出大小與頁面腳本，返回結果（缺少地理數據時返回None）"""
+    # folium 在第一次建立地圖時才載入；先單獨量測載入時間，以免計入 map_build 的第一次量測
+    timings = {}
+    folium, timings['folium_import'] = measure(lambda: importlib.import_module('folium'), 1)
+    dataset, timings['data_load'] = measure(lambda: _loaded_dataset(args.data_dir, args.counties), rounds)
+    _, timings['analytics'] = measure(lambda: language_map.compute_analytics(dataset.language_data), rounds)
+    taiwan_geojson, timings['geometry_load'] = measure(
+        lambda: language_map.download_taiwan_geojson(url=args.geojson_url, cache_dir=args.cache_dir,
+                                                     ttl=args.cache_ttl, offline=args.offline,
+                                                     timeout=args.timeout), rounds)
+    if not taiwan_geojson:
+        print("無法執行效能基準：缺少地理數據")
+        return None
+    prepared, timings['geometry_prepare'] = measure(
+        lambda: language_map.prepare_map_geometry(taiwan_geojson, args.simplify_tolerance, args.precision,
+                                                  args.simplify_method, dataset), rounds)
+    m, timings['map_build'] = measure(
+        lambda: language_map.create_language_map(prepared, dataset=dataset, prepared=True), rounds)
+    html, timings['serialize'] = measure(lambda: m.get_root().render(), rounds)
+
+    body = html.encode('utf-8')
+    result = {
+        'generated': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'folium': folium.__version__,
+        'rounds': rounds,
+        'timings': timings,
+        'sizes': {'html_bytes': len(body), 'gzip_bytes': len(gzip.compress(body, 9, mtime=0))},
+        'javascript': None,
+        'javascript_environment': JAVASCRIPT_ENVIRONMENT
+    }
+    if javascript:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            page_path = os.path.join(tmp_dir, 'benchmark.html')
+            with open(page_path, 'wb') as file:
+                file.write(body)
+            result['javascript'] = run_page_script(page_path, rounds)
+    return result
+
+def compare_with_baseline(result, baseline, time_tolerance=TIME_TOLERANCE, size_tolerance=SIZE_TOLERANCE):
+    """與基準比較，返回退步項目的說明列表"""
+    regressions = []
+    for group in ('timings', 'javascript'):
+        for name, stats in (result.get(group) or {}).items():
+            base = (baseline.get(group) or {}).get(name)
+            if not base:
+                continue
+            current, previous = stats['median'], base['median']
+            if current > previous * (1 + time_tolerance) and current - previous > TIME_FLOOR:
+                regressions.append(f"{name}：中位數 {current * 1000:.1f} ms，基準 {previous * 1000:.1f} ms")
+    for name, size in result['sizes'].items():
+        previous = baseline.get('sizes', {}).get(name)
+        if previous and size > previous * (1 + size_tolerance):
+            regressions.append(f"{name}：{size:,} bytes，基準 {previous:,} bytes")
+    return regressions
+
+def print_report(result, baseline=None):
+    """以表格列出各項量測結果與基準的中位數"""
+    print(f"{'項目':<24}{'中位數':>12}{'標準差':>12}{'基準':>12}")
+    for group in ('timings', 'javascript'):
+        if group == 'javascript' and result.get(group):
+            print(f"頁面腳本（{result.get('javascript_environment', JAVASCRIPT_ENVIRONMENT)}）：")
+        for name, stats in (result.get(group) or {}).items():
+            base = ((baseline or {}).get(group) or {}).get(name)
+            base_text = f"{base['median'] * 1000:.1f} ms" if base else '-'
+            print(f"{name:<24}{stats['median'] * 1000:>9.1f} ms{stats['stddev'] * 1000:>9.1f} ms{base_text:>12}")
+    for name, size in result['sizes'].items():
+        previous = (baseline or {}).get('sizes', {}).get(name)
+        base_text = format(previous, ',') if previous else '-'
+        print(f"{name:<24}{size:>12,}{'':>12}{base_text:>12}")
+
+def run(args):
+    """benchmark 子命令：執行效能基準並與基準檔比較，有退步時返回False"""
+    result = run_benchmark(args, args.rounds, javascript=not args.no_js)
+    if not result:
+        return False
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+    print_report(result, baseline)
+
+    if args.update_baseline or baseline is None:
+        with open(args.baseline, 'w', encoding='utf-8') as file:
+            json.dump(result, file, ensure_ascii=False, indent=2)
+        print(f"已將結果保存為基準：{args.baseline}")
+        return True
+    regressions = compare_with_baseline(result, baseline, args.time_tolerance, args.size_tolerance)
+    if regressions:
+        print("效能退步：")
+        for regression in regressions:
+            print(f"  {regression}")
+        return False
+    print("沒有超出容許範圍的退步")
+    return True
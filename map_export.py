@@ -0,0 +1,309 @@
+"""將對應好縣市代碼的語言數據匯出為 CSV、Parquet 或 GeoPackage
+
+記錄直接由編譯資料庫分批讀出（map_store.iter_regions），每批整理成一列列
+的字典後立即寫出，不會在記憶體中累積整份數據。每列包含縣市代碼、名稱、
+層級、人口、調查年份、備註與各語言比例，可選擇附上簡化後的邊界：
+CSV 以 WKT 文字、Parquet 以 WKB（GeoParquet 欄位說明）、GeoPackage 以
+標準的 GeoPackage 幾何格式保存。Parquet 需要安裝 pyarrow。
+
+只有屬性記錄是分批讀寫的：附上邊界時，簡化後的邊界在匯出前一次載入記憶體
+（見 load_export_geometry），記憶體用量隨邊界數據的大小增加。
+"""
+import csv
+import json
+import os
+import sqlite3
+import struct
+
+import map_geometry
+import map_store
+import taiwan_language_map_new as language_map
+
+CHUNK_SIZE = 1000
+EXPORT_FORMATS = {'csv': '.csv', 'parquet': '.parquet', 'gpkg': '.gpkg'}
+EXPORT_LEVELS = ('county', 'township', 'series')
+GEOMETRY_COLUMN = 'geometry'
+SRS_ID = 4326  # WGS 84 經緯度
+GPKG_APPLICATION_ID = 0x47504B47  # 'GPKG'
+GPKG_USER_VERSION = 10200  # GeoPackage 1.2
+
+# 固定欄位與型別（其後依序為各語言比例與邊界）
+COLUMNS = (
+    ('region_id', 'TEXT'),
+    ('county_id', 'TEXT'),
+    ('county_name', 'TEXT'),
+    ('level', 'TEXT'),
+    ('name', 'TEXT'),
+    ('region', 'TEXT'),
+    ('population', 'INTEGER'),
+    ('year', 'INTEGER'),
+    ('note', 'TEXT')
+)
+
+WGS84_DEFINITION = (
+    'GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],'
+    'AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],'
+    'UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]]'
+)
+
+# ---- 幾何格式 ----
+
+def _polygons(geometry):
+    """將 Polygon / MultiPolygon 統一為多邊形列表"""
+    if not geometry:
+        return []
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+def geometry_wkt(geometry):
+    """以 MULTIPOLYGON 的 WKT 文字表示邊界，沒有邊界時返回None"""
+    polygons = _polygons(geometry)
+    if not polygons:
+        return None
+    return 'MULTIPOLYGON (' + ', '.join(
+        '(' + ', '.join('(' + ', '.join(f'{x!r} {y!r}' for x, y, *_ in ring) + ')' for ring in polygon) + ')'
+        for polygon in polygons) + ')'
+
+def geometry_wkb(geometry):
+    """以 MULTIPOLYGON 的 WKB（little-endian）表示邊界，沒有邊界時返回None"""
+    polygons = _polygons(geometry)
+    if not polygons:
+        return None
+    parts = [struct.pack('<BII', 1, 6, len(polygons))]
+    for polygon in polygons:
+        parts.append(struct.pack('<BII', 1, 3, len(polygon)))
+        for ring in polygon:
+            parts.append(struct.pack('<I', len(ring)))
+            parts.append(struct.pack(f'<{len(ring) * 2}d', *(value for point in ring for value in point[:2])))
+    return b''.join(parts)
+
+def geometry_bounds(geometry):
+    """邊界的範圍 (min_x, min_y, max_x, max_y)，沒有邊界時返回None"""
+    points = [point for polygon in _polygons(geometry) for ring in polygon for point in ring]
+    if not points:
+        return None
+    xs = [point[0] for point in points]
+    ys = [point[1] for point in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+def gpkg_geometry(geometry):
+    """GeoPackage 幾何格式：標頭（含範圍）加上 WKB"""
+    wkb = geometry_wkb(geometry)
+    if wkb is None:
+        return None
+    min_x, min_y, max_x, max_y = geometry_bounds(geometry)
+    # 旗標：little-endian（bit 0），範圍為 [minx, maxx, miny, maxy]（bits 1-3 為 1）
+    header = b'GP' + struct.pack('<BBi4d', 0, 0b00000011, SRS_ID, min_x, max_x, min_y, max_y)
+    return header + wkb
+
+# ---- 記錄 ----
+
+def load_export_geometry(dataset, levels, geojson_url=language_map.GEOJSON_URL,
+                         township_geojson_url=language_map.TOWNSHIP_GEOJSON_URL,
+                         cache_dir=language_map.GEOJSON_CACHE_DIR, cache_ttl=language_map.GEOJSON_CACHE_TTL,
+                         offline=False, timeout=language_map.GEOJSON_TIMEOUT, simplify_tolerance=None,
+                         precision=map_geometry.DEFAULT_PRECISION, simplify_method='dp'):
+    """取得匯出用的簡化邊界，返回 {(county_id, 鄉鎮市區比對鍵或None): geometry}
+
+    邊界不是分批處理的：來源 GeoJSON 整份讀入後以共用弧段的拓撲一起簡化（分縣市簡化
+    會讓相鄰縣市的邊界不再一致），結果全部保存在返回的字典中。匯出的記憶體用量因此
+    取決於邊界數據的大小，而不是分批的大小；村里等更細的邊界需要改為分區讀取來源。
+    """
+    geometry = {}
+    if {'county', 'series'} & set(levels):
+        taiwan_geojson = language_map.download_taiwan_geojson(url=geojson_url, cache_dir=cache_dir, ttl=cache_ttl,
+                                                              offline=offline, timeout=timeout)
+        if taiwan_geojson:
+            taiwan_geojson = language_map.prepare_map_geometry(taiwan_geojson, simplify_tolerance, precision,
+                                                               simplify_method, dataset)
+            for feature in taiwan_geojson['features']:
+                county_id = feature['properties'].get('county_id')
+                if county_id:
+                    geometry[(county_id, None)] = feature['geometry']
+        else:
+            print("沒有縣市邊界，匯出的縣市記錄不含邊界")
+    if 'township' in levels:
+        township_geojson = language_map.download_taiwan_geojson(url=township_geojson_url, cache_dir=cache_dir,
+                                                                offline=offline, timeout=timeout)
+        if township_geojson:
+            tolerance = simplify_tolerance
+            if tolerance is None:
+                tolerance = map_geometry.zoom_tolerance(language_map.TOWNSHIP_TARGET_ZOOM)
+            township_geojson = map_geometry.simplify_geojson(township_geojson, tolerance=tolerance,
+                                                             precision=precision, method=simplify_method)
+            grouped = language_map.group_township_geometry(township_geojson, dataset.county_ids)
+            for county_id, townships in grouped.items():
+                for key, feature in townships.items():
+                    geometry[(county_id, key)] = feature['geometry']
+        else:
+            print("沒有鄉鎮市區邊界，匯出的鄉鎮市區記錄不含邊界")
+    return geometry
+
+def iter_export_rows(dataset, levels=EXPORT_LEVELS[:2], geometry=None, chunk_size=CHUNK_SIZE):
+    """分批產生要匯出的列（字典列表），geometry 為 load_export_geometry 的結果"""
+    languages = map_store.read_languages(dataset.store_path)
+    county_names = dataset.county_names
+    for records in map_store.iter_regions(dataset.store_path, levels, chunk_size):
+        rows = []
+        for record in records:
+            row = {name: record.get(name) for name, _ in COLUMNS}
+            row['county_name'] = county_names.get(record['county_id'], record['county_id'])
+            row.update((language, record['data'].get(language)) for language in languages)
+            if geometry is not None:
+                key = language_map.township_key(record['name']) if record['level'] == 'township' else None
+                row[GEOMETRY_COLUMN] = geometry.get((record['county_id'], key))
+            rows.append(row)
+        yield rows
+
+# ---- 輸出格式 ----
+
+def write_csv(path, languages, chunks, with_geometry):
+    """逐批寫入 CSV（UTF-8 含 BOM，方便以 Excel 開啟），邊界以 WKT 表示"""
+    header = [name for name, _ in COLUMNS] + languages + ([GEOMETRY_COLUMN] if with_geometry else [])
+    count = 0
+    with open(path, 'w', encoding='utf-8-sig', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(header)
+        for rows in chunks:
+            for row in rows:
+                if with_geometry:
+                    row = dict(row, **{GEOMETRY_COLUMN: geometry_wkt(row[GEOMETRY_COLUMN])})
+                writer.writerow([row[name] for name in header])
+            count += len(rows)
+    return count
+
+def write_parquet(path, languages, chunks, with_geometry):
+    """逐批寫入 Parquet 的 row group，邊界以 WKB 表示並附上 GeoParquet 欄位說明"""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        print("需要安裝 pyarrow 才能匯出 Parquet：pip install pyarrow")
+        return None
+
+    types = {'TEXT': pa.string(), 'INTEGER': pa.int64()}
+    fields = [pa.field(name, types[column_type]) for name, column_type in COLUMNS]
+    fields += [pa.field(language, pa.float64()) for language in languages]
+    metadata = None
+    if with_geometry:
+        fields.append(pa.field(GEOMETRY_COLUMN, pa.binary()))
+        metadata = {'geo': json.dumps({
+            'version': '1.0.0',
+            'primary_column': GEOMETRY_COLUMN,
+            'columns': {GEOMETRY_COLUMN: {'encoding': 'WKB', 'geometry_types': ['MultiPolygon']}}
+        })}
+    schema = pa.schema(fields, metadata=metadata)
+
+    count = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for rows in chunks:
+            if with_geometry:
+                rows = [dict(row, **{GEOMETRY_COLUMN: geometry_wkb(row[GEOMETRY_COLUMN])}) for row in rows]
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            count += len(rows)
+    return count
+
+def write_geopackage(path, languages, chunks, with_geometry, table='language_data'):
+    """逐批寫入 GeoPackage（SQLite），有邊界時為圖徵表，否則為屬性表"""
+    if os.path.exists(path):
+        os.remove(path)
+    connection = sqlite3.connect(path)
+    try:
+        connection.execute(f'PRAGMA application_id = {GPKG_APPLICATION_ID}')
+        connection.execute(f'PRAGMA user_version = {GPKG_USER_VERSION}')
+        connection.executescript('''
+CREATE TABLE gpkg_spatial_ref_sys (
+    srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY, organization TEXT NOT NULL,
+    organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL, description TEXT);
+CREATE TABLE gpkg_contents (
+    table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL, identifier TEXT UNIQUE,
+    description TEXT DEFAULT '', last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ', 'now')),
+    min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER,
+    CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys(srs_id));
+CREATE TABLE gpkg_geometry_columns (
+    table_name TEXT NOT NULL, column_name TEXT NOT NULL, geometry_type_name TEXT NOT NULL,
+    srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,
+    CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name),
+    CONSTRAINT fk_gc_tn FOREIGN KEY (table_name) REFERENCES gpkg_contents(table_name),
+    CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys(srs_id));
+''')
+        connection.executemany('INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)', [
+            ('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', None),
+            ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', None),
+            ('WGS 84 geodetic', SRS_ID, 'EPSG', SRS_ID, WGS84_DEFINITION, None)
+        ])
+        columns = list(COLUMNS) + [(language, 'REAL') for language in languages]
+        geometry_columns = [(GEOMETRY_COLUMN, 'MULTIPOLYGON')] if with_geometry else []
+        definitions = ['fid INTEGER PRIMARY KEY AUTOINCREMENT'] + \
+            [f'"{name}" {column_type}' for name, column_type in geometry_columns + columns]
+        connection.execute(f'CREATE TABLE "{table}" ({", ".join(definitions)})')
+        connection.execute('INSERT INTO gpkg_contents (table_name, data_type, identifier, srs_id) VALUES (?, ?, ?, ?)',
+                           (table, 'features' if with_geometry else 'attributes', table,
+                            SRS_ID if with_geometry else None))
+        if with_geometry:
+            connection.execute('INSERT INTO gpkg_geometry_columns VALUES (?, ?, ?, ?, 0, 0)',
+                               (table, GEOMETRY_COLUMN, 'MULTIPOLYGON', SRS_ID))
+
+        names = [name for name, _ in geometry_columns + columns]
+        quoted = ', '.join('"%s"' % name for name in names)
+        insert = f'INSERT INTO "{table}" ({quoted}) VALUES ({", ".join("?" * len(names))})'
+        count = 0
+        extent = None
+        for rows in chunks:
+            values = []
+            for row in rows:
+                if with_geometry:
+                    bounds = geometry_bounds(row[GEOMETRY_COLUMN])
+                    if bounds:
+                        extent = bounds if extent is None else (min(extent[0], bounds[0]), min(extent[1], bounds[1]),
+                                                                max(extent[2], bounds[2]), max(extent[3], bounds[3]))
+                    row = dict(row, **{GEOMETRY_COLUMN: gpkg_geometry(row[GEOMETRY_COLUMN])})
+                values.append([row[name] for name in names])
+            with connection:
+                connection.executemany(insert, values)
+            count += len(rows)
+        if extent:
+            with connection:
+                connection.execute('UPDATE gpkg_contents SET min_x = ?, min_y = ?, max_x = ?, max_y = ? '
+                                   'WHERE table_name = ?', extent + (table,))
+        connection.commit()
+    finally:
+        connection.close()
+    return count
+
+WRITERS = {'csv': write_csv, 'parquet': write_parquet, 'gpkg': write_geopackage}
+
+def export_language_data(output, fmt='csv', dataset=None, levels=EXPORT_LEVELS[:2], geometry=None,
+                         chunk_size=CHUNK_SIZE):
+    """匯出語言數據，返回寫出的列數（失敗時返回None）
+
+    geometry 為 load_export_geometry 的結果，None 表示不附邊界。
+    """
+    dataset = dataset or language_map.get_dataset()
+    dataset.compile()
+    languages = map_store.read_languages(dataset.store_path)
+    chunks = iter_export_rows(dataset, levels, geometry, chunk_size)
+    count = WRITERS[fmt](output, languages, chunks, geometry is not None)
+    if count is not None:
+        print(f"已匯出 {count} 筆語言數據到 '{output}'（{os.path.getsize(output):,} bytes）")
+    return count
+
+def run(args):
+    """export 子命令：依命令列參數匯出語言數據"""
+    fmt = args.format
+    if not fmt:
+        extension = os.path.splitext(args.output or '')[1].lower()
+        fmt = next((name for name, ext in EXPORT_FORMATS.items() if ext == extension), 'csv')
+    output = args.output or 'language_data' + EXPORT_FORMATS[fmt]
+    dataset = language_map.get_dataset(args.data_dir, args.counties)
+    geometry = None
+    if args.geometry:
+        geometry = load_export_geometry(dataset, args.levels, geojson_url=args.geojson_url,
+                                        township_geojson_url=args.township_geojson_url, cache_dir=args.cache_dir,
+                                        cache_ttl=args.cache_ttl, offline=args.offline, timeout=args.timeout,
+                                        simplify_tolerance=args.simplify_tolerance, precision=args.precision,
+                                        simplify_method=args.simplify_method)
+    return export_language_data(output, fmt, dataset, args.levels, geometry, args.chunk_size)
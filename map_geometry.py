@@ -0,0 +1,323 @@
+"""縣市邊界幾何的簡化、座標量化與 TopoJSON 輸出
+
+處理流程：
+1. 將座標量化到固定精度的整數格點
+2. 找出相鄰縣市共用的邊界，把每個環切成弧段並去除重複（共用弧段）
+3. 逐條弧段簡化（Douglas-Peucker 或 Visvalingam），相鄰縣市因此不會出現縫隙
+4. 組回 GeoJSON，或直接輸出 TopoJSON
+"""
+import heapq
+import json
+import math
+
+DEFAULT_PRECISION = 4  # 小數位數，約11公尺
+DEFAULT_TARGET_ZOOM = 11  # 預設簡化程度：在此縮放等級下誤差不超過 1 像素
+DEFAULT_ZOOM_LEVELS = (6, 8, 10, 12)
+
+def zoom_tolerance(zoom, pixels=1.0):
+    """換算指定縮放等級下，若干像素對應的經緯度距離"""
+    return 360.0 / (256 * 2 ** zoom) * pixels
+
+def geojson_size(obj):
+    """計算以緊湊格式序列化後的位元組數"""
+    return len(json.dumps(obj, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+
+def report_size(label, before, after):
+    """輸出簡化前後的大小，方便追蹤數據量的變化"""
+    ratio = after / before * 100 if before else 0
+    print(f"{label}：{before:,} → {after:,} bytes（{ratio:.1f}%）")
+
+def _feature_name(feature):
+    """地理區域的名稱（縣市或鄉鎮市區），用於提示訊息"""
+    properties = feature.get('properties') or {}
+    return properties.get('COUNTYNAME') or properties.get('TOWNNAME') or properties.get('name') or '（未命名）'
+
+def _iter_polygons(geometry):
+    """將 Polygon / MultiPolygon 統一為多邊形列表"""
+    if not geometry:
+        return []
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+def build_topology(geojson, precision=DEFAULT_PRECISION):
+    """量化座標並建立共用弧段的拓撲結構
+
+    只有 Polygon / MultiPolygon 會轉為弧段；其他幾何類型（點、線等）原樣保留在
+    passthrough 中，不經過量化與簡化，並列出這些地理區域的名稱。
+    """
+    scale = 10 ** precision
+    points = [pt for feature in geojson['features']
+              for polygon in _iter_polygons(feature.get('geometry'))
+              for ring in polygon for pt in ring]
+    x0 = min((pt[0] for pt in points), default=0)
+    y0 = min((pt[1] for pt in points), default=0)
+
+    # 量化每個環，並移除量化後重複的連續點（環以不閉合的形式保存）
+    features = []
+    unsupported = []
+    for feature in geojson['features']:
+        geometry = feature.get('geometry')
+        if geometry and geometry['type'] not in ('Polygon', 'MultiPolygon'):
+            unsupported.append(f"{_feature_name(feature)}（{geometry['type']}）")
+        polygons = []
+        for polygon in _iter_polygons(geometry):
+            rings = []
+            for ring in polygon:
+                quantized = []
+                for x, y in (pt[:2] for pt in ring):
+                    q = (round((x - x0) * scale), round((y - y0) * scale))
+                    if not quantized or quantized[-1] != q:
+                        quantized.append(q)
+                if len(quantized) > 1 and quantized[0] == quantized[-1]:
+                    quantized.pop()
+                if len(quantized) >= 3:
+                    rings.append(quantized)
+            if rings:
+                polygons.append(rings)
+        features.append({
+            'properties': feature.get('properties', {}),
+            'type': geometry['type'] if geometry else None,
+            'polygons': polygons,
+            'passthrough': geometry if geometry and geometry['type'] not in ('Polygon', 'MultiPolygon') else None
+        })
+    if unsupported:
+        print(f"不是多邊形的地理區域，保留原樣不簡化（TopoJSON 不含這些區域）：{'、'.join(unsupported)}")
+
+    # 找出交會點：同一個點在不同的環中有不同的相鄰點
+    neighbours = {}
+    junctions = set()
+    for feature in features:
+        for rings in feature['polygons']:
+            for ring in rings:
+                n = len(ring)
+                for i, point in enumerate(ring):
+                    pair = tuple(sorted((ring[i - 1], ring[(i + 1) % n])))
+                    seen = neighbours.setdefault(point, pair)
+                    if seen != pair:
+                        junctions.add(point)
+
+    arcs = []
+    arc_index = {}
+
+    def add_arc(arc):
+        key = tuple(arc)
+        if key in arc_index:
+            return arc_index[key]
+        reverse_key = key[::-1]
+        if reverse_key in arc_index:
+            return ~arc_index[reverse_key]
+        arc_index[key] = len(arcs)
+        arcs.append(arc)
+        return len(arcs) - 1
+
+    # 以交會點切割每個環，沒有交會點的環整條成為一個閉合弧段
+    for feature in features:
+        feature['arcs'] = []
+        for rings in feature['polygons']:
+            polygon_arcs = []
+            for ring in rings:
+                cuts = [i for i, point in enumerate(ring) if point in junctions]
+                if not cuts:
+                    start = ring.index(min(ring))
+                    rotated = ring[start:] + ring[:start]
+                    closed = rotated + [rotated[0]]
+                    # 同一個閉合環可能以相反方向出現（例如飛地），以字典序較小者為準
+                    if closed[::-1] < closed:
+                        polygon_arcs.append([~add_arc(closed[::-1])])
+                    else:
+                        polygon_arcs.append([add_arc(closed)])
+                    continue
+                rotated = ring[cuts[0]:] + ring[:cuts[0]]
+                offsets = [i - cuts[0] for i in cuts] + [len(ring)]
+                rotated.append(rotated[0])
+                ring_arcs = []
+                for start, end in zip(offsets, offsets[1:]):
+                    ring_arcs.append(add_arc(rotated[start:end + 1]))
+                polygon_arcs.append(ring_arcs)
+            feature['arcs'].append(polygon_arcs)
+        del feature['polygons']
+
+    return {
+        'arcs': arcs,
+        'features': features,
+        'precision': precision,
+        'translate': (x0, y0)
+    }
+
+def douglas_peucker(points, tolerance):
+    """Douglas-Peucker 簡化（保留首尾點，非遞迴實作）"""
+    if len(points) <= 2:
+        return list(points)
+    tolerance_sq = tolerance * tolerance
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_dist, index = -1.0, None
+        # 各點到首尾連線段距離的平方（直接展開計算，避免大量弧段時的函數呼叫開銷）
+        ax, ay = points[first]
+        dx, dy = points[last][0] - ax, points[last][1] - ay
+        length_sq = dx * dx + dy * dy
+        for i in range(first + 1, last):
+            px, py = points[i][0] - ax, points[i][1] - ay
+            if length_sq:
+                t = (px * dx + py * dy) / length_sq
+                t = 0.0 if t < 0.0 else 1.0 if t > 1.0 else t
+                px -= t * dx
+                py -= t * dy
+            dist = px * px + py * py
+            if dist > max_dist:
+                max_dist, index = dist, i
+        if index is not None and max_dist > tolerance_sq:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [pt for pt, kept in zip(points, keep) if kept]
+
+def _triangle_area(a, b, c):
+    return abs((b[0] - a[0]) * (c[1] - a[1]) - (c[0] - a[0]) * (b[1] - a[1])) / 2.0
+
+def visvalingam(points, tolerance):
+    """Visvalingam-Whyatt 簡化：移除有效面積小於 tolerance² 的點（保留首尾點）"""
+    n = len(points)
+    if n <= 2:
+        return list(points)
+    min_area = tolerance * tolerance
+    prev = list(range(-1, n - 1))
+    nxt = list(range(1, n + 1))
+    removed = [False] * n
+    areas = [math.inf] * n
+    heap = []
+    for i in range(1, n - 1):
+        areas[i] = _triangle_area(points[i - 1], points[i], points[i + 1])
+        heap.append((areas[i], i))
+    heapq.heapify(heap)
+    max_area = 0.0
+    while heap:
+        area, i = heapq.heappop(heap)
+        if removed[i] or area != areas[i]:
+            continue
+        # 被移除點的面積不應小於先前移除者，以維持簡化順序的單調性
+        max_area = max(max_area, area)
+        if max_area >= min_area:
+            break
+        removed[i] = True
+        p, q = prev[i], nxt[i]
+        nxt[p], prev[q] = q, p
+        for j in (p, q):
+            if 0 < j < n - 1:
+                areas[j] = _triangle_area(points[prev[j]], points[j], points[nxt[j]])
+                heapq.heappush(heap, (areas[j], j))
+    return [pt for pt, gone in zip(points, removed) if not gone]
+
+SIMPLIFY_METHODS = {
+    'dp': douglas_peucker,
+    'visvalingam': visvalingam
+}
+
+def _simplify_arc(arc, tolerance, simplify):
+    """簡化單一弧段；閉合弧段先在離起點最遠處分成兩段，避免首尾重合導致退化"""
+    if arc[0] == arc[-1] and len(arc) > 3:
+        far = max(range(len(arc)), key=lambda i: (arc[i][0] - arc[0][0]) ** 2 + (arc[i][1] - arc[0][1]) ** 2)
+        return simplify(arc[:far + 1], tolerance) + simplify(arc[far:], tolerance)[1:]
+    return simplify(arc, tolerance)
+
+def simplify_topology(topology, tolerance, method='dp'):
+    """以經緯度容差簡化所有弧段，返回新的拓撲結構（原結構不變）"""
+    simplify = SIMPLIFY_METHODS[method]
+    grid_tolerance = tolerance * 10 ** topology['precision']
+    arcs = [_simplify_arc(arc, grid_tolerance, simplify) for arc in topology['arcs']]
+    return dict(topology, arcs=arcs, original_arcs=topology.get('original_arcs', topology['arcs']))
+
+def _arc_points(arcs, index):
+    return arcs[index] if index >= 0 else arcs[~index][::-1]
+
+def _assemble_ring(arcs, ring_arcs):
+    ring = []
+    for index in ring_arcs:
+        points = _arc_points(arcs, index)
+        ring.extend(points if not ring else points[1:])
+    return ring
+
+def topology_to_geojson(topology):
+    """將拓撲結構組回 GeoJSON，座標四捨五入到拓撲的精度"""
+    precision = topology['precision']
+    scale = 10 ** precision
+    x0, y0 = topology['translate']
+    original_arcs = topology.get('original_arcs', topology['arcs'])
+
+    def to_coords(ring):
+        return [[round(x0 + x / scale, precision), round(y0 + y / scale, precision)] for x, y in ring]
+
+    features = []
+    for feature in topology['features']:
+        polygons = []
+        for polygon_arcs in feature['arcs']:
+            rings = []
+            for ring_arcs in polygon_arcs:
+                ring = _assemble_ring(topology['arcs'], ring_arcs)
+                # 過度簡化而退化的小島改用未簡化的弧段，確保仍然可見
+                if len(ring) < 4:
+                    ring = _assemble_ring(original_arcs, ring_arcs)
+                rings.append(to_coords(ring))
+            polygons.append(rings)
+        if not polygons:
+            geometry = feature.get('passthrough')
+        elif feature['type'] == 'Polygon' and len(polygons) == 1:
+            geometry = {'type': 'Polygon', 'coordinates': polygons[0]}
+        else:
+            geometry = {'type': 'MultiPolygon', 'coordinates': polygons}
+        features.append({'type': 'Feature', 'properties': feature['properties'], 'geometry': geometry})
+    return {'type': 'FeatureCollection', 'features': features}
+
+def topology_to_topojson(topology, object_name='counties'):
+    """輸出 TopoJSON（量化後差分編碼的共用弧段）"""
+    arcs = []
+    for arc in topology['arcs']:
+        encoded = [list(arc[0])]
+        for (px, py), (x, y) in zip(arc, arc[1:]):
+            encoded.append([x - px, y - py])
+        arcs.append(encoded)
+
+    geometries = []
+    for feature in topology['features']:
+        if not feature['arcs']:
+            geometries.append({'type': None, 'properties': feature['properties']})
+        elif feature['type'] == 'Polygon' and len(feature['arcs']) == 1:
+            geometries.append({'type': 'Polygon', 'arcs': feature['arcs'][0], 'properties': feature['properties']})
+        else:
+            geometries.append({'type': 'MultiPolygon', 'arcs': feature['arcs'], 'properties': feature['properties']})
+
+    scale = 10 ** -topology['precision']
+    return {
+        'type': 'Topology',
+        'transform': {'scale': [scale, scale], 'translate': list(topology['translate'])},
+        'objects': {object_name: {'type': 'GeometryCollection', 'geometries': geometries}},
+        'arcs': arcs
+    }
+
+def simplify_geojson(geojson, tolerance=None, precision=DEFAULT_PRECISION, method='dp', topology=None):
+    """簡化並量化 GeoJSON，返回新的 GeoJSON；未指定容差時以預設縮放等級換算"""
+    if tolerance is None:
+        tolerance = zoom_tolerance(DEFAULT_TARGET_ZOOM)
+    if topology is None:
+        topology = build_topology(geojson, precision)
+    if tolerance > 0:
+        topology = simplify_topology(topology, tolerance, method)
+    simplified = topology_to_geojson(topology)
+    report_size('幾何數據簡化', geojson_size(geojson), geojson_size(simplified))
+    return simplified
+
+def build_zoom_levels(geojson, zooms=DEFAULT_ZOOM_LEVELS, precision=DEFAULT_PRECISION, method='dp', pixels=1.0):
+    """依縮放等級產生多個簡化版本，拓撲結構只建立一次"""
+    topology = build_topology(geojson, precision)
+    levels = {}
+    for zoom in zooms:
+        simplified = simplify_topology(topology, zoom_tolerance(zoom, pixels), method)
+        levels[zoom] = topology_to_geojson(simplified)
+        report_size(f"縮放等級 {zoom}", geojson_size(geojson), geojson_size(levels[zoom]))
+    return levels
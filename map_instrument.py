@@ -0,0 +1,134 @@
+"""地圖產生流程的計時、計數與剖析（預設關閉）
+
+各階段以 stage() 計時、以 count() 累計數量（例如輸出的區域數、無法對應的名稱、
+寫出的位元組數），metric() 記錄單一的量測值（例如頁面首次繪製的時間）。未啟用時兩者幾乎不花時間，可以留在流程中。啟用後可選擇
+同時以 cProfile 剖析函數耗時、以 tracemalloc 追蹤記憶體配置，
+最後由 write_report() 寫成 JSON 報告（cProfile 的原始結果另存為 .prof）。
+"""
+import contextlib
+import json
+import os
+import time
+
+PROFILE_TOP = 30  # 報告中列出的函數數量（依累計耗時）
+MEMORY_TOP = 15  # 報告中列出的記憶體配置位置數量
+
+_state = {'enabled': False}
+
+def enable(profile=False, trace_memory=False):
+    """開始記錄，之前的記錄會被清除"""
+    disable()
+    _state.update(enabled=True, started=time.perf_counter(), stages={}, stack=[], counters={}, metrics={},
+                  profiler=None, trace_memory=trace_memory)
+    if trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+    if profile:
+        import cProfile
+        _state['profiler'] = cProfile.Profile()
+        _state['profiler'].enable()
+
+def disable():
+    """停止記錄與剖析"""
+    if _state.get('profiler'):
+        _state['profiler'].disable()
+    if _state.get('trace_memory'):
+        import tracemalloc
+        tracemalloc.stop()
+    _state.update(enabled=False, profiler=None, trace_memory=False)
+
+def enabled():
+    return _state['enabled']
+
+@contextlib.contextmanager
+def stage(name):
+    """計時一個階段；巢狀的階段以 / 串接名稱（例如 build/map/geojson_layer）"""
+    if not _state['enabled']:
+        yield
+        return
+    _state['stack'].append(name)
+    path = '/'.join(_state['stack'])
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _state['stack'].pop()
+        record = _state['stages'].setdefault(path, {'calls': 0, 'seconds': 0.0})
+        record['calls'] += 1
+        record['seconds'] += elapsed
+
+def count(name, value=1):
+    """累計一個計數器"""
+    if _state['enabled']:
+        _state['counters'][name] = _state['counters'].get(name, 0) + value
+
+def metric(name, value):
+    """記錄一個量測值，同名的值會被覆蓋"""
+    if _state['enabled']:
+        _state['metrics'][name] = value
+
+def count_bytes(name, path):
+    """將檔案（或目錄中所有檔案）的大小累計到計數器"""
+    if not _state['enabled'] or not os.path.exists(path):
+        return
+    if os.path.isfile(path):
+        count(name, os.path.getsize(path))
+        return
+    for root, _, files in os.walk(path):
+        for filename in files:
+            count(name, os.path.getsize(os.path.join(root, filename)))
+
+def _profile_report(profiler, profile_path):
+    import pstats
+    profiler.dump_stats(profile_path)
+    stats = pstats.Stats(profiler)
+    functions = []
+    for (filename, line, function), (calls, _, total, cumulative, _) in stats.stats.items():
+        functions.append({'function': function, 'file': filename, 'line': line, 'calls': calls,
+                          'total_seconds': round(total, 6), 'cumulative_seconds': round(cumulative, 6)})
+    functions.sort(key=lambda item: item['cumulative_seconds'], reverse=True)
+    return {'path': profile_path, 'top': functions[:PROFILE_TOP]}
+
+def _memory_report():
+    import tracemalloc
+    current, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot()
+    top = [{'location': f'{stat.traceback[0].filename}:{stat.traceback[0].lineno}', 'bytes': stat.size,
+            'blocks': stat.count}
+           for stat in snapshot.statistics('lineno')[:MEMORY_TOP]]
+    return {'current_bytes': current, 'peak_bytes': peak, 'top': top}
+
+def report(profile_path=None):
+    """目前的記錄：總耗時、各階段、計數器、量測值，以及啟用時的剖析與記憶體結果"""
+    if not _state['enabled']:
+        return None
+    result = {
+        'total_seconds': round(time.perf_counter() - _state['started'], 6),
+        'stages': {path: {'calls': record['calls'], 'seconds': round(record['seconds'], 6)}
+                   for path, record in _state['stages'].items()},
+        'counters': dict(_state['counters']),
+        'metrics': dict(_state['metrics'])
+    }
+    if _state['trace_memory']:
+        result['memory'] = _memory_report()
+    if _state['profiler'] and profile_path:
+        _state['profiler'].disable()
+        result['profile'] = _profile_report(_state['profiler'], profile_path)
+        _state['profiler'].enable()
+    return result
+
+def report_path(output):
+    """報告的路徑（與地圖同目錄的 <名稱>.report.json）"""
+    return os.path.splitext(output)[0] + '.report.json'
+
+def write_report(output):
+    """將報告寫在地圖旁邊，啟用 cProfile 時原始結果另存為 <名稱>.prof，返回報告路徑"""
+    result = report(os.path.splitext(output)[0] + '.prof')
+    if result is None:
+        return None
+    path = report_path(output)
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(result, file, ensure_ascii=False, indent=2)
+    print(f"效能報告已保存為 '{path}'")
+    return path
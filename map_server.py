@@ -0,0 +1,237 @@
+"""語言分布地圖的常駐伺服器
+
+頁面外殼、地理數據、語言數據、鄉鎮市區數據與各調查年份的數據
+分別以獨立的網址提供，全部預先產生並壓縮（gzip，已安裝 brotli 時另提供 br）
+後保存在記憶體中。
+每個回應都帶有強 ETag；以內容雜湊值為版本的網址可長期快取（以 ?v= 指定版本時，
+版本必須與目前的內容相符），頁面外殼則以 ETag 重新驗證。數據檔案變更時在背景重新產生，
+完成後才替換，替換期間仍以舊的內容回應。
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import taiwan_language_map_new as language_map
+
+IMMUTABLE = 'public, max-age=31536000, immutable'  # 網址含版本，內容不會改變
+REVALIDATE = 'no-cache'  # 每次以 ETag 向伺服器確認
+VERSION_LENGTH = 16  # 網址中版本（內容雜湊值）的長度
+COMPRESS_MIN_SIZE = 1024  # 小於此大小的回應不壓縮
+DEFAULT_POLL_INTERVAL = 2.0  # 檢查數據檔案變更的間隔（秒）
+
+def _brotli():
+    try:
+        import brotli
+        return brotli
+    except ImportError:
+        return None
+
+def _json_bytes(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def make_resource(body, content_type, cache_control):
+    """預先壓縮一個回應，每種編碼各有自己的強 ETag"""
+    digest = hashlib.sha256(body).hexdigest()[:32]
+    variants = {'identity': (body, f'"{digest}"')}
+    if len(body) >= COMPRESS_MIN_SIZE:
+        variants['gzip'] = (gzip.compress(body, 9, mtime=0), f'"{digest}-gz"')
+        brotli = _brotli()
+        if brotli:
+            variants['br'] = (brotli.compress(body, quality=11), f'"{digest}-br"')
+    return {'type': content_type, 'cache': cache_control, 'variants': variants, 'digest': digest}
+
+def choose_encoding(accept_encoding, variants):
+    """依 Accept-Encoding 選擇回應的編碼，優先 br，其次 gzip"""
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ('br', 'gzip'):
+        if encoding in variants and accepted.get(encoding, accepted.get('*', 0)) > 0:
+            return encoding
+    return 'identity'
+
+def build_resources(args):
+    """載入數據並產生所有回應，返回 {路徑: 回應}"""
+    dataset = language_map.LanguageDataset(args.data_dir, args.counties)
+    taiwan_geojson = language_map.download_taiwan_geojson(url=args.geojson_url, cache_dir=args.cache_dir,
+                                                          ttl=args.cache_ttl, offline=args.offline,
+                                                          timeout=args.timeout)
+    if not taiwan_geojson:
+        print("無法啟動地圖服務：缺少地理數據")
+        return None
+    taiwan_geojson = language_map.prepare_map_geometry(taiwan_geojson, args.simplify_tolerance, args.precision,
+                                                       args.simplify_method, dataset)
+    server_dir = os.path.join(args.cache_dir, 'server')
+    os.makedirs(server_dir, exist_ok=True)
+    resources = {}
+
+    geometry_path = os.path.join(server_dir, 'geometry.geojson')
+    language_map.write_geometry_asset(taiwan_geojson, geometry_path)
+    with open(geometry_path, 'rb') as file:
+        geometry = make_resource(file.read(), 'application/geo+json', IMMUTABLE)
+    resources['/geometry.geojson'] = geometry
+
+    data = make_resource(_json_bytes(language_map.create_map_data(taiwan_geojson, dataset)),
+                         'application/json', IMMUTABLE)
+    resources['/data/languages.json'] = data
+    # 這兩個網址以 ?v= 指定版本，只有版本相符時才可長期快取
+    for resource in (geometry, data):
+        resource['version'] = resource['digest'][:VERSION_LENGTH]
+
+    township_url = None
+    if args.townships:
+        township_dir = os.path.join(server_dir, 'townships')
+        manifest = language_map.build_township_assets(township_dir, dataset, offline=args.offline,
+                                                      cache_dir=args.cache_dir, precision=args.precision,
+                                                      simplify_method=args.simplify_method,
+                                                      url=args.township_geojson_url)
+        version = hashlib.sha256(_json_bytes(manifest)).hexdigest()[:VERSION_LENGTH]
+        township_url = f'/townships/{version}/'
+        for county_id in manifest:
+            with open(os.path.join(township_dir, county_id + '.json'), 'rb') as file:
+                resources[f'{township_url}{county_id}.json'] = make_resource(file.read(), 'application/json',
+                                                                             IMMUTABLE)
+
+    time_series = None
+    if args.years:
+        dataset.compile()
+        years = language_map.create_year_data(dataset)
+        if len(years) > 1:
+            version = hashlib.sha256(_json_bytes(years)).hexdigest()[:VERSION_LENGTH]
+            time_series = dict(language_map.year_series_config(years, dataset.language_data),
+                               url=f'/years/{version}/')
+            for year, year_data in years.items():
+                resources[f"{time_series['url']}{year}.json"] = make_resource(_json_bytes(year_data),
+                                                                              'application/json', IMMUTABLE)
+
+    m = language_map.create_language_map(
+        taiwan_geojson,
+        geometry_asset=geometry_path,
+        township_url=township_url,
+        dataset=dataset,
+        prepared=True,
+        write_geometry=False,
+        geometry_url=f"/geometry.geojson?v={geometry['version']}",
+        data_url=f"/data/languages.json?v={data['version']}",
+        time_series=time_series
+    )
+    shell = make_resource(m.get_root().render().encode('utf-8'), 'text/html; charset=utf-8', REVALIDATE)
+    resources['/'] = resources['/index.html'] = shell
+    return resources
+
+def watched_files(args):
+    """變更時需要重新載入的檔案：數據檔、縣市代碼表、語言登錄表，以及本地檔案的地理數據
+
+    不監看地理數據快取：重新載入時重新驗證快取會寫入快取索引，監看它會不斷觸發重新載入。
+    """
+    paths = language_map.store_sources(args.data_dir) + [args.counties, language_map.LANGUAGES_PATH]
+    if os.path.isfile(args.geojson_url):
+        paths.append(args.geojson_url)
+    return paths
+
+def _file_state(paths):
+    state = []
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            state.append((path, stat.st_mtime, stat.st_size))
+        except FileNotFoundError:
+            state.append((path, None, None))
+    return state
+
+def watch_files(server, args, interval=DEFAULT_POLL_INTERVAL):
+    """定期檢查數據檔案，變更時重新產生回應後再替換"""
+    state = _file_state(watched_files(args))
+    while True:
+        time.sleep(interval)
+        current = _file_state(watched_files(args))
+        if current == state:
+            continue
+        state = current
+        print("偵測到數據檔案變更，重新載入")
+        language_map.reload_language_registries()
+        try:
+            resources = build_resources(args)
+        except Exception as e:
+            print(f"重新載入失敗，繼續使用目前的數據：{e}")
+            continue
+        if resources:
+            server.resources = resources
+            print("已重新載入數據")
+
+class MapRequestHandler(BaseHTTPRequestHandler):
+    """從記憶體中的回應表提供檔案，支援條件式請求與壓縮"""
+    server_version = 'TaiwanLanguageMap/1.0'
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def _respond(self, send_body):
+        # 取用當下的回應表，重新載入時替換整個表，不影響進行中的請求
+        url = urlsplit(self.path)
+        resource = self.server.resources.get(url.path)
+        if resource is None:
+            self.send_error(404, explain='找不到資源')
+            return
+        # 缺少版本或版本已過期（例如重新載入前的頁面）時，回應的內容不是該版本，不能長期快取
+        cache_control = resource['cache']
+        if 'version' in resource and parse_qs(url.query).get('v') != [resource['version']]:
+            cache_control = REVALIDATE
+        encoding = choose_encoding(self.headers.get('Accept-Encoding', ''), resource['variants'])
+        body, etag = resource['variants'][encoding]
+
+        if_none_match = self.headers.get('If-None-Match', '')
+        not_modified = etag in [tag.strip() for tag in if_none_match.split(',')] or if_none_match.strip() == '*'
+        self.send_response(304 if not_modified else 200)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Vary', 'Accept-Encoding')
+        if not not_modified:
+            self.send_header('Content-Type', resource['type'])
+            self.send_header('Content-Length', str(len(body)))
+            if encoding != 'identity':
+                self.send_header('Content-Encoding', encoding)
+        self.end_headers()
+        if send_body and not not_modified:
+            self.wfile.write(body)
+
+def run(args):
+    """serve 子命令：啟動地圖伺服器
+
+    先綁定連接埠再產生回應，連接埠被占用時不必等整個產生過程結束才失敗。
+    """
+    try:
+        server = ThreadingHTTPServer((args.host, args.port), MapRequestHandler)
+    except OSError as e:
+        print(f"無法在 {args.host}:{args.port} 啟動地圖服務（連接埠可能已被占用，可用 --port 指定）：{e}")
+        return
+    server.daemon_threads = True
+    resources = build_resources(args)
+    if not resources:
+        server.server_close()
+        return
+    server.resources = resources
+    watcher = threading.Thread(target=watch_files, args=(server, args, args.poll_interval), daemon=True)
+    watcher.start()
+    print(f"地圖服務已啟動：http://{args.host}:{server.server_port}/（Ctrl+C 結束）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
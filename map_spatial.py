@@ -0,0 +1,364 @@
+"""以經緯度批次查詢所在的縣市（或鄉鎮市區）與其語言使用比例
+
+空間索引以 NumPy 建立，分為兩層：
+1. 各區域的外框放進均勻網格（與 R-tree 相同的外框篩選），點所在格子中
+   外框包含該點的區域即為候選；
+2. 各區域的邊依緯度分到等高的條帶，以（區域, 條帶）排序。判斷點是否在候選區域內時
+   只需檢查該區域在點所在條帶中的幾條邊：向東的射線與邊相交奇數次即在區域內
+   （射線法，MultiPolygon、內環與互相重疊的區域都適用）。
+所有「點 × 候選區域 × 邊」攤平成一維陣列一次計算，區域再多，每個點比較的邊數也差不多。
+
+索引只建立一次：同一份邊界在程序中共用，並以 .npz 保存在地理數據快取目錄。
+大量的點可分批交給多個程序查詢（ProcessPoolExecutor），索引在每個程序啟動時只傳送一次。
+"""
+import csv
+import hashlib
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import map_geometry
+import map_store
+import taiwan_language_map_new as language_map
+
+LEVELS = ('county', 'township')
+AREAS_PER_CELL = 0.25  # 外框網格大小：每個格子平均分到的區域數
+BAND_EDGES = 2  # 條帶高度為邊的緯度跨度中位數的倍數
+MAX_GRID_CELLS = 1 << 22
+MAX_BANDS = 1 << 20
+BATCH_POINTS = 1 << 16  # 每批一起計算的點數，限制暫存陣列的大小
+CHUNK_SIZE = 200_000  # 每個工作程序一次查詢的點數
+
+# 已建立的索引（鍵為邊界內容、縣市代碼表與索引設定的雜湊值）
+_indexes = {}
+# 工作程序的共用狀態，由 _init_worker 在每個程序啟動時設定一次
+_worker_state = {}
+
+def _ring_edges(areas):
+    """所有環的邊，返回 (起點, 終點, 所屬區域的位置, 區域代碼列表)"""
+    ids = []
+    starts = []
+    owners = []
+    for position, (area_id, geometry) in enumerate(areas):
+        ids.append(area_id)
+        for polygon in map_geometry._iter_polygons(geometry):
+            for ring in polygon:
+                points = np.asarray(ring, dtype=float)[:, :2]
+                if len(points) >= 3:
+                    starts.append(points)
+                    owners.append(np.full(len(points), position))
+    if not starts:
+        return None, None, None, ids
+    ends = [np.roll(points, -1, axis=0) for points in starts]
+    return np.concatenate(starts), np.concatenate(ends), np.concatenate(owners), ids
+
+def _expand(first, last):
+    """將每個 [first, last] 範圍展開，返回 (範圍的位置, 範圍中的值)"""
+    counts = last - first + 1
+    owner = np.repeat(np.arange(len(first)), counts)
+    return owner, first[owner] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+
+def build_index(areas):
+    """由 [(區域代碼, geometry)] 建立空間索引，沒有多邊形時返回None
+
+    返回字典：ids（區域代碼，依輸入順序）、bounds（範圍）、area_bounds（各區域外框）、
+    cell、shape、cell_offsets、cell_areas（外框網格）、band_height、bands、
+    keys（各邊的「區域 × 條帶」鍵，已排序）與邊陣列 x、y1、y2、slope。
+    """
+    start, end, owner, ids = _ring_edges(areas)
+    if start is None:
+        print("無法建立空間索引：沒有多邊形邊界")
+        return None
+    # 水平的邊不會與向東的射線相交，但仍計入外框
+    area_bounds = np.full((len(ids), 4), np.nan)
+    for column, function, points in ((0, np.minimum, start[:, 0]), (1, np.minimum, start[:, 1]),
+                                     (2, np.maximum, start[:, 0]), (3, np.maximum, start[:, 1])):
+        values = np.full(len(ids), np.inf if function is np.minimum else -np.inf)
+        function.at(values, owner, points)
+        area_bounds[:, column] = values
+    present = np.isfinite(area_bounds[:, 0])
+    bounds = np.array([area_bounds[present, 0].min(), area_bounds[present, 1].min(),
+                       area_bounds[present, 2].max(), area_bounds[present, 3].max()])
+    width, height = bounds[2] - bounds[0], bounds[3] - bounds[1]
+
+    # 外框網格：每個區域放進其外框經過的每個格子（依區域排序）
+    cells = int(np.clip(present.sum() / AREAS_PER_CELL, 1, MAX_GRID_CELLS))
+    cell = max(np.sqrt(width * height / cells), width / MAX_GRID_CELLS, height / MAX_GRID_CELLS, 1e-9)
+    shape = np.array([int(height // cell) + 1, int(width // cell) + 1])
+    positions = np.flatnonzero(present)
+    first = ((area_bounds[positions, :2] - bounds[:2]) // cell).astype(int)
+    last = ((area_bounds[positions, 2:] - bounds[:2]) // cell).astype(int)
+    area_of_row, row = _expand(first[:, 1], last[:, 1])
+    area_of_cell, column = _expand(first[area_of_row, 0], last[area_of_row, 0])
+    grid_cell = row[area_of_cell] * shape[1] + column
+    cell_areas = positions[area_of_row[area_of_cell]]
+    order = np.argsort(grid_cell, kind='stable')
+    grid_cell, cell_areas = grid_cell[order], cell_areas[order]
+
+    # 邊的條帶：高度為邊緯度跨度中位數的 BAND_EDGES 倍，每條邊放進它跨越的每個條帶
+    keep = start[:, 1] != end[:, 1]
+    start, end, owner = start[keep], end[keep], owner[keep]
+    low = np.minimum(start[:, 1], end[:, 1])
+    high = np.maximum(start[:, 1], end[:, 1])
+    bands = int(np.clip(height / (BAND_EDGES * np.median(high - low)), 1, MAX_BANDS))
+    band_height = height / bands or 1.0
+    edge, band = _expand(np.minimum(((low - bounds[1]) // band_height).astype(int), bands - 1),
+                         np.minimum(((high - bounds[1]) // band_height).astype(int), bands - 1))
+    keys = owner[edge].astype(np.int64) * bands + band
+    order = np.argsort(keys, kind='stable')
+    edge = edge[order]
+    return {
+        'ids': ids,
+        'bounds': bounds,
+        'area_bounds': area_bounds,
+        'cell': cell,
+        'shape': shape,
+        'cell_offsets': np.searchsorted(grid_cell, np.arange(shape[0] * shape[1] + 1)),
+        'cell_areas': cell_areas,
+        'band_height': band_height,
+        'bands': bands,
+        'keys': keys[order],
+        'x': start[edge, 0],
+        'y1': start[edge, 1],
+        'y2': end[edge, 1],
+        'slope': (end[edge, 0] - start[edge, 0]) / (end[edge, 1] - start[edge, 1])
+    }
+
+def _locate_batch(index, lons, lats):
+    """一批點所在區域的位置（同時在多個區域內時取排在前面的區域），不在任何區域內時為 -1"""
+    result = np.full(len(lons), -1)
+    west, south = index['bounds'][:2]
+    rows, columns = index['shape']
+    row = np.minimum(((lats - south) // index['cell']).astype(int), rows - 1)
+    column = np.minimum(((lons - west) // index['cell']).astype(int), columns - 1)
+    cells = row * columns + column
+
+    # 候選：點所在格子中外框包含該點的區域
+    point, entry = _expand(index['cell_offsets'][cells], index['cell_offsets'][cells + 1] - 1)
+    area = index['cell_areas'][entry]
+    box = index['area_bounds'][area]
+    inside_box = ((box[:, 0] <= lons[point]) & (lons[point] <= box[:, 2])
+                  & (box[:, 1] <= lats[point]) & (lats[point] <= box[:, 3]))
+    point, area = point[inside_box], area[inside_box]
+
+    # 候選區域在點所在條帶中的邊
+    band = np.minimum(((lats[point] - south) // index['band_height']).astype(int), index['bands'] - 1)
+    keys = area.astype(np.int64) * index['bands'] + band
+    first = np.searchsorted(index['keys'], keys, side='left')
+    last = np.searchsorted(index['keys'], keys, side='right')
+    has_edges = last > first
+    point, area, first, last = point[has_edges], area[has_edges], first[has_edges], last[has_edges]
+    if not len(point):
+        return result
+    pair, edge = _expand(first, last - 1)
+    lon, lat = lons[point[pair]], lats[point[pair]]
+    y1 = index['y1'][edge]
+    crosses = ((y1 > lat) != (index['y2'][edge] > lat)) & (lon < index['x'][edge] + (lat - y1) * index['slope'][edge])
+    # 依候選分段計算相交次數（uint8 溢位不影響奇偶），候選已依點、區域排序
+    segments = np.flatnonzero(np.r_[True, pair[1:] != pair[:-1]])
+    odd = (np.add.reduceat(crosses.astype(np.uint8), segments) & 1).astype(bool)
+    points, first_hit = np.unique(point[odd], return_index=True)
+    result[points] = area[odd][first_hit]
+    return result
+
+def locate(index, lons, lats):
+    """查詢每個點所在區域在 index['ids'] 中的位置，不在任何區域內（或座標無效）時為 -1"""
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    result = np.full(len(lons), -1)
+    west, south, east, north = index['bounds']
+    valid = np.flatnonzero((lons >= west) & (lons <= east) & (lats >= south) & (lats <= north))
+    for offset in range(0, len(valid), BATCH_POINTS):
+        points = valid[offset:offset + BATCH_POINTS]
+        result[points] = _locate_batch(index, lons[points], lats[points])
+    return result
+
+def _init_worker(index):
+    _worker_state['index'] = index
+
+def _locate_chunk(chunk):
+    return locate(_worker_state['index'], *chunk)
+
+def create_pool(index, workers=None):
+    """建立以索引初始化的程序池，可在多次 locate_parallel 之間共用"""
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(index,))
+
+def locate_parallel(index, lons, lats, workers=None, chunk_size=CHUNK_SIZE, executor=None):
+    """與 locate 相同，但將點分批交給多個程序查詢
+
+    workers 為 1 或點數不超過一批時在目前程序中查詢；executor 為 create_pool 建立的程序池。
+    """
+    lons = np.asarray(lons, dtype=float)
+    lats = np.asarray(lats, dtype=float)
+    if (workers == 1 and executor is None) or len(lons) <= chunk_size:
+        return locate(index, lons, lats)
+    chunks = [(lons[offset:offset + chunk_size], lats[offset:offset + chunk_size])
+              for offset in range(0, len(lons), chunk_size)]
+    if executor is not None:
+        return np.concatenate(list(executor.map(_locate_chunk, chunks)))
+    with create_pool(index, workers) as pool:
+        return np.concatenate(list(pool.map(_locate_chunk, chunks)))
+
+def _county_areas(geojson, dataset):
+    """縣市邊界，以縣市代碼為區域代碼（同一縣市可以有多個區域）"""
+    joined, _ = language_map.join_county_ids(geojson, dataset.county_ids)
+    return [(feature['properties']['county_id'], feature['geometry']) for feature in joined['features']
+            if feature['properties'].get('county_id')]
+
+def _township_areas(geojson, dataset):
+    """鄉鎮市區邊界，區域代碼為「縣市代碼-比對鍵」"""
+    grouped = language_map.group_township_geometry(geojson, dataset.county_ids)
+    return [(f"{county_id}-{key}", feature['geometry'])
+            for county_id, features in grouped.items() for key, feature in features.items()]
+
+def _index_cache_path(cache_dir, key):
+    return os.path.join(cache_dir, f'spatial-{key[:16]}.npz')
+
+def load_index(level='county', dataset=None, url=None, cache_dir=language_map.GEOJSON_CACHE_DIR, offline=False,
+               timeout=language_map.GEOJSON_TIMEOUT):
+    """取得縣市（county）或鄉鎮市區（township）的空間索引，同一份邊界只建立一次
+
+    邊界由 download_taiwan_geojson 取得（url 預設為縣市或鄉鎮市區邊界的網址），
+    以縣市代碼表對應區域代碼。建好的索引保存在程序中與 cache_dir，失敗時返回None。
+    """
+    dataset = dataset or language_map.get_dataset()
+    url = url or (language_map.GEOJSON_URL if level == 'county' else language_map.TOWNSHIP_GEOJSON_URL)
+    geojson = language_map.download_taiwan_geojson(url=url, cache_dir=cache_dir, offline=offline, timeout=timeout)
+    if not geojson:
+        print("無法建立空間索引：缺少地理數據")
+        return None
+    # 以下載內容的雜湊值為鍵（本地檔案直接計算），不必重新序列化整份邊界
+    if os.path.isfile(url):
+        digest = map_store.file_sha256(url)
+    else:
+        digest = (language_map._load_cache_index(cache_dir).get(url, {}).get('sha256')
+                  or language_map.geojson_digest(geojson))
+    content = json.dumps([level, digest, sorted(dataset.county_ids.items()), AREAS_PER_CELL, BAND_EDGES])
+    key = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    if key in _indexes:
+        return _indexes[key]
+
+    cache_path = _index_cache_path(cache_dir, key)
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as cached:
+            index = {name: cached[name] for name in cached.files}
+        index['ids'] = index['ids'].tolist()
+        for name in ('cell', 'band_height', 'bands'):
+            index[name] = index[name].item()
+    else:
+        areas = _county_areas(geojson, dataset) if level == 'county' else _township_areas(geojson, dataset)
+        index = build_index(areas)
+        if index is None:
+            return None
+        os.makedirs(cache_dir, exist_ok=True)
+        arrays = dict(index, ids=np.array(index['ids'], dtype=str))
+        with open(cache_path, 'wb') as file:
+            np.savez(file, **arrays)
+    _indexes[key] = index
+    return index
+
+def area_records(level='county', dataset=None):
+    """各區域的名稱與語言數據，返回 ({區域代碼: 記錄}, 語言列表)
+
+    鄉鎮市區以與邊界相同的「縣市代碼-比對鍵」為鍵，記錄中保留資料庫的 region_id。
+    """
+    dataset = dataset or language_map.get_dataset()
+    if level == 'county':
+        records = {county_id: {'region_id': county_id, 'name': dataset.county_names.get(county_id, county_id),
+                               'data': data}
+                   for county_id, data in dataset.language_data.items()}
+        return records, dataset.analytics['languages']
+    dataset.compile()
+    store = map_store.read_store(dataset.store_path)
+    records = {f"{county_id}-{language_map.township_key(record['name'])}": record
+               for county_id, townships in store['townships'].items() for record in townships}
+    return records, store['languages']
+
+def join_languages(index, positions, records, languages):
+    """將查詢結果對應到區域代碼、名稱與各語言比例，返回 {欄位: 陣列}（沒有對應時為None或NaN）"""
+    ids = [None] * (len(index['ids']) + 1)
+    names = [None] * (len(index['ids']) + 1)
+    table = np.full((len(index['ids']) + 1, len(languages)), np.nan)
+    for row, area_id in enumerate(index['ids']):
+        record = records.get(area_id)
+        ids[row] = record['region_id'] if record else area_id
+        if record:
+            names[row] = record['name']
+            for column, lang in enumerate(languages):
+                if record['data'].get(lang) is not None:
+                    table[row, column] = record['data'][lang]
+    # 位置 -1 對應最後一列（全部為空）
+    columns = {'region_id': np.array(ids, dtype=object)[positions], 'name': np.array(names, dtype=object)[positions]}
+    values = table[positions]
+    for column, lang in enumerate(languages):
+        columns[lang] = values[:, column]
+    return columns
+
+def lookup(lons, lats, level='county', dataset=None, workers=None, **index_options):
+    """查詢每個點所在的區域與語言使用比例，返回 {欄位: 陣列}，無法建立索引時返回None"""
+    dataset = dataset or language_map.get_dataset()
+    index = load_index(level, dataset, **index_options)
+    if index is None:
+        return None
+    records, languages = area_records(level, dataset)
+    return join_languages(index, locate_parallel(index, lons, lats, workers), records, languages)
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+def locate_csv(input_path, output_path, level='county', dataset=None, lon_column='lon', lat_column='lat',
+               workers=None, chunk_size=CHUNK_SIZE, **index_options):
+    """在CSV的每一列後面加上所在區域與語言使用比例，分批讀寫，返回寫出的列數（失敗時返回None）"""
+    dataset = dataset or language_map.get_dataset()
+    index = load_index(level, dataset, **index_options)
+    if index is None:
+        return None
+    records, languages = area_records(level, dataset)
+    # 每次讀取的列數足夠分給所有工作程序
+    batch_size = chunk_size * (workers or os.cpu_count() or 1)
+    total = matched = 0
+    with open(input_path, 'r', encoding='utf-8-sig', newline='') as source, \
+            open(output_path, 'w', encoding='utf-8', newline='') as target:
+        reader = csv.reader(source)
+        header = next(reader, None)
+        if not header or lon_column not in header or lat_column not in header:
+            print(f"CSV缺少經緯度欄位：{lon_column}、{lat_column}")
+            return None
+        lon_at, lat_at = header.index(lon_column), header.index(lat_column)
+        writer = csv.writer(target)
+        writer.writerow(header + ['region_id', 'name'] + languages)
+        pool = create_pool(index, workers) if workers != 1 else None
+        try:
+            while True:
+                rows = [row for _, row in zip(range(batch_size), reader)]
+                if not rows:
+                    break
+                lons = np.array([_to_float(row[lon_at]) if len(row) > lon_at else np.nan for row in rows])
+                lats = np.array([_to_float(row[lat_at]) if len(row) > lat_at else np.nan for row in rows])
+                positions = locate_parallel(index, lons, lats, workers, chunk_size, pool)
+                columns = join_languages(index, positions, records, languages)
+                values = [columns[lang] for lang in languages]
+                for row_index, row in enumerate(rows):
+                    writer.writerow(row + [columns['region_id'][row_index] or '', columns['name'][row_index] or '']
+                                    + ['' if np.isnan(value[row_index]) else value[row_index] for value in values])
+                total += len(rows)
+                matched += int((positions >= 0).sum())
+        finally:
+            if pool:
+                pool.shutdown()
+    print(f"已查詢 {total:,} 個點，其中 {matched:,} 個位於{'縣市' if level == 'county' else '鄉鎮市區'}內，"
+          f"結果保存為 '{output_path}'")
+    return total
+
+def run(args):
+    """locate 子命令：查詢CSV中每個經緯度所在的區域"""
+    dataset = language_map.get_dataset(args.data_dir, args.counties)
+    url = args.geojson_url if args.level == 'county' else args.township_geojson_url
+    return locate_csv(args.input, args.output, args.level, dataset, args.lon_column, args.lat_column,
+                      args.workers, args.chunk_size, url=url, cache_dir=args.cache_dir, offline=args.offline,
+                      timeout=args.timeout)
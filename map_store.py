@@ -0,0 +1,210 @@
+"""語言數據的編譯資料庫
+
+將 language_data.csv 與各縣市活頁簿整合成單一 SQLite 檔案，
+以（縣市／鄉鎮市區代碼 × 語言）為鍵保存；其他調查年份的縣市數據
+（level 為 series）以（縣市代碼 × 年份 × 語言）保存在同一張表中。來源檔案的修改時間、大小與雜湊值
+一併記錄，來源沒有變更時不重新編譯，啟動時只需讀取這一個檔案。
+讀取（包括檢查是否為最新）一律以唯讀方式開啟，只有 write_store 會寫入。
+"""
+import hashlib
+import os
+import pathlib
+import sqlite3
+
+SCHEMA_VERSION = 4
+MMAP_SIZE = 64 * 1024 * 1024
+
+SCHEMA = '''
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE sources (path TEXT PRIMARY KEY, mtime REAL, size INTEGER, sha256 TEXT);
+CREATE TABLE languages (language TEXT PRIMARY KEY, position INTEGER);
+CREATE TABLE regions (
+    region_id TEXT PRIMARY KEY,
+    county_id TEXT NOT NULL,
+    level TEXT NOT NULL,
+    name TEXT NOT NULL,
+    region TEXT,
+    population INTEGER,
+    year INTEGER,
+    note TEXT,
+    source TEXT
+);
+CREATE TABLE language_values (
+    region_id TEXT NOT NULL,
+    language TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (region_id, language)
+) WITHOUT ROWID;
+CREATE INDEX regions_county ON regions (county_id, level);
+'''
+
+def file_sha256(path):
+    """計算檔案內容的雜湊值"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# 修改時間改變但內容相同的來源檔案：(路徑, 修改時間, 大小) -> 雜湊值，同一程序中不重複計算
+_source_hashes = {}
+
+def _connect(store_path):
+    """以唯讀方式開啟資料庫（唯讀的檔案也能讀取，不與其他讀取者爭用寫入鎖）"""
+    connection = sqlite3.connect(pathlib.Path(store_path).absolute().as_uri() + '?mode=ro', uri=True)
+    connection.execute(f'PRAGMA mmap_size = {MMAP_SIZE}')
+    return connection
+
+def store_is_current(store_path, source_paths):
+    """檢查資料庫是否與來源檔案一致
+
+    先比對修改時間與大小；只有修改時間不同時才計算雜湊值，內容未變（例如重新checkout）
+    則視為一致。檢查不會寫入資料庫，計算過的雜湊值保存在程序中，下次檢查不再重新計算。
+    """
+    if not os.path.exists(store_path):
+        return False
+    try:
+        connection = _connect(store_path)
+    except sqlite3.Error:
+        return False
+    try:
+        version = connection.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if not version or int(version[0]) != SCHEMA_VERSION:
+            return False
+        recorded = {row[0]: row[1:] for row in connection.execute('SELECT path, mtime, size, sha256 FROM sources')}
+        if set(recorded) != {os.path.abspath(path) for path in source_paths}:
+            return False
+        for path in source_paths:
+            path = os.path.abspath(path)
+            mtime, size, sha256 = recorded[path]
+            stat = os.stat(path)
+            if stat.st_mtime == mtime and stat.st_size == size:
+                continue
+            if stat.st_size != size:
+                return False
+            key = (path, stat.st_mtime, stat.st_size)
+            if key not in _source_hashes:
+                _source_hashes[key] = file_sha256(path)
+            if _source_hashes[key] != sha256:
+                return False
+        return True
+    except (sqlite3.Error, OSError):
+        return False
+    finally:
+        connection.close()
+
+def write_store(store_path, languages, regions, source_paths):
+    """寫入新的資料庫（先寫暫存檔再替換，讀取中的程序不受影響）
+
+    regions 為字典列表，包含 region_id、county_id、level、name、region、
+    population、year、note、source 與 data（語言 -> 比例）。
+    """
+    tmp_path = store_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    connection = sqlite3.connect(tmp_path)
+    try:
+        with connection:
+            connection.executescript(SCHEMA)
+            connection.execute("INSERT INTO meta VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+            connection.executemany('INSERT INTO languages VALUES (?, ?)',
+                                   [(language, position) for position, language in enumerate(languages)])
+            sources = []
+            for path in source_paths:
+                stat = os.stat(path)
+                sources.append((os.path.abspath(path), stat.st_mtime, stat.st_size, file_sha256(path)))
+            connection.executemany('INSERT INTO sources VALUES (?, ?, ?, ?)', sources)
+            connection.executemany(
+                'INSERT INTO regions VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                [(r['region_id'], r['county_id'], r['level'], r['name'], r.get('region'), r.get('population'),
+                  r.get('year'), r.get('note'), r.get('source') and os.path.abspath(r['source']))
+                 for r in regions])
+            connection.executemany(
+                'INSERT INTO language_values VALUES (?, ?, ?)',
+                [(r['region_id'], language, value) for r in regions for language, value in r['data'].items()])
+    finally:
+        connection.close()
+    os.replace(tmp_path, store_path)
+
+def read_store(store_path):
+    """一次讀出資料庫內容
+
+    返回字典：languages（語言順序）、counties（county_id -> 縣市記錄）、
+    townships（county_id -> 鄉鎮市區記錄列表）、series（年份 -> county_id -> 語言數據，
+    包含 counties 本身的年份）與 sources（路徑 -> 雜湊值）。
+    """
+    connection = _connect(store_path)
+    try:
+        languages = [row[0] for row in connection.execute('SELECT language FROM languages ORDER BY position')]
+        sources = dict(connection.execute('SELECT path, sha256 FROM sources'))
+        records = {}
+        counties = {}
+        townships = {}
+        series = {}
+        for region_id, county_id, level, name, region, population, year, note, source in connection.execute(
+                'SELECT region_id, county_id, level, name, region, population, year, note, source '
+                'FROM regions ORDER BY rowid'):
+            record = {'region_id': region_id, 'county_id': county_id, 'name': name, 'region': region,
+                      'population': population, 'year': year, 'note': note, 'source': source, 'data': {}}
+            records[region_id] = record
+            if level == 'county':
+                counties[county_id] = record
+            elif level == 'township':
+                townships.setdefault(county_id, []).append(record)
+            if level in ('county', 'series') and year is not None:
+                series.setdefault(year, {})[county_id] = record['data']
+        for region_id, language, value in connection.execute(
+                'SELECT v.region_id, v.language, v.value FROM language_values v '
+                'JOIN languages l ON l.language = v.language ORDER BY l.position'):
+            records[region_id]['data'][language] = value
+    finally:
+        connection.close()
+    return {'languages': languages, 'counties': counties, 'townships': townships,
+            'series': dict(sorted(series.items())), 'sources': sources}
+
+def read_languages(store_path):
+    """資料庫中的語言（依欄位順序）"""
+    connection = _connect(store_path)
+    try:
+        return [row[0] for row in connection.execute('SELECT language FROM languages ORDER BY position')]
+    finally:
+        connection.close()
+
+def iter_regions(store_path, levels=None, chunk_size=1000):
+    """依序讀出區域記錄，每次產生最多 chunk_size 筆的列表，不一次載入整個資料庫
+
+    記錄的欄位與 read_store 相同，另有 level；levels 指定只讀取的層級。
+    區域與語言數值以一次查詢依序讀出，不需要以區域代碼列表查詢（不受 SQLite 參數數量的限制）。
+    """
+    connection = _connect(store_path)
+    try:
+        query = ('SELECT r.region_id, r.county_id, r.level, r.name, r.region, r.population, r.year, r.note, '
+                 'r.source, v.language, v.value FROM regions r '
+                 'LEFT JOIN language_values v ON v.region_id = r.region_id '
+                 'LEFT JOIN languages l ON l.language = v.language')
+        params = tuple(levels or ())
+        if levels:
+            query += f" WHERE r.level IN ({', '.join('?' * len(params))})"
+        cursor = connection.execute(query + ' ORDER BY r.rowid, l.position', params)
+        records = {}
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            for region_id, county_id, level, name, region, population, year, note, source, language, value in rows:
+                record = records.get(region_id)
+                if record is None:
+                    # 下一個區域開始時，已滿 chunk_size 筆的記錄（都已讀完所有語言）先送出
+                    if len(records) >= chunk_size:
+                        yield list(records.values())
+                        records = {}
+                    record = records[region_id] = {
+                        'region_id': region_id, 'county_id': county_id, 'level': level, 'name': name,
+                        'region': region, 'population': population, 'year': year, 'note': note,
+                        'source': source, 'data': {}}
+                if language is not None:
+                    record['data'][language] = value
+            if not rows:
+                break
+        if records:
+            yield list(records.values())
+    finally:
+        connection.close()
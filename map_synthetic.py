@@ -0,0 +1,292 @@
+"""產生大規模的合成數據，用於量測地圖產生流程隨區域數量的變化
+
+真實數據只有22個縣市，名稱對應、樣式表與彈窗的效能問題不會出現。
+這裡產生任意數量（例如 1k、10k、100k）的合成區域，輸出的格式與真實數據相同，
+可以直接交給 build、batch、export 與 benchmark：
+
+- 邊界 GeoJSON：以隨機擾動的網格鋪滿台灣本島形狀的橢圓，相鄰區域共用邊界，
+  每個區域的頂點數可調整（--vertices）；
+- 縣市代碼表：與 taiwan_counties.json 格式相同；
+- language_data.csv 與各區域資料夾的活頁簿：格式與真實數據相同，
+  各語言比例依位置平滑變化（例如東部原住民語較高）並加上雜訊。
+
+邊界、CSV與活頁簿中的名稱會隨機換成 normalize_county_name 處理的各種寫法
+（台／臺、云／雲、慄／栗、縣／市、前後空白），以測試名稱對應的路徑。
+"""
+import csv
+import json
+import math
+import os
+
+import numpy as np
+
+import map_workbooks
+
+DEFAULT_REGIONS = 1000
+DEFAULT_VERTICES = 64  # 每個區域邊界的頂點數
+DEFAULT_TOWNSHIP_ROWS = 8  # 每個活頁簿的鄉鎮市區數
+WORKBOOK_YEAR = 2020
+TOTAL_POPULATION = 23_000_000
+
+# 台灣本島的近似橢圓：中心、長短半軸（經緯度）與長軸偏離正北的角度
+ISLAND_CENTER = (120.97, 23.65)
+ISLAND_AXES = (1.95, 0.65)
+ISLAND_ROTATION = math.radians(20)
+CORNER_JITTER = 0.2  # 網格頂點的擾動（網格寬度的比例）
+EDGE_AMPLITUDE = 0.15  # 邊界彎曲的幅度（邊長的比例）
+COORDINATE_DIGITS = 5
+
+LANGUAGES = ('華語', '閩南語', '客家話', '原住民語')
+NAME_FIRST = '臺雲栗新高嘉彰花宜屏澎金連桃竹苗投南基東'
+NAME_SECOND = '北中南東西興安和平林山港田豐義'
+TOWNSHIP_SUFFIXES = '區鄉鎮市'
+
+# normalize_county_name 與 resolve_county_id 會還原的寫法（標準名稱中的字 -> 異體寫法）
+NAME_VARIANTS = (('臺', '台'), ('雲', '云'), ('栗', '慄'), ('市', '縣'))
+
+def parse_size(value):
+    """區域數量，可寫成 1000、10k 或 0.1m"""
+    text = str(value).strip().lower()
+    scale = {'k': 1000, 'm': 1000000}.get(text[-1:], 1)
+    count = int(float(text[:-1] if scale > 1 else text) * scale)
+    if count < 1:
+        raise ValueError(f"區域數量必須大於0：{value}")
+    return count
+
+def region_names(count):
+    """標準名稱（與縣市代碼表相同），每個名稱都含有可換成異體寫法的字"""
+    names = []
+    for index in range(count):
+        first = NAME_FIRST[index % len(NAME_FIRST)]
+        second = NAME_SECOND[(index // len(NAME_FIRST)) % len(NAME_SECOND)]
+        names.append(f"{first}{second}{index + 1}市")
+    return names
+
+def name_variant(name, rng):
+    """隨機換成另一種寫法，約四分之一維持標準名稱"""
+    choices = [pair for pair in NAME_VARIANTS if pair[0] in name]
+    choice = rng.integers(len(choices) + 2)
+    if choice < len(choices):
+        return name.replace(*choices[choice])
+    if choice == len(choices):
+        return f" {name} "
+    return name
+
+def _inside_island(lon, lat):
+    dx, dy = lon - ISLAND_CENTER[0], lat - ISLAND_CENTER[1]
+    along = dx * math.sin(ISLAND_ROTATION) + dy * math.cos(ISLAND_ROTATION)
+    across = dx * math.cos(ISLAND_ROTATION) - dy * math.sin(ISLAND_ROTATION)
+    return (along / ISLAND_AXES[0]) ** 2 + (across / ISLAND_AXES[1]) ** 2 <= 1
+
+def _island_grid(count):
+    """中心在橢圓內的格子至少有 count 個的網格，返回 (原點, 格寬, 列數, 欄數, 選取的格子)"""
+    cell = math.sqrt(math.pi * ISLAND_AXES[0] * ISLAND_AXES[1] / count)
+    extent = max(ISLAND_AXES)
+    while True:
+        columns = rows = int(math.ceil(2 * extent / cell)) + 1
+        origin = (ISLAND_CENTER[0] - columns * cell / 2, ISLAND_CENTER[1] - rows * cell / 2)
+        row, column = np.divmod(np.arange(rows * columns), columns)
+        inside = _inside_island(origin[0] + (column + 0.5) * cell, origin[1] + (row + 0.5) * cell)
+        if inside.sum() >= count:
+            return origin, cell, rows, columns, np.flatnonzero(inside)[:count]
+        cell *= 0.97
+
+def _edge_points(start, end, segments, rng):
+    """在兩端點之間加入 segments - 1 個頂點，沿法線方向平滑彎曲（端點不動）"""
+    t = np.arange(1, segments) / segments
+    direction = end - start
+    normal = np.stack([-direction[..., 1], direction[..., 0]], axis=-1)
+    shape = start.shape[:-1]
+    weights = rng.uniform(-1, 1, shape + (3, 1))
+    phases = rng.uniform(0, 2 * math.pi, shape + (3, 1))
+    harmonics = np.arange(1, 4)[:, None]
+    bend = (weights * np.sin(harmonics * math.pi * t + phases)).sum(axis=-2) / 3
+    offset = EDGE_AMPLITUDE * np.sin(math.pi * t) * bend
+    return start[..., None, :] + direction[..., None, :] * t[:, None] + normal[..., None, :] * offset[..., None]
+
+def generate_geometry(count, vertices=DEFAULT_VERTICES, rng=None):
+    """產生 count 個區域的邊界，返回 (外環座標陣列 [區域, 頂點, 經緯度], 中心點陣列)
+
+    以擾動後的網格鋪滿橢圓，每條格線依端點產生一次彎曲的頂點，
+    相鄰的兩個區域共用同一條邊界（方向相反），拓撲與真實的行政區相同。
+    """
+    rng = rng or np.random.default_rng()
+    origin, cell, rows, columns, cells = _island_grid(count)
+    segments = max(vertices // 4, 1)
+    corner_row, corner_column = np.mgrid[0:rows + 1, 0:columns + 1]
+    corners = np.stack([origin[0] + corner_column * cell, origin[1] + corner_row * cell], axis=-1)
+    corners += rng.uniform(-CORNER_JITTER, CORNER_JITTER, corners.shape) * cell
+    horizontal = _edge_points(corners[:, :-1], corners[:, 1:], segments, rng)
+    vertical = _edge_points(corners[:-1], corners[1:], segments, rng)
+
+    row, column = np.divmod(cells, columns)
+    # 逆時針：下緣向東、右緣向北、上緣向西、左緣向南
+    rings = np.concatenate([
+        corners[row, column][:, None], horizontal[row, column],
+        corners[row, column + 1][:, None], vertical[row, column + 1],
+        corners[row + 1, column + 1][:, None], horizontal[row + 1, column][:, ::-1],
+        corners[row + 1, column][:, None], vertical[row, column][:, ::-1],
+        corners[row, column][:, None]
+    ], axis=1)
+    centers = np.stack([origin[0] + (column + 0.5) * cell, origin[1] + (row + 0.5) * cell], axis=-1)
+    return rings, centers
+
+def generate_language_data(centers, rng=None):
+    """依位置產生各語言比例（百分比，欄位順序同 LANGUAGES）
+
+    北部閩南語較低，西北與南部各有一個客家話較高的區域，東側原住民語較高。
+    """
+    rng = rng or np.random.default_rng()
+    dx = centers[:, 0] - ISLAND_CENTER[0]
+    dy = centers[:, 1] - ISLAND_CENTER[1]
+    north = (dx * math.sin(ISLAND_ROTATION) + dy * math.cos(ISLAND_ROTATION)) / ISLAND_AXES[0]
+    east = (dx * math.cos(ISLAND_ROTATION) - dy * math.sin(ISLAND_ROTATION)) / ISLAND_AXES[1]
+    noise = rng.normal(size=(len(centers), 4))
+
+    indigenous = 1 + 45 / (1 + np.exp(-(east - 0.4) * 8)) + 3 * noise[:, 3]
+    hakka = (2 + 60 * np.exp(-((north - 0.5) ** 2 / 0.02 + (east + 0.2) ** 2 / 0.15))
+             + 35 * np.exp(-((north + 0.65) ** 2 / 0.01 + east ** 2 / 0.08)) + 3 * noise[:, 2])
+    taiwanese = 93 - 35 / (1 + np.exp(-(north - 0.7) * 12)) - 0.7 * hakka - 0.8 * indigenous + 4 * noise[:, 1]
+    mandarin = 98.5 - 0.1 * indigenous - np.abs(noise[:, 0])
+    values = np.stack([mandarin, taiwanese, hakka, indigenous], axis=-1)
+    return np.round(np.clip(values, 0, 99.9), 1)
+
+def generate_populations(count, rng=None):
+    """各區域人口（對數常態分布，總和約為台灣人口）"""
+    rng = rng or np.random.default_rng()
+    weights = rng.lognormal(0, 1, count)
+    return np.maximum((weights / weights.sum() * TOTAL_POPULATION).astype(int), 1)
+
+def region_folder(center):
+    """活頁簿所在的區域資料夾（與 Language_data 相同）"""
+    lon, lat = center
+    if lon >= 121.2 and lat < 24.4:
+        return 'Eastern&KinmenMatsu'
+    if lat >= 24.4:
+        return 'Northern'
+    return 'Middle' if lat >= 23.5 else 'Southern'
+
+def write_geojson(path, names, rings, rng):
+    """逐一寫出邊界（COUNTYNAME 使用隨機的異體寫法），不在記憶體中組成整個 GeoJSON"""
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('{"type":"FeatureCollection","features":[')
+        for index, (name, ring) in enumerate(zip(names, rings)):
+            feature = {
+                'type': 'Feature',
+                'properties': {'COUNTYNAME': name_variant(name, rng)},
+                'geometry': {'type': 'Polygon', 'coordinates': [np.round(ring, COORDINATE_DIGITS).tolist()]}
+            }
+            file.write((',' if index else '') + json.dumps(feature, ensure_ascii=False, separators=(',', ':')))
+        file.write(']}')
+
+def write_registry(path, county_ids, names, centers):
+    """寫出縣市代碼表（與 taiwan_counties.json 格式相同）"""
+    features = [{
+        'type': 'Feature',
+        'properties': {'name': name, 'county_id': county_id},
+        'geometry': {'type': 'Point', 'coordinates': [round(float(lon), 4), round(float(lat), 4)]}
+    } for county_id, name, (lon, lat) in zip(county_ids, names, centers)]
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump({'type': 'FeatureCollection', 'features': features}, file, ensure_ascii=False,
+                  separators=(',', ':'))
+
+def write_language_csv(path, names, values, rng, unmatched=0.0):
+    """寫出與 language_data.csv 格式相同的CSV，unmatched 比例的列使用無法對應的名稱"""
+    with open(path, 'w', encoding='utf-8-sig', newline='') as file:
+        writer = csv.writer(file, lineterminator='\n')
+        writer.writerow(['合成測試數據（主要及次要相加之和）', '', '', '', '', '', ''])
+        writer.writerow(['市縣', *LANGUAGES, '備注', ''])
+        for name, row in zip(names, values):
+            if rng.random() < unmatched:
+                name = '無此' + name
+            writer.writerow([name_variant(name, rng), *(f'{value:.1f}' for value in row), '', ''])
+
+def _workbook_row(name, population, values, rng):
+    """活頁簿的一列：各語言比例隨機拆成主要與次要使用"""
+    primary = np.round(values * rng.uniform(0.5, 0.9, len(values)), 1)
+    secondary = np.round(values - primary, 1)
+    return [None, name, int(population), *primary.tolist(), 0.0, None, *secondary.tolist(), 0.0, 0.0]
+
+def write_workbook(path, name, population, values, township_rows, rng):
+    """寫出一個縣市的活頁簿（與 map_workbooks.parse_county_workbook 讀取的格式相同）
+
+    縣市合計之後是 township_rows 個鄉鎮市區，比例在縣市數值附近變化、人口合計等於縣市人口。
+    """
+    import openpyxl
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet()
+    rows = [
+        [None, '單位：人', None, None, None, None, None, None, None, WORKBOOK_YEAR],
+        [None, f'{name.strip()}６歲以上本國籍常住人口使用語言情形（合成數據）'],
+        # 欄數不足的列讀取時會被略過，與真實活頁簿相同在後面附上英文標題
+        [None, None, None, *map_workbooks.LANGUAGE_HEADERS.values(), '其他', None,
+         *map_workbooks.LANGUAGE_HEADERS.values(), '其他語言'],
+        [None, map_workbooks.TOWNSHIP_SECTION] + [None] * 13 + ['By Township/City/District'],
+        _workbook_row(map_workbooks.INDENT + name, population, values, rng)
+    ]
+    # 各鄉鎮市區至少一人，餘數歸到最後一個，使人口合計等於縣市人口
+    populations = np.maximum((population * rng.dirichlet(np.ones(township_rows))).astype(int), 1)
+    populations[-1] = max(populations[-1] + population - populations.sum(), 1)
+    for index, township_population in enumerate(populations):
+        township = (f"{NAME_SECOND[index % len(NAME_SECOND)]}{index + 1}"
+                    f"{TOWNSHIP_SUFFIXES[index % len(TOWNSHIP_SUFFIXES)]}")
+        township_values = np.clip(values + rng.normal(0, 3, len(values)), 0, 99.9)
+        rows.append(_workbook_row(map_workbooks.INDENT * 2 + township, township_population,
+                                  township_values, rng))
+    rows.append([None, '註：合成數據，僅供效能測試使用。'])
+    for row in rows:
+        sheet.append(row)
+    workbook.save(path)
+
+def generate_dataset(output_dir, regions=DEFAULT_REGIONS, vertices=DEFAULT_VERTICES, seed=0, unmatched=0.0,
+                     workbooks=0, township_rows=DEFAULT_TOWNSHIP_ROWS):
+    """在 output_dir 產生邊界、縣市代碼表、CSV與活頁簿，返回各檔案路徑
+
+    output_dir 可直接作為 --data-dir；workbooks 為產生活頁簿的區域數（需要 openpyxl）。
+    相同的參數與 seed 產生相同的數據。
+    """
+    if workbooks:
+        try:
+            import openpyxl
+        except ImportError:
+            print("需要安裝 openpyxl 才能產生 Excel 活頁簿：pip install openpyxl")
+            return None
+    rng = np.random.default_rng(seed)
+    os.makedirs(output_dir, exist_ok=True)
+    width = max(len(str(regions)), 2)
+    county_ids = [f'{index + 1:0{width}d}' for index in range(regions)]
+    names = region_names(regions)
+    rings, centers = generate_geometry(regions, vertices, rng)
+    values = generate_language_data(centers, rng)
+    populations = generate_populations(regions, rng)
+
+    paths = {
+        'geojson': os.path.join(output_dir, 'synthetic.geo.json'),
+        'counties': os.path.join(output_dir, 'counties.json'),
+        'csv': os.path.join(output_dir, 'language_data.csv')
+    }
+    write_geojson(paths['geojson'], names, rings, rng)
+    write_registry(paths['counties'], county_ids, names, centers)
+    write_language_csv(paths['csv'], names, values, rng, unmatched)
+    # 活頁簿平均分布在各處，每個區域資料夾都有
+    for index in np.unique(np.linspace(0, regions - 1, min(workbooks, regions)).astype(int)):
+        folder = os.path.join(output_dir, region_folder(centers[index]))
+        os.makedirs(folder, exist_ok=True)
+        # 活頁簿的調查年份不同，數值相對CSV略有變化
+        workbook_values = np.clip(values[index] + rng.normal(0, 1, len(LANGUAGES)), 0, 99.9)
+        write_workbook(os.path.join(folder, f'{county_ids[index]}.xlsx'), name_variant(names[index], rng),
+                       populations[index], workbook_values, township_rows, rng)
+
+    print(f"已產生 {regions:,} 個合成區域（每區 {rings.shape[1] - 1} 個頂點、{min(workbooks, regions):,} 個活頁簿）"
+          f"到 '{output_dir}'，邊界 {os.path.getsize(paths['geojson']):,} bytes")
+    return paths
+
+def run(args):
+    """synthetic 子命令：產生合成數據並列出以其產生地圖的命令"""
+    paths = generate_dataset(args.output_dir, args.regions, args.vertices, args.seed, args.unmatched,
+                             args.workbooks, args.township_rows)
+    if paths:
+        print("產生地圖：python taiwan_language_map_new.py build "
+              f"--data-dir {args.output_dir} --counties {paths['counties']} --geojson-url {paths['geojson']} "
+              f"--output {os.path.join(args.output_dir, 'map.html')}")
+    return paths
@@ -0,0 +1,279 @@
+"""將邊界數據切成向量圖磚（Mapbox Vector Tile，{z}/{x}/{y}.pbf）
+
+鄉鎮市區或村里等細緻邊界不適合整份內嵌在頁面中。這裡依縮放等級簡化邊界，
+投影到 Web Mercator 圖磚座標、以圖磚範圍（含緩衝區）裁切，再直接以
+protobuf 格式編碼，不需要額外的套件。瀏覽器只下載目前視野內的圖磚，
+記憶體與解析時間不會隨邊界的精細程度增加。
+"""
+import json
+import math
+import os
+import shutil
+import struct
+import tempfile
+
+import map_geometry
+
+EXTENT = 4096  # 圖磚內的座標範圍
+BUFFER = 64  # 裁切時保留的圖磚外緩衝，避免相鄰圖磚接縫處出現細線
+DEFAULT_MIN_ZOOM = 8
+DEFAULT_MAX_ZOOM = 12
+
+# MVT 幾何指令與幾何類型
+MOVE_TO = 1
+LINE_TO = 2
+CLOSE_PATH = 7
+POLYGON = 3
+
+# ---- protobuf 編碼 ----
+
+def _varint(value):
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+def _zigzag(value):
+    return (value << 1) ^ (value >> 63)
+
+def _key(field, wire_type):
+    return _varint((field << 3) | wire_type)
+
+def _bytes_field(field, data):
+    return _key(field, 2) + _varint(len(data)) + data
+
+def _varint_field(field, value):
+    return _key(field, 0) + _varint(value)
+
+def _packed_field(field, values):
+    return _bytes_field(field, b''.join(_varint(value) for value in values))
+
+def _encode_value(value):
+    """屬性值：字串、布林、非負整數或浮點數"""
+    if isinstance(value, bool):
+        return _varint_field(7, int(value))
+    if isinstance(value, int) and value >= 0:
+        return _varint_field(5, value)
+    if isinstance(value, (int, float)):
+        return _key(3, 1) + struct.pack('<d', float(value))
+    return _bytes_field(1, str(value).encode('utf-8'))
+
+def encode_layer(name, features, extent=EXTENT):
+    """編碼一個圖層，features 為 (id, 屬性, 幾何指令) 列表"""
+    keys = {}
+    values = {}
+    body = [_bytes_field(1, name.encode('utf-8'))]
+    for feature_id, properties, geometry in features:
+        tags = []
+        for key, value in properties.items():
+            if value is None:
+                continue
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value).__name__, value), len(values)))
+        feature = _varint_field(1, feature_id) + _packed_field(2, tags) + _varint_field(3, POLYGON) + \
+            _packed_field(4, geometry)
+        body.append(_bytes_field(2, feature))
+    body.extend(_bytes_field(3, key.encode('utf-8')) for key in keys)
+    body.extend(_bytes_field(4, _encode_value(value)) for _, value in values)
+    body.append(_varint_field(5, extent))
+    body.append(_varint_field(15, 2))
+    return b''.join(body)
+
+def encode_tile(layers):
+    """編碼整個圖磚，layers 為 {圖層名稱: features}"""
+    return b''.join(_bytes_field(3, encode_layer(name, features)) for name, features in layers.items())
+
+# ---- 投影、裁切與幾何指令 ----
+
+def _iter_polygons(geometry):
+    """將 Polygon / MultiPolygon 統一為多邊形列表"""
+    if not geometry:
+        return []
+    if geometry['type'] == 'Polygon':
+        return [geometry['coordinates']]
+    if geometry['type'] == 'MultiPolygon':
+        return geometry['coordinates']
+    return []
+
+def project(lon, lat, zoom):
+    """經緯度 -> 指定縮放等級下以圖磚為單位的 Web Mercator 座標"""
+    n = 2 ** zoom
+    lat = max(min(lat, 85.0511), -85.0511)
+    x = (lon + 180.0) / 360.0 * n
+    y = (1.0 - math.log(math.tan(math.radians(lat)) + 1 / math.cos(math.radians(lat))) / math.pi) / 2.0 * n
+    return x, y
+
+def _clip_ring(ring, low, high):
+    """Sutherland-Hodgman：以正方形 [low, high] 裁切一個環"""
+    def clip(points, inside, intersect):
+        if not points:
+            return points
+        result = []
+        previous = points[-1]
+        for point in points:
+            if inside(point):
+                if not inside(previous):
+                    result.append(intersect(previous, point))
+                result.append(point)
+            elif inside(previous):
+                result.append(intersect(previous, point))
+            previous = point
+        return result
+
+    def at_x(x):
+        return lambda a, b: (x, a[1] + (b[1] - a[1]) * (x - a[0]) / (b[0] - a[0]))
+
+    def at_y(y):
+        return lambda a, b: (a[0] + (b[0] - a[0]) * (y - a[1]) / (b[1] - a[1]), y)
+
+    ring = clip(ring, lambda p: p[0] >= low, at_x(low))
+    ring = clip(ring, lambda p: p[0] <= high, at_x(high))
+    ring = clip(ring, lambda p: p[1] >= low, at_y(low))
+    return clip(ring, lambda p: p[1] <= high, at_y(high))
+
+def _ring_area(ring):
+    return sum(ring[i - 1][0] * ring[i][1] - ring[i][0] * ring[i - 1][1] for i in range(len(ring))) / 2
+
+def _ring_commands(ring, cursor):
+    """將一個環編碼為 MoveTo / LineTo / ClosePath 指令，座標以相對位移表示"""
+    commands = []
+    for index, (x, y) in enumerate(ring):
+        if index == 0:
+            commands.append(MOVE_TO | (1 << 3))
+        elif index == 1:
+            commands.append(LINE_TO | ((len(ring) - 1) << 3))
+        commands.append(_zigzag(x - cursor[0]))
+        commands.append(_zigzag(y - cursor[1]))
+        cursor = (x, y)
+    commands.append(CLOSE_PATH | (1 << 3))
+    return commands, cursor
+
+def _tile_ring(ring, offset_x, offset_y, exterior):
+    """將已投影的環移到圖磚座標、裁切並取整數，退化的環返回None"""
+    local = [((x - offset_x) * EXTENT, (y - offset_y) * EXTENT) for x, y in ring]
+    clipped = _clip_ring(local, -BUFFER, EXTENT + BUFFER)
+    points = []
+    for x, y in clipped:
+        point = (int(round(x)), int(round(y)))
+        if not points or points[-1] != point:
+            points.append(point)
+    if len(points) > 1 and points[0] == points[-1]:
+        points.pop()
+    if len(points) < 3:
+        return None
+    area = _ring_area(points)
+    if area == 0:
+        return None
+    # MVT 規範：外環在圖磚座標（y 向下）中面積為正，內環為負
+    if (area > 0) != exterior:
+        points.reverse()
+    return points
+
+def _feature_tiles(polygons, zoom):
+    """投影一個要素的所有多邊形，返回 (投影後的多邊形, 涵蓋的圖磚範圍)"""
+    # GeoJSON 的環首尾相同，投影時去掉重複的終點
+    projected = [[[project(pt[0], pt[1], zoom) for pt in (ring[:-1] if ring[0] == ring[-1] else ring)]
+                  for ring in polygon if ring] for polygon in polygons]
+    xs = [x for polygon in projected if polygon for x, _ in polygon[0]]
+    ys = [y for polygon in projected if polygon for _, y in polygon[0]]
+    if not xs:
+        return projected, None
+    margin = BUFFER / EXTENT
+    n = 2 ** zoom
+    return projected, (max(int(min(xs) - margin), 0), max(int(min(ys) - margin), 0),
+                       min(int(max(xs) + margin), n - 1), min(int(max(ys) + margin), n - 1))
+
+def tile_features(geojson, zoom):
+    """將一個縮放等級的 GeoJSON 切成圖磚，返回 {(x, y): [(id, 屬性, 幾何指令)]}"""
+    tiles = {}
+    for feature_id, feature in enumerate(geojson['features'], 1):
+        polygons = _iter_polygons(feature.get('geometry'))
+        projected, bounds = _feature_tiles(polygons, zoom)
+        if not bounds:
+            continue
+        min_x, min_y, max_x, max_y = bounds
+        for tile_x in range(min_x, max_x + 1):
+            for tile_y in range(min_y, max_y + 1):
+                commands = []
+                cursor = (0, 0)
+                for polygon in projected:
+                    if not polygon:
+                        continue
+                    exterior = _tile_ring(polygon[0], tile_x, tile_y, True)
+                    if exterior is None:
+                        continue
+                    for index, ring in enumerate(polygon):
+                        points = exterior if index == 0 else _tile_ring(ring, tile_x, tile_y, False)
+                        if points:
+                            ring_commands, cursor = _ring_commands(points, cursor)
+                            commands.extend(ring_commands)
+                if commands:
+                    tiles.setdefault((tile_x, tile_y), []).append((feature_id, feature['properties'], commands))
+    return tiles
+
+def _write_pyramid(levels, tile_dir, layer_name):
+    """將各縮放等級的要素切成圖磚寫入 tile_dir，返回 (圖磚數, 位元組數)"""
+    count = 0
+    total_bytes = 0
+    for zoom, level_geojson in levels.items():
+        for (tile_x, tile_y), features in tile_features(level_geojson, zoom).items():
+            tile_path = os.path.join(tile_dir, str(zoom), str(tile_x), f'{tile_y}.pbf')
+            os.makedirs(os.path.dirname(tile_path), exist_ok=True)
+            data = encode_tile({layer_name: features})
+            with open(tile_path, 'wb') as file:
+                file.write(data)
+            count += 1
+            total_bytes += len(data)
+    return count, total_bytes
+
+def write_tiles(geojson, tile_dir, layer_name, min_zoom=DEFAULT_MIN_ZOOM, max_zoom=DEFAULT_MAX_ZOOM,
+                precision=map_geometry.DEFAULT_PRECISION, method='dp'):
+    """依縮放等級簡化並輸出圖磚金字塔（tile_dir/{z}/{x}/{y}.pbf）與 metadata.json
+
+    要素的屬性會原樣寫入圖磚（None 除外），供頁面設定樣式與彈窗。
+    圖磚先寫到同一層目錄中的暫存目錄，完成後才取代 tile_dir，
+    上次產生、這次不再產生的縮放等級或圖磚不會留下來。
+    """
+    zooms = range(min_zoom, max_zoom + 1)
+    levels = map_geometry.build_zoom_levels(geojson, zooms=zooms, precision=precision, method=method)
+    tile_dir = os.path.abspath(tile_dir)
+    parent_dir = os.path.dirname(tile_dir)
+    os.makedirs(parent_dir, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(prefix='.tiles-', dir=parent_dir)
+    os.chmod(staging_dir, 0o755)  # mkdtemp 只允許擁有者讀取，圖磚目錄要能由網頁伺服器讀取
+    try:
+        count, total_bytes = _write_pyramid(levels, staging_dir, layer_name)
+    except BaseException:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+    points = [pt for feature in geojson['features']
+              for polygon in _iter_polygons(feature.get('geometry'))
+              for pt in polygon[0]]
+    metadata = {
+        'format': 'pbf',
+        'layer': layer_name,
+        'minzoom': min_zoom,
+        'maxzoom': max_zoom,
+        'bounds': [min(pt[0] for pt in points), min(pt[1] for pt in points),
+                   max(pt[0] for pt in points), max(pt[1] for pt in points)] if points else None,
+        'tiles': count,
+        'bytes': total_bytes
+    }
+    with open(os.path.join(staging_dir, 'metadata.json'), 'w', encoding='utf-8') as file:
+        json.dump(metadata, file, ensure_ascii=False, indent=2)
+    # 新的圖磚就緒後才移除舊的目錄
+    if os.path.exists(tile_dir):
+        previous_dir = tempfile.mkdtemp(prefix='.tiles-old-', dir=parent_dir)
+        os.rename(tile_dir, os.path.join(previous_dir, 'tiles'))
+        os.rename(staging_dir, tile_dir)
+        shutil.rmtree(previous_dir, ignore_errors=True)
+    else:
+        os.rename(staging_dir, tile_dir)
+    print(f"已產生 {count} 個向量圖磚（縮放等級 {min_zoom}-{max_zoom}，{total_bytes:,} bytes）到 '{tile_dir}'")
+    return metadata
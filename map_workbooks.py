@@ -0,0 +1,237 @@
+"""讀取 Language_data 各區域資料夾中的縣市 Excel 活頁簿（鄉鎮市區層級數據）
+
+每個活頁簿是一個縣市的「６歲以上本國籍常住人口使用語言情形」表，
+「按鄉鎮市區別分」段落的第一列是縣市合計，其後每列是一個鄉鎮市區。
+與 language_data.csv 相同，各語言的比例為主要使用與次要使用之和。
+
+解析時依下方宣告的格式檢查表頭、數值範圍與人口合計，問題記錄在結果的 issues 中；
+多個活頁簿可以用 parse_workbooks 在程序池中同時解析。conclude.xlsx 與
+language_data.csv 是同一種縣市總表，由 read_summary_workbook / read_summary_csv 讀取。
+"""
+import csv
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# 各語言在表格中的欄位位置（主要使用、次要使用）
+PRIMARY_COLUMNS = {'華語': 3, '閩南語': 4, '客家話': 5, '原住民語': 6}
+SECONDARY_COLUMNS = {'華語': 9, '閩南語': 10, '客家話': 11, '原住民語': 12}
+NAME_COLUMN = 1
+POPULATION_COLUMN = 2
+TOWNSHIP_SECTION = '按鄉鎮市區別分'
+INDENT = '　'
+
+# 活頁簿的格式：表頭中各語言的名稱（主要與次要使用的欄位相同）、比例的範圍（主要+次要），
+# 以及縣市合計與鄉鎮市區人口合計容許的差距
+LANGUAGE_HEADERS = {'華語': '國語', '閩南語': '閩南語', '客家話': '客語', '原住民語': '原住民族語'}
+VALUE_RANGE = (0, 100)
+POPULATION_TOLERANCE = 0
+
+# 縣市總表（language_data.csv、conclude.xlsx）：第一列為標題，第二列為欄位名稱；
+# 必須有以下欄位，其他有名稱的欄位視為另外登錄的語言
+SUMMARY_WORKBOOK = 'conclude.xlsx'
+SUMMARY_HEADER = ('市縣', '華語', '閩南語', '客家話', '原住民語', '備注')
+
+# 交叉檢查時容許的差距（百分點）；各列的比例四捨五入到0.1，加權平均會有少許誤差
+CROSS_CHECK_TOLERANCE = 0.2
+
+def find_county_workbooks(data_dir):
+    """列出各區域資料夾中的縣市活頁簿，返回 (區域, 路徑) 列表"""
+    workbooks = []
+    for path in sorted(glob.glob(os.path.join(data_dir, '*', '*.xlsx'))):
+        workbooks.append((os.path.basename(os.path.dirname(path)), path))
+    return workbooks
+
+def _to_number(value):
+    """將儲存格的值轉為數字，空白或非數字視為0"""
+    if isinstance(value, (int, float)):
+        return value
+    try:
+        return float(str(value).strip())
+    except (TypeError, ValueError):
+        return 0
+
+def _row_language_data(row):
+    """合計一列中各語言的主要及次要使用比例"""
+    return {
+        lang: round(_to_number(row[PRIMARY_COLUMNS[lang]]) + _to_number(row[SECONDARY_COLUMNS[lang]]), 1)
+        for lang in PRIMARY_COLUMNS
+    }
+
+def _row_issues(row, name):
+    """檢查一列的人口與各語言比例，返回問題列表"""
+    issues = []
+    if not isinstance(row[POPULATION_COLUMN], (int, float)) or row[POPULATION_COLUMN] <= 0:
+        issues.append(f"{name}：人口不是正數（{row[POPULATION_COLUMN]!r}）")
+    for lang in PRIMARY_COLUMNS:
+        cells = (row[PRIMARY_COLUMNS[lang]], row[SECONDARY_COLUMNS[lang]])
+        if not all(isinstance(cell, (int, float)) for cell in cells):
+            issues.append(f"{name}：{lang}的比例不是數字（{cells[0]!r}、{cells[1]!r}）")
+        elif not VALUE_RANGE[0] <= cells[0] + cells[1] <= VALUE_RANGE[1]:
+            issues.append(f"{name}：{lang}的比例超出範圍（{round(cells[0] + cells[1], 1)}）")
+    return issues
+
+def _is_header_row(row):
+    """各語言的主要與次要使用欄位都是宣告的名稱"""
+    return all(row[PRIMARY_COLUMNS[lang]] == label and row[SECONDARY_COLUMNS[lang]] == label
+               for lang, label in LANGUAGE_HEADERS.items())
+
+def _find_year(rows):
+    """表頭第一列含有西元年份"""
+    for value in rows[0] if rows else ():
+        if isinstance(value, int) and 1900 < value < 2100:
+            return value
+    return None
+
+def parse_county_workbook(path):
+    """解析單一縣市活頁簿，返回縣市合計、各鄉鎮市區的語言數據、表尾註解與格式問題"""
+    try:
+        import openpyxl
+    except ImportError:
+        print("需要安裝 openpyxl 才能讀取 Excel 活頁簿：pip install openpyxl")
+        return None
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    result = {'county': None, 'year': None, 'population': None, 'data': None, 'townships': [], 'note': None,
+              'issues': []}
+    has_header = False
+    try:
+        for sheet in workbook.worksheets:
+            rows = list(sheet.iter_rows(values_only=True))
+            result['year'] = result['year'] or _find_year(rows)
+            in_section = False
+            for row in rows:
+                if len(row) <= max(SECONDARY_COLUMNS.values()):
+                    continue
+                has_header = has_header or _is_header_row(row)
+                name = row[NAME_COLUMN]
+                if not isinstance(name, str):
+                    continue
+                # 名稱中的全形空白只用於縮排與對齊（例如「東　區」）
+                stripped = name.replace(INDENT, '').strip()
+                # 「按性別分」「按年齡分」等其他段落或表尾註解時結束
+                if stripped.startswith('按') or stripped.startswith('註'):
+                    in_section = stripped == TOWNSHIP_SECTION
+                    if stripped.startswith('註'):
+                        result['note'] = result['note'] or stripped
+                    continue
+                if not in_section or not name.startswith(INDENT):
+                    continue
+                depth = len(name) - len(name.lstrip(INDENT))
+                result['issues'].extend(_row_issues(row, stripped))
+                record = {
+                    'name': stripped,
+                    'population': int(_to_number(row[POPULATION_COLUMN])),
+                    'data': _row_language_data(row)
+                }
+                if depth == 1:
+                    result['county'] = record['name']
+                    result['population'] = record['population']
+                    result['data'] = record['data']
+                else:
+                    result['townships'].append(record)
+    finally:
+        workbook.close()
+
+    if not result['county']:
+        print(f"活頁簿中找不到鄉鎮市區數據：{path}")
+        return None
+    if not has_header:
+        result['issues'].append(f"找不到語言欄位的表頭（{'、'.join(LANGUAGE_HEADERS.values())}）")
+    if result['year'] is None:
+        result['issues'].append("表頭中沒有調查年份")
+    if not result['townships']:
+        result['issues'].append("沒有鄉鎮市區的數據列")
+    names = [township['name'] for township in result['townships']]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        result['issues'].append(f"鄉鎮市區名稱重複（編譯時只保留第一列）：{'、'.join(duplicates)}")
+    total = sum(township['population'] for township in result['townships'])
+    if result['townships'] and abs(total - result['population']) > POPULATION_TOLERANCE:
+        result['issues'].append(f"鄉鎮市區人口合計 {total:,} 與縣市合計 {result['population']:,} 不符")
+    return result
+
+def _timed_parse(path):
+    """解析一個活頁簿並計時；無法讀取的檔案（損壞、被鎖定或不是 xlsx）記為格式問題，不中斷其他活頁簿"""
+    start = time.perf_counter()
+    try:
+        result = parse_county_workbook(path)
+    except Exception as e:
+        result = {'county': None, 'year': None, 'population': None, 'data': None, 'townships': [], 'note': None,
+                  'issues': [f"無法讀取：{e}"]}
+    return result, time.perf_counter() - start
+
+def parse_workbooks(paths, workers=None):
+    """以程序池同時解析多個活頁簿，返回與 paths 順序相同的 [(結果, 解析秒數)]
+
+    workers 為 1 或只有一個活頁簿時在目前程序中依序解析。
+    """
+    if workers == 1 or len(paths) <= 1:
+        return [_timed_parse(path) for path in paths]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(_timed_parse, paths))
+
+def township_average(workbook):
+    """以人口加權平均各鄉鎮市區的語言比例，沒有鄉鎮市區或人口時返回None"""
+    total = sum(township['population'] for township in workbook['townships'])
+    if not total:
+        return None
+    return {
+        lang: sum(township['data'].get(lang, 0) * township['population'] for township in workbook['townships']) / total
+        for lang in PRIMARY_COLUMNS
+    }
+
+def cross_check(expected, actual, tolerance=CROSS_CHECK_TOLERANCE):
+    """比較兩組語言比例，返回差距超過 tolerance 的 [(語言, 預期, 實際)]"""
+    return [(lang, expected[lang], round(actual[lang], 2)) for lang in PRIMARY_COLUMNS
+            if lang in expected and lang in actual and abs(expected[lang] - actual[lang]) > tolerance]
+
+def _summary_records(rows):
+    """縣市總表的數據列，返回 ({縣市名稱: {'data': 語言比例, 'note': 備註}}, 格式問題)"""
+    issues = []
+    header = tuple(str(cell).strip() if cell is not None else '' for cell in (rows[1] if len(rows) > 1 else ()))
+    if not header or header[0] != SUMMARY_HEADER[0] or not set(SUMMARY_HEADER) <= set(header):
+        issues.append(f"欄位名稱應包含 {'、'.join(SUMMARY_HEADER)}（實際為 {'、'.join(header)}）")
+    note_column = header.index(SUMMARY_HEADER[-1]) if SUMMARY_HEADER[-1] in header else None
+    language_columns = [(column, lang) for column, lang in enumerate(header)
+                        if column and column != note_column and lang]
+    records = {}
+    for row in rows[2:]:
+        if not row or row[0] is None or not str(row[0]).strip():
+            continue
+        name = str(row[0]).strip()
+        data = {}
+        for column, lang in language_columns:
+            value = row[column] if len(row) > column else None
+            try:
+                data[lang] = float(value)
+            except (TypeError, ValueError):
+                issues.append(f"{name}：{lang}的比例不是數字（{value!r}）")
+                continue
+            if not VALUE_RANGE[0] <= data[lang] <= VALUE_RANGE[1]:
+                issues.append(f"{name}：{lang}的比例超出範圍（{data[lang]}）")
+        if name in records:
+            issues.append(f"{name}：重複的數據列")
+        note = row[note_column] if note_column is not None and len(row) > note_column else None
+        note = note if note is not None and str(note).strip() else None
+        records[name] = {'data': data, 'note': str(note).strip() if note else None}
+    return records, issues
+
+def read_summary_csv(path):
+    """讀取縣市總表CSV（language_data.csv），返回 (數據列, 格式問題)"""
+    with open(path, 'r', encoding='utf-8-sig', newline='') as file:
+        return _summary_records(list(csv.reader(file)))
+
+def read_summary_workbook(path):
+    """讀取縣市總表活頁簿（conclude.xlsx）的第一個工作表，返回 (數據列, 格式問題)，無法讀取時返回None"""
+    try:
+        import openpyxl
+    except ImportError:
+        print("需要安裝 openpyxl 才能讀取 Excel 活頁簿：pip install openpyxl")
+        return None
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        return _summary_records(list(workbook.worksheets[0].iter_rows(values_only=True)))
+    finally:
+        workbook.close()
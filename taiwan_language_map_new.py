@@ -1,18 +1,153 @@
-import folium
 import json
-import requests
 import csv
+import glob
 import os
+import time
+import hashlib
+import argparse
+import sys
+import threading
+import map_analytics
+import map_geometry
+import map_instrument
+import map_tiles
+import map_store
+import map_synthetic
+import map_workbooks
+
+# 地理數據來源與本地快取設定
+GEOJSON_URL = "https://raw.githubusercontent.com/g0v/twgeojson/master/json/twCounty2010.geo.json"
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GEOJSON_CACHE_DIR = os.path.join(BASE_DIR, '.geojson_cache')
+COUNTIES_PATH = os.path.join(BASE_DIR, 'taiwan_counties.json')
+LANGUAGES_PATH = os.path.join(BASE_DIR, 'taiwan_languages.json')
+DATA_DIR = os.path.join(BASE_DIR, 'Language_data')
+LANGUAGE_CSV_PATH = os.path.join(DATA_DIR, 'language_data.csv')
+CSV_NOTE_HEADER = '備注'  # language_data.csv 的備註欄位名稱
+YEAR_CSV_PATTERN = 'language_data_*.csv'  # 其他調查年份的縣市數據，例如 language_data_2020.csv
+STORE_PATH = os.path.join(DATA_DIR, 'language_data.sqlite')
+
+# 鄉鎮市區邊界（1982年版，縣市合併前的名稱以 township_key 對應）
+TOWNSHIP_GEOJSON_URL = "https://raw.githubusercontent.com/g0v/twgeojson/master/json/twTown1982.geo.json"
+TOWNSHIP_NAME_KEYS = ('TOWNNAME', 'town', 'name')
+TOWNSHIP_COUNTY_KEYS = ('COUNTYNAME', 'county')
+TOWNSHIP_TARGET_ZOOM = 13
+GEOJSON_CACHE_TTL = 7 * 24 * 3600  # 快取有效期（秒），過期後才向伺服器重新驗證
+GEOJSON_TIMEOUT = 10  # 網路請求逾時（秒）
+
+def _load_cache_index(cache_dir):
+    """讀取快取索引（URL -> 快取物件與驗證資訊）"""
+    index_path = os.path.join(cache_dir, 'index.json')
+    try:
+        with open(index_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def _save_cache_index(cache_dir, index):
+    """以原子方式寫入快取索引，避免中斷時留下損壞的檔案"""
+    index_path = os.path.join(cache_dir, 'index.json')
+    tmp_path = index_path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as file:
+        json.dump(index, file, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, index_path)
+
+def _store_cache_object(cache_dir, content):
+    """以內容雜湊值為檔名保存數據，相同內容只會保存一份"""
+    digest = hashlib.sha256(content).hexdigest()
+    objects_dir = os.path.join(cache_dir, 'objects')
+    os.makedirs(objects_dir, exist_ok=True)
+    object_path = os.path.join(objects_dir, digest + '.json')
+    if not os.path.exists(object_path):
+        tmp_path = object_path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(content)
+        os.replace(tmp_path, object_path)
+    return digest
+
+def _read_cache_object(cache_dir, entry):
+    """讀取快取物件並驗證雜湊值，損壞或遺失時返回None"""
+    if not entry or 'sha256' not in entry:
+        return None
+    object_path = os.path.join(cache_dir, 'objects', entry['sha256'] + '.json')
+    try:
+        with open(object_path, 'rb') as file:
+            content = file.read()
+    except FileNotFoundError:
+        return None
+    if hashlib.sha256(content).hexdigest() != entry['sha256']:
+        print(f"快取檔案已損壞，將忽略：{object_path}")
+        return None
+    return json.loads(content.decode('utf-8'))
+
+def download_taiwan_geojson(url=GEOJSON_URL, cache_dir=GEOJSON_CACHE_DIR, ttl=GEOJSON_CACHE_TTL,
+                            offline=False, timeout=GEOJSON_TIMEOUT):
+    """下載台灣縣市邊界的 GeoJSON 數據
+
+    數據會以內容雜湊值保存在本地快取中：快取未過期時直接使用；
+    過期後以 ETag / Last-Modified 向伺服器做條件式請求，未變更則沿用快取。
+    離線模式（或設定環境變數 TAIWAN_MAP_OFFLINE=1）只讀取快取，因此需要先連網下載過一次；
+    網路與快取都不可用時返回None。
+    url 為本地檔案路徑時（例如 map_synthetic 產生的測試數據）直接讀取，不經過快取。
+    """
+    if os.path.isfile(url):
+        with open(url, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    offline = offline or os.environ.get('TAIWAN_MAP_OFFLINE') == '1'
+    index = _load_cache_index(cache_dir)
+    entry = index.get(url)
+    cached = _read_cache_object(cache_dir, entry)
+
+    if offline:
+        if cached is not None:
+            map_instrument.count('geojson_cache_hits')
+            return cached
+        print(f"離線模式：本地快取（{cache_dir}）中沒有地理數據，請先連網執行一次以下載，"
+              f"或以 --geojson-url 指定本地檔案")
+        return None
+
+    if cached is not None and time.time() - entry.get('fetched_at', 0) < ttl:
+        map_instrument.count('geojson_cache_hits')
+        return cached
+
+    # 條件式請求：若伺服器內容未變更會返回304
+    headers = {}
+    if cached is not None:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
 
-def download_taiwan_geojson():
-    """下載台灣縣市邊界的 GeoJSON 數據"""
-    url = "https://raw.githubusercontent.com/g0v/twgeojson/master/json/twCounty2010.geo.json"
     try:
-        response = requests.get(url)
+        import requests
+        response = requests.get(url, headers=headers, timeout=timeout)
+        map_instrument.count('geojson_requests')
+        if response.status_code == 304 and cached is not None:
+            map_instrument.count('geojson_cache_hits')
+            entry['fetched_at'] = time.time()
+            _save_cache_index(cache_dir, index)
+            return cached
         response.raise_for_status()
-        return response.json()
+        taiwan_geojson = response.json()
+        map_instrument.count('geojson_bytes_downloaded', len(response.content))
+
+        os.makedirs(cache_dir, exist_ok=True)
+        digest = _store_cache_object(cache_dir, response.content)
+        index[url] = {
+            'sha256': digest,
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'fetched_at': time.time()
+        }
+        _save_cache_index(cache_dir, index)
+        return taiwan_geojson
     except Exception as e:
         print(f"無法下載台灣地理數據：{e}")
+        if cached is not None:
+            print("改用本地快取的地理數據（可能已過期）")
+            map_instrument.count('geojson_cache_hits')
+            return cached
+        print(f"本地快取（{cache_dir}）中也沒有地理數據，請在可連網時重新執行，或以 --geojson-url 指定本地檔案")
         return None
 
 def normalize_county_name(name):
@@ -41,49 +176,119 @@ def normalize_county_name(name):
     
     return county_city_mapping.get(name, name)
 
-def load_language_data():
-    """從CSV文件載入真實的語言使用數據"""
+def load_county_registry(path=COUNTIES_PATH):
+    """讀取縣市代碼表，返回（標準化名稱 -> county_id，county_id -> 名稱）"""
+    county_ids = {}
+    county_names = {}
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            registry = json.load(file)
+    except FileNotFoundError:
+        print(f"找不到縣市代碼表: {path}")
+        return {}, {}
+    for feature in registry['features']:
+        properties = feature['properties']
+        county_ids[normalize_county_name(properties['name'])] = properties['county_id']
+        county_names[properties['county_id']] = properties['name']
+    return county_ids, county_names
+
+def load_language_registry(path=LANGUAGES_PATH):
+    """讀取語言登錄表，整理成頁面與樣式共用的查詢表
+
+    languages 為顯示順序，colors 與 slugs 以語言名稱為鍵；modes 為依主要語言填色的
+    顯示模式 (模式, 說明)，exclusions 為各模式排除的語言（例如排除華語）。
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as file:
+            registry = json.load(file)
+    except FileNotFoundError:
+        print(f"找不到語言登錄表: {path}")
+        registry = {'languages': [], 'modes': [{'mode': 'normal', 'label': '主要語言', 'exclude': []}]}
+    return {
+        'languages': [entry['name'] for entry in registry['languages']],
+        'colors': {entry['name']: entry['color'] for entry in registry['languages']},
+        'slugs': {entry['name']: entry['slug'] for entry in registry['languages'] if entry.get('slug')},
+        'default_color': registry.get('default_color', '#4188e0'),
+        'modes': [(entry['mode'], entry['label']) for entry in registry['modes']],
+        'mode_slugs': {entry['mode']: entry['slug'] for entry in registry['modes'] if entry.get('slug')},
+        'exclusions': {entry['mode']: list(entry.get('exclude', [])) for entry in registry['modes']}
+    }
+
+def resolve_county_id(name, county_ids):
+    """將各種寫法的縣市名稱對應到縣市代碼，找不到時返回None"""
+    if not name:
+        return None
+    normalized_name = normalize_county_name(name.strip())
+    # 縣改制為市（例如 臺中縣 -> 臺中市）
+    for candidate in (normalized_name, normalized_name.replace('縣', '市')):
+        if candidate in county_ids:
+            return county_ids[candidate]
+    return None
+
+def join_county_ids(taiwan_geojson, county_ids):
+    """將每個地理區域對應到縣市代碼，寫入 properties['county_id']
+
+    只在載入地理數據時執行一次，之後 Python 與網頁都直接以代碼查詢數據。
+    返回新的 GeoJSON 與無法對應的名稱列表（原數據不會被修改）。
+    """
+    features = []
+    unmatched = []
+    for feature in taiwan_geojson['features']:
+        properties = dict(feature['properties'])
+        county_id = resolve_county_id(properties.get('COUNTYNAME'), county_ids)
+        if county_id:
+            properties['county_id'] = county_id
+        else:
+            unmatched.append(properties.get('COUNTYNAME'))
+        features.append(dict(feature, properties=properties))
+    if unmatched:
+        print(f"無法對應縣市代碼的地理區域：{'、'.join(str(name) for name in unmatched)}")
+    map_instrument.count('features_joined', len(features) - len(unmatched))
+    map_instrument.count('names_unmatched', len(unmatched))
+    return dict(taiwan_geojson, features=features), unmatched
+
+def read_language_csv(csv_path, county_ids):
+    """從CSV文件讀取真實的語言使用數據，以縣市代碼為鍵"""
     language_data = {}
     language_notes = {}
     
-    # 獲取CSV文件路徑
-    csv_path = os.path.join(os.path.dirname(__file__), 'language_data.csv')
-    
     try:
         with open(csv_path, 'r', encoding='utf-8') as file:
             reader = csv.reader(file)
             rows = list(reader)
             
+            # 第二行是欄位名稱：第一欄為縣市、「備注」欄為備註，其餘有名稱的欄位都是語言
+            header = [cell.strip() for cell in rows[1]] if len(rows) > 1 else []
+            note_column = header.index(CSV_NOTE_HEADER) if CSV_NOTE_HEADER in header else None
+            language_columns = [(column, name) for column, name in enumerate(header)
+                                if column and name and column != note_column]
+            
             # 跳過標題行（前兩行）
             for row in rows[2:]:
-                if len(row) >= 5 and row[0].strip():  # 確保有足夠的欄位且縣市名稱不為空
+                if row and row[0].strip():  # 縣市名稱不為空
                     county = row[0].strip()
                     try:
-                        mandarin = float(row[1].strip()) if row[1].strip() else 0
-                        taiwanese = float(row[2].strip()) if row[2].strip() else 0
-                        hakka = float(row[3].strip()) if row[3].strip() else 0
-                        indigenous = float(row[4].strip()) if row[4].strip() else 0
-                        note = row[5].strip() if len(row) > 5 and row[5].strip() else None
-                        
-                        # 處理縣市名稱標準化
-                        normalized_county = normalize_county_name(county)
-                        
-                        # 儲存語言數據
+                        # 儲存語言數據，空白的欄位視為0
                         lang_dict = {
-                            "華語": mandarin,
-                            "閩南語": taiwanese,
-                            "客家話": hakka,
-                            "原住民語": indigenous
+                            name: float(row[column].strip()) if column < len(row) and row[column].strip() else 0
+                            for column, name in language_columns
                         }
+                        note = (row[note_column].strip() if note_column is not None and len(row) > note_column
+                                and row[note_column].strip() else None)
+                        
+                        # 以縣市代碼保存，每個縣市只保存一份
+                        county_id = resolve_county_id(county, county_ids)
+                        if not county_id:
+                            print(f"無法對應縣市代碼的數據列：{county}")
+                            map_instrument.count('names_unmatched')
+                            continue
                         
-                        # 同時保存原始名稱和標準化名稱
-                        language_data[county] = lang_dict
-                        language_data[normalized_county] = lang_dict
+                        language_data[county_id] = lang_dict
+                        map_instrument.count('csv_rows_read')
                         
                         # 保存備註信息
                         if note:
-                            language_notes[county] = note
-                            language_notes[normalized_county] = note
+                            language_notes[county_id] = note
                             
                     except ValueError as e:
                         print(f"數據轉換錯誤 - {county}: {e}")
@@ -96,21 +301,398 @@ def load_language_data():
         print(f"讀取CSV文件錯誤: {e}")
         return {}, {}
     
+    return language_data, language_notes
+
+def find_year_csvs(data_dir=DATA_DIR):
+    """列出其他調查年份的縣市CSV，返回 (年份, 路徑) 列表"""
+    year_csvs = []
+    for path in sorted(glob.glob(os.path.join(data_dir, YEAR_CSV_PATTERN))):
+        year = os.path.splitext(os.path.basename(path))[0].rsplit('_', 1)[-1]
+        if year.isdigit():
+            year_csvs.append((int(year), path))
+        else:
+            print(f"無法從檔名判斷調查年份，略過：{path}")
+    return year_csvs
+
+def store_sources(data_dir=DATA_DIR):
+    """編譯資料庫的來源檔案：縣市CSV、各縣市活頁簿與其他調查年份的CSV"""
+    return [os.path.join(data_dir, 'language_data.csv')] + \
+        [path for _, path in map_workbooks.find_county_workbooks(data_dir)] + \
+        [path for _, path in find_year_csvs(data_dir)]
+
+def ingest_report_path(store_path):
+    """編譯報告的路徑（與資料庫同目錄的 <名稱>.report.json）"""
+    return os.path.splitext(store_path)[0] + '.report.json'
+
+def read_summary_tables(data_dir, county_ids):
+    """以宣告的格式讀取縣市總表（language_data.csv 與 conclude.xlsx），供交叉檢查使用
+
+    返回 ({來源檔名: {縣市代碼: 語言比例}}, [報告中的檔案記錄])。無法讀取的總表（損壞、缺少工作表）
+    與活頁簿一樣記為格式問題，不中斷編譯。
+    """
+    references = {}
+    entries = []
+    for filename in ('language_data.csv', map_workbooks.SUMMARY_WORKBOOK):
+        path = os.path.join(data_dir, filename)
+        if not os.path.exists(path):
+            continue
+        start = time.perf_counter()
+        try:
+            summary = (map_workbooks.read_summary_csv(path) if filename.endswith('.csv')
+                       else map_workbooks.read_summary_workbook(path))
+        except Exception as e:
+            print(f"無法讀取縣市總表：{path}")
+            entries.append({'path': path, 'seconds': round(time.perf_counter() - start, 4), 'rows': 0,
+                            'issues': [f"無法讀取：{e}"]})
+            continue
+        if summary is None:
+            continue
+        records, issues = summary
+        table = references[filename] = {}
+        for name, record in records.items():
+            county_id = resolve_county_id(name, county_ids)
+            if county_id:
+                table[county_id] = record['data']
+            else:
+                issues.append(f"{name}：無法對應縣市代碼")
+        entries.append({'path': path, 'seconds': round(time.perf_counter() - start, 4), 'rows': len(records),
+                        'issues': issues})
+    return references, entries
+
+def summary_year(csv_data, county_totals):
+    """language_data.csv 本身沒有年份，以縣市合計與CSV一致的活頁簿判斷其調查年份
+
+    county_totals 為 [(縣市代碼, 活頁簿路徑, 解析結果)]；多個年份都一致時取最多縣市的年份，
+    沒有一致的活頁簿時返回None（縣市數據不列入時間序列）。
+    """
+    votes = {}
+    for county_id, _, workbook in county_totals:
+        if workbook['year'] and county_id in csv_data and not map_workbooks.cross_check(csv_data[county_id],
+                                                                                       workbook['data']):
+            votes[workbook['year']] = votes.get(workbook['year'], 0) + 1
+    return max(sorted(votes), key=votes.get) if votes else None
+
+def compile_language_store(data_dir=DATA_DIR, store_path=STORE_PATH, force=False, counties_path=COUNTIES_PATH,
+                           workers=None):
+    """將CSV與各縣市活頁簿編譯成單一資料庫，來源未變更時略過，返回是否重新編譯
+
+    活頁簿在程序池中同時解析（workers 為 1 時依序解析），並依 map_workbooks 宣告的格式檢查。
+    各縣市以人口加權平均的鄉鎮市區比例與活頁簿的縣市合計、language_data.csv 及
+    conclude.xlsx 交叉比對；各檔案的解析時間、格式問題與不一致的數值寫入
+    ingest_report_path(store_path)。
+
+    language_data.csv 的調查年份由 summary_year 從活頁簿判斷；只有年份與來源都不同的數據
+    （其他年份的活頁簿縣市合計、language_data_<年份>.csv）才另外記為時間序列。
+    """
+    sources = store_sources(data_dir)
+    report_path = ingest_report_path(store_path)
+    if not force and map_store.store_is_current(store_path, sources) and os.path.exists(report_path):
+        print(f"語言數據資料庫已是最新：{store_path}")
+        return False
+
+    started = time.perf_counter()
+    county_ids, county_names = load_county_registry(counties_path)
+    csv_data, csv_notes = read_language_csv(sources[0], county_ids)
+    references, summaries = read_summary_tables(data_dir, county_ids)
+    report = {'workers': workers or os.cpu_count(), 'workbooks': [], 'summaries': summaries, 'mismatches': []}
+    regions = []
+    county_regions = {}
+    township_ids = set()
+    county_totals = []
+    workbooks = map_workbooks.find_county_workbooks(data_dir)
+    parsed = map_workbooks.parse_workbooks([path for _, path in workbooks], workers)
+    for (region, path), (workbook, seconds) in zip(workbooks, parsed):
+        entry = {'path': path, 'region': region, 'seconds': round(seconds, 4)}
+        report['workbooks'].append(entry)
+        if not workbook:
+            entry['issues'] = ['無法解析活頁簿']
+            continue
+        if not workbook['county']:
+            print(f"無法讀取活頁簿：{path}")
+            entry['issues'] = workbook['issues']
+            continue
+        county_id = resolve_county_id(workbook['county'], county_ids)
+        entry.update(county=workbook['county'], county_id=county_id, year=workbook['year'],
+                     townships=len(workbook['townships']), note=workbook['note'], issues=workbook['issues'])
+        if not county_id:
+            print(f"無法對應縣市代碼的活頁簿：{path}（{workbook['county']}）")
+            map_instrument.count('names_unmatched')
+            entry['issues'] = workbook['issues'] + ['無法對應縣市代碼']
+            continue
+        county_regions[county_id] = (region, workbook)
+        # 鄉鎮市區的加權平均應與縣市合計及各總表的數值一致
+        average = map_workbooks.township_average(workbook)
+        checks = [(path, workbook['data'])] + [(os.path.join(data_dir, filename), table[county_id])
+                                               for filename, table in references.items() if county_id in table]
+        for source, expected in checks:
+            if not average:
+                break
+            for lang, value, township_value in map_workbooks.cross_check(expected, average):
+                report['mismatches'].append({'county_id': county_id, 'county': workbook['county'], 'source': source,
+                                             'language': lang, 'expected': value, 'townships': township_value})
+        county_totals.append((county_id, path, workbook))
+        # 同一縣市同一年份的鄉鎮市區名稱重複時已記錄為格式問題，只保留第一列
+        for township in workbook['townships']:
+            region_id = f"{county_id}-{township['name']}" + (f"@{workbook['year']}" if workbook['year'] else '')
+            if region_id in township_ids:
+                continue
+            township_ids.add(region_id)
+            regions.append({
+                'region_id': region_id,
+                'county_id': county_id,
+                'level': 'township',
+                'name': township['name'],
+                'region': region,
+                'population': township['population'],
+                'year': workbook['year'],
+                'source': path,
+                'data': township['data']
+            })
+
+    csv_year = summary_year(csv_data, county_totals)
+    report['year'] = csv_year
+    if csv_year is None:
+        print("無法由活頁簿判斷 language_data.csv 的調查年份，縣市數據不列入時間序列")
+    for county_id, lang_dict in csv_data.items():
+        region, workbook = county_regions.get(county_id, (None, None))
+        regions.append({
+            'region_id': county_id,
+            'county_id': county_id,
+            'level': 'county',
+            'name': county_names.get(county_id, county_id),
+            'region': region,
+            'population': workbook['population'] if workbook else None,
+            'year': csv_year,
+            'note': csv_notes.get(county_id),
+            'source': sources[0],
+            'data': lang_dict
+        })
+
+    # 其他調查年份的縣市數據：與CSV年份不同的活頁簿縣市合計，以及另外提供的各年份CSV（同一年份以CSV為準）
+    series = {(county_id, workbook['year']): (path, workbook['population'], workbook['data'])
+              for county_id, path, workbook in county_totals if workbook['year'] and workbook['year'] != csv_year}
+    for year, path in find_year_csvs(data_dir):
+        year_data = read_language_csv(path, county_ids)[0]
+        if year == csv_year or year_data == csv_data:
+            print(f"與 language_data.csv 的調查年份或數據相同，略過：{path}")
+            continue
+        for county_id, lang_dict in year_data.items():
+            series[(county_id, year)] = (path, None, lang_dict)
+    for (county_id, year), (path, population, lang_dict) in sorted(series.items()):
+        regions.append({
+            'region_id': f"{county_id}@{year}",
+            'county_id': county_id,
+            'level': 'series',
+            'name': county_names.get(county_id, county_id),
+            'population': population,
+            'year': year,
+            'source': path,
+            'data': lang_dict
+        })
+
+    languages = list(next(iter(csv_data.values()), {}))
+    map_store.write_store(store_path, languages, regions, sources)
+    years = sorted({year for _, year in series} | ({csv_year} if csv_year else set()))
+    print(f"已編譯 {len(csv_data)} 個縣市、{len(regions) - len(csv_data) - len(series)} 個鄉鎮市區的語言數據"
+          f"（調查年份：{'、'.join(map(str, years))}）到 '{store_path}'")
+
+    report['seconds'] = round(time.perf_counter() - started, 4)
+    with open(report_path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    issues = sum(len(entry['issues']) for entry in report['workbooks'] + report['summaries'])
+    print(f"已檢查 {len(workbooks)} 個活頁簿與 {len(summaries)} 個縣市總表：{issues} 個格式問題、"
+          f"{len(report['mismatches'])} 筆數值不一致，報告保存為 '{report_path}'")
+    return True
+
+def load_language_data(county_ids=None, data_dir=DATA_DIR, store_path=STORE_PATH):
+    """載入真實的語言使用數據，以縣市代碼為鍵
+
+    編譯過的資料庫與來源一致時直接讀取資料庫，否則讀取CSV。
+    """
+    if county_ids is None:
+        county_ids, _ = load_county_registry()
+    
+    if map_store.store_is_current(store_path, store_sources(data_dir)):
+        counties = [county for records in map_store.iter_regions(store_path, ('county',)) for county in records]
+        language_data = {county['county_id']: county['data'] for county in counties}
+        language_notes = {county['county_id']: county['note'] for county in counties if county['note']}
+    else:
+        language_data, language_notes = read_language_csv(os.path.join(data_dir, 'language_data.csv'), county_ids)
+    
     print(f"成功載入 {len(language_data)} 個縣市的語言數據")
     return language_data, language_notes
 
-# 載入真實的語言數據
-language_data, language_notes = load_language_data()
+class LanguageDataset:
+    """語言數據的存取物件：第一次使用時才載入，之後重複使用同一份數據
+
+    測試或長時間執行的服務可透過 get_dataset() 共用同一個已載入的物件。
+    """
+
+    def __init__(self, data_dir=DATA_DIR, counties_path=COUNTIES_PATH, store_path=None):
+        self.data_dir = data_dir
+        self.counties_path = counties_path
+        self.store_path = store_path or os.path.join(data_dir, 'language_data.sqlite')
+        self._lock = threading.Lock()
+        self._registry = None
+        self._data = None
+        self._analytics = None
+        self._series = None
+
+    def _load_registry(self):
+        with self._lock:
+            if self._registry is None:
+                self._registry = load_county_registry(self.counties_path)
+        return self._registry
+
+    def _load_data(self):
+        county_ids = self.county_ids
+        with self._lock:
+            if self._data is None:
+                self._data = load_language_data(county_ids, self.data_dir, self.store_path)
+        return self._data
+
+    @property
+    def county_ids(self):
+        """標準化名稱 -> 縣市代碼"""
+        return (self._registry or self._load_registry())[0]
+
+    @property
+    def county_names(self):
+        """縣市代碼 -> 名稱"""
+        return (self._registry or self._load_registry())[1]
+
+    @property
+    def language_data(self):
+        """縣市代碼 -> 各語言使用比例"""
+        return (self._data or self._load_data())[0]
+
+    @property
+    def language_notes(self):
+        """縣市代碼 -> 備註"""
+        return (self._data or self._load_data())[1]
+
+    @property
+    def analytics(self):
+        """所有縣市的統計指標（map_analytics.compute_analytics 的結果），只計算一次"""
+        if self._analytics is None:
+            language_data = self.language_data
+            with self._lock:
+                if self._analytics is None:
+                    self._analytics = compute_analytics(language_data)
+        return self._analytics
+
+    @property
+    def series(self):
+        """調查年份 -> 縣市代碼 -> 各語言使用比例（依年份排序，由編譯資料庫讀取）
+
+        只讀取資料庫，不會編譯；需要最新的數據時先呼叫 compile()。資料庫不存在時返回空字典。
+        """
+        if self._series is None:
+            if not os.path.exists(self.store_path):
+                print(f"找不到編譯資料庫，請先執行 compile：{self.store_path}")
+                return {}
+            if not map_store.store_is_current(self.store_path, store_sources(self.data_dir)):
+                print(f"編譯資料庫不是最新，調查年份數據可能已過期（請執行 compile）：{self.store_path}")
+            series = map_store.read_store(self.store_path)['series']
+            with self._lock:
+                if self._series is None:
+                    self._series = series
+        return self._series
+
+    def __getstate__(self):
+        """傳給其他程序時連同已載入的數據一起傳送（鎖無法序列化）"""
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def compile(self, force=False):
+        """重新編譯資料庫，並在下次存取時重新載入"""
+        rebuilt = compile_language_store(self.data_dir, self.store_path, force, self.counties_path)
+        if rebuilt:
+            self.reload()
+        return rebuilt
+
+    def reload(self):
+        """清除已載入的數據，下次存取時重新讀取"""
+        with self._lock:
+            self._registry = None
+            self._data = None
+            self._analytics = None
+            self._series = None
+
+_datasets = {}
+_datasets_lock = threading.Lock()
+
+def get_dataset(data_dir=DATA_DIR, counties_path=COUNTIES_PATH):
+    """取得共用的數據存取物件，同一個數據目錄與縣市代碼表只建立一次"""
+    key = (os.path.abspath(data_dir), os.path.abspath(counties_path))
+    with _datasets_lock:
+        if key not in _datasets:
+            _datasets[key] = LanguageDataset(data_dir, counties_path)
+        return _datasets[key]
+
+_language_registries = {}
+
+def get_language_registry(path=LANGUAGES_PATH):
+    """取得共用的語言登錄表，同一個檔案只讀取一次"""
+    key = os.path.abspath(path)
+    if key not in _language_registries:
+        _language_registries[key] = load_language_registry(path)
+    return _language_registries[key]
+
+def reload_language_registries():
+    """清除已讀取的語言登錄表，下次使用時重新讀取（登錄表變更後使用）"""
+    _language_registries.clear()
+
+def map_modes():
+    """切換按鈕上的所有顯示模式：登錄表中依主要語言填色的模式，以及兩種多樣性指數"""
+    return tuple(get_language_registry()['modes']) + METRIC_MODES
+
+def compute_analytics(language_data, languages=None):
+    """依語言登錄表的顯示順序與各模式排除的語言計算統計指標（見 map_analytics.compute_analytics）"""
+    registry = get_language_registry()
+    return map_analytics.compute_analytics(language_data, languages, registry['exclusions'], registry['languages'])
 
-def get_dominant_language(lang_data, exclude_mandarin=False):
-    """獲取使用比例最高的語言，可選擇是否排除華語"""
+def __getattr__(name):
+    """相容舊用法：language_data 等模組屬性在第一次存取時才載入"""
+    if name in ('language_data', 'language_notes', 'county_ids', 'county_names'):
+        return getattr(get_dataset(), name)
+    if name == 'LANGUAGE_COLORS':
+        return get_language_registry()['colors']
+    if name == 'MAP_MODES':
+        return map_modes()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def resolve_mode(exclude_mandarin=False, mode=None):
+    """決定顯示模式：指定 mode 時以 mode 為準，否則沿用舊的 exclude_mandarin 參數
+    （True 為 'exclude'、False 為 'normal'）；不是 map_modes() 之一時拋出 ValueError"""
+    if isinstance(exclude_mandarin, str):
+        raise TypeError(f"顯示模式請以 mode={exclude_mandarin!r} 指定")
+    if mode is None:
+        mode = 'exclude' if exclude_mandarin else 'normal'
+    modes = [name for name, _ in map_modes()]
+    if mode not in modes:
+        raise ValueError(f"未知的顯示模式：{mode!r}（可用的模式：{'、'.join(modes)}）")
+    return mode
+
+def get_dominant_language(lang_data, exclude_mandarin=False, *, mode=None):
+    """獲取使用比例最高的語言，排除語言登錄表中該模式排除的語言
+
+    exclude_mandarin 為舊的參數，等同 mode='exclude'。
+    """
+    mode = resolve_mode(exclude_mandarin, mode)
     if not lang_data:
         return None
     
     # 創建要比較的語言數據
+    excluded = get_language_registry()['exclusions'].get(mode, ())
     data_to_compare = {}
     for lang, value in lang_data.items():
-        if exclude_mandarin and lang == "華語":
+        if lang in excluded:
             continue
         data_to_compare[lang] = value
     
@@ -119,158 +701,542 @@ def get_dominant_language(lang_data, exclude_mandarin=False):
         
     return max(data_to_compare.items(), key=lambda x: x[1])
 
-def create_popup_content(area_name, lang_data, exclude_mandarin=False):
-    """創建彈窗內容，可以選擇是否排除華語數據，並包含備註信息"""
-    if not lang_data:
-        return f"<h4>{area_name}</h4>暫無語言數據"
+# 各語言的顏色、顯示順序與依主要語言填色的顯示模式（例如排除華語）由語言登錄表
+# （taiwan_languages.json）設定，見 get_language_registry
+
+# 多樣性指數分布圖的顏色與切換按鈕上的說明
+DIVERSITY_COLOR = '#8E44AD'
+METRIC_MODES = (
+    ('diversity', '語言多樣性（Shannon）'),
+    ('simpson', '語言多樣性（Simpson）')
+)
+
+# 沒有數據的區域
+NO_DATA_COLOR = '#cccccc'
 
-    content = f'''
-    <div style="min-width: 300px">
-        <h4 style="text-align: center">{area_name}語言使用比例</h4>
-        <div style="padding: 10px;">
+# 多樣性模式使用的標準化指數（map_analytics.compute_analytics 的欄位）
+MODE_METRICS = {'diversity': 'evenness', 'simpson': 'simpson_norm'}
+
+# 與上一次調查相比的變化：減少與增加的顏色，變化達 DELTA_SCALE 個百分點時顏色最深
+DELTA_COLORS = ('#C0392B', '#2E86C1')
+DELTA_SCALE = 20
+
+# 彈窗共用的樣式，頁面中只輸出一次
+POPUP_CSS = '''
+        .lang-popup { min-width: 300px; }
+        .lang-popup h4 { text-align: center; }
+        .lang-row { margin: 10px 0; }
+        .lang-label { display: flex; justify-content: space-between; margin-bottom: 2px; }
+        .lang-bar { background-color: #f0f0f0; border-radius: 4px; height: 20px; overflow: hidden; }
+        .lang-bar div { height: 100%; }
+        .lang-note { margin-top: 15px; padding: 8px; border-top: 1px solid #ddd; border-radius: 4px;
+                     background-color: #f8f9fa; font-size: 12px; color: #495057; }
+        .lang-note b { color: #6c757d; }
+        .lang-rank { margin-left: 6px; font-size: 11px; color: #868e96; }
+        .lang-metrics { margin-top: 10px; font-size: 12px; color: #495057; }
+        .lang-delta { margin-left: 6px; font-size: 11px; color: #495057; }
     '''
-    
-    # 按使用比例從高到低排序
-    sorted_languages = sorted(lang_data.items(), key=lambda x: x[1], reverse=True)
-    for lang, percentage in sorted_languages:
-        if exclude_mandarin and lang == "華語":
-            continue
-            
-        # 根據語言類型設定進度條顏色
-        color_map = {
-            '華語': '#FF6B6B',
-            '閩南語': '#4ECB71',
-            '客家話': '#6B8EFF',
-            '原住民語': '#FFD93D'
-        }
-        bar_color = color_map.get(lang, '#4188e0')
-            
-        content += f'''
-            <div style="margin: 10px 0;">
-                <div style="display: flex; justify-content: space-between; margin-bottom: 2px;">
-                    <span style="font-weight: bold; color: {bar_color}">{lang}</span>
-                    <span>{percentage}%</span>
-                </div>
-                <div style="background-color: #f0f0f0; border-radius: 4px; height: 20px; overflow: hidden;">
-                    <div style="width: {min(percentage, 100)}%; height: 100%; background-color: {bar_color};"></div>
-                </div>
-            </div>
-        '''
-    
-    # 添加備註信息（如果有的話）
-    if area_name in language_notes:
-        note = language_notes[area_name]
-        content += f'''
-            <hr style="margin: 15px 0; border: none; border-top: 1px solid #ddd;">
-            <div style="background-color: #f8f9fa; padding: 8px; border-radius: 4px; font-size: 12px;">
-                <span style="font-weight: bold; color: #6c757d;">📝 備註：</span>
-                <span style="color: #495057;">{note}</span>
-            </div>
-        '''
-    
-    content += '</div></div>'
-    return content
 
-def create_style_function(exclude_mandarin=False):
-    """創建樣式函數，可以設置是否排除華語"""
-    def style_function(feature):
-        """定義區域的樣式"""
-        properties = feature['properties']
-        county_name = properties.get('COUNTYNAME')
-        
-        # 使用相同的名稱匹配邏輯
-        normalized_name = normalize_county_name(county_name)
-        possible_names = {
-            normalized_name,
-            county_name,
-            normalized_name.replace('縣', '市') if '縣' in normalized_name else normalized_name,
-            county_name.replace('縣', '市') if '縣' in county_name else county_name
-        }
-        
-        # 尋找匹配的語言數據
-        lang_data = None
-        for name in possible_names:
-            if name in language_data:
-                lang_data = language_data[name]
-                break
-        
-        if lang_data:
-            dominant = get_dominant_language(lang_data, exclude_mandarin)
-            if dominant:
-                # 根據主要語言設定顏色
-                color_map = {
-                    '華語': '#FF6B6B',     # 紅色
-                    '閩南語': '#4ECB71',   # 綠色
-                    '客家話': '#6B8EFF',   # 藍色
-                    '原住民語': '#FFD93D'  # 黃色
-                }
-                
-                return {
-                    'fillColor': color_map.get(dominant[0], '#cccccc'),
-                    'color': 'black',
-                    'weight': 1,
-                    'fillOpacity': 0.7
-                }
-        
+# 區域的填色以CSS類別表示（見 style_class），滑鼠懸停的樣式也只由CSS決定，不需要逐一綁定事件
+AREA_CSS = '''
+        .lang-area:hover { fill: #43484A; fill-opacity: 0.7; stroke-width: 2px; }
+        .ls-outline { fill: none; stroke-width: 0.5px; }
+    '''
+
+def get_dominant_style(language):
+    """以主要語言的顏色填色，沒有主要語言時顯示為灰色"""
+    if language:
+        # 根據主要語言設定顏色
         return {
-            'fillColor': '#cccccc',
+            'fillColor': get_language_registry()['colors'].get(language, NO_DATA_COLOR),
             'color': 'black',
             'weight': 1,
-            'fillOpacity': 0.3
+            'fillOpacity': 0.7
         }
     
-    return style_function
+    return {
+        'fillColor': NO_DATA_COLOR,
+        'color': 'black',
+        'weight': 1,
+        'fillOpacity': 0.3
+    }
+
+def get_language_style(lang_data, exclude_mandarin=False, *, mode=None):
+    """根據主要語言決定區域的樣式，沒有數據時顯示為灰色"""
+    mode = resolve_mode(exclude_mandarin, mode)
+    dominant = get_dominant_language(lang_data, mode=mode) if lang_data else None
+    return get_dominant_style(dominant[0] if dominant else None)
 
-def highlight_function(feature):
-    """定義滑鼠懸停時的樣式"""
+def get_metric_style(value, color=DIVERSITY_COLOR):
+    """以顏色深淺表示介於0–1的數值，沒有數值時顯示為灰色"""
+    if value is None or value != value:
+        return get_dominant_style(None)
+    value = min(max(float(value), 0), 1)
     return {
-        'fillColor': "#43484A",
+        'fillColor': color,
         'color': 'black',
-        'weight': 2,
-        'fillOpacity': 0.7
+        'weight': 1,
+        'fillOpacity': round(0.1 + 0.8 * value, 3)
     }
 
-def create_language_layers(m, taiwan_geojson, exclude_mandarin=False):
-    """創建地圖圖層，根據是否排除華語來顯示數據"""
-    layer = folium.FeatureGroup(name='語言分布' + ('（排除華語）' if exclude_mandarin else ''))
+def get_delta_style(delta):
+    """變化分布圖的樣式：紅色為減少、藍色為增加，顏色深淺表示變化幅度"""
+    if delta is None or delta != delta:
+        return get_dominant_style(None)
+    return get_metric_style(abs(delta) / DELTA_SCALE, DELTA_COLORS[int(delta > 0)])
+
+def language_color(language):
+    """語言在登錄表中的顏色，未登錄的語言使用預設顏色"""
+    registry = get_language_registry()
+    return registry['colors'].get(language, registry['default_color'])
+
+def get_language_share_style(lang_data, language):
+    """單一語言分布圖的樣式：以該語言的顏色深淺表示使用比例"""
+    if lang_data and language in lang_data:
+        return get_metric_style(min(max(lang_data[language], 0), 100) / 100, language_color(language))
+    return get_dominant_style(None)
+
+def create_area_styles(analytics, language=None):
+    """由統計結果產生各顯示模式下每個區域的樣式，返回 {模式: {區域代碼: 樣式}}
+
+    指定 language 時為該語言的單一語言分布圖，所有模式的樣式相同。
+    依主要語言填色的樣式每種語言只建立一次，語言數量不影響每個區域的計算量。
+    """
+    languages = analytics['languages']
+    column = languages.index(language) if language in languages else None
+    # 以主要語言的欄位索引查表，最後一項（索引 -1）是沒有數據時的樣式
+    dominant_styles = [get_dominant_style(lang) for lang in languages] + [get_dominant_style(None)]
+    styles = {}
+    for mode, _ in map_modes():
+        mode_styles = styles[mode] = {}
+        for row, area_id in enumerate(analytics['ids']):
+            if language:
+                share = analytics['values'][row, column] if column is not None else None
+                mode_styles[area_id] = get_metric_style(
+                    None if share is None else min(max(share, 0), 100) / 100, language_color(language))
+            elif mode in MODE_METRICS:
+                mode_styles[area_id] = get_metric_style(analytics[MODE_METRICS[mode]][row])
+            else:
+                mode_styles[area_id] = dominant_styles[analytics['dominant_modes'].get(mode, analytics['dominant'])[row]]
+    return styles
+
+def create_style_function(exclude_mandarin=False, dataset=None, *, mode=None):
+    """創建指定顯示模式的樣式函數，直接查詢預先計算的樣式表
+
+    exclude_mandarin 為舊的參數，等同 mode='exclude'；未知的模式拋出 ValueError。
+    """
+    mode = resolve_mode(exclude_mandarin, mode)
+    styles = create_area_styles((dataset or get_dataset()).analytics)[mode]
+    no_data = get_dominant_style(None)
     
-    style_func = create_style_function(exclude_mandarin)
+    def style_function(feature):
+        """定義區域的樣式"""
+        # 以載入時對應好的縣市代碼直接查詢
+        return styles.get(feature['properties'].get('county_id'), no_data)
     
-    for feature in taiwan_geojson['features']:
-        county_name = feature['properties']['COUNTYNAME']
-        normalized_name = normalize_county_name(county_name)
-        display_name = normalized_name
-        
-        # 嘗試不同的名稱版本來匹配語言數據
-        possible_names = {
-            normalized_name,
-            county_name, 
-            normalized_name.replace('縣', '市') if '縣' in normalized_name else normalized_name,
-            county_name.replace('縣', '市') if '縣' in county_name else county_name
+    return style_function
+
+def style_class(style):
+    """樣式對應的CSS類別名稱，由填色與透明度組成（頁面中以相同規則產生年份數據的類別）"""
+    color = ''.join(char for char in style['fillColor'] if char.isalnum()).lower()
+    return f"ls-{color}-{round(style['fillOpacity'] * 1000)}"
+
+def style_rules(style_classes):
+    """{類別: [填色, 透明度]} 對應的CSS規則"""
+    return ''.join(f'''
+        .{name} {{ fill: {fill}; fill-opacity: {opacity}; }}''' for name, (fill, opacity) in style_classes.items())
+
+def preprocess_geometry(taiwan_geojson, simplify_tolerance=None, precision=map_geometry.DEFAULT_PRECISION,
+                        simplify_method='dp'):
+    """嵌入前先簡化邊界並量化座標，容差為0時只做座標量化"""
+    return map_geometry.simplify_geojson(taiwan_geojson, tolerance=simplify_tolerance,
+                                         precision=precision, method=simplify_method)
+
+def write_geometry_asset(taiwan_geojson, asset_path):
+    """將地理數據寫成獨立的 GeoJSON 檔案，供頁面以外部資源載入"""
+    # 使用 ASCII 轉義，避免 folium 以系統預設編碼讀回時出錯
+    with open(asset_path, 'w') as file:
+        json.dump(taiwan_geojson, file, separators=(',', ':'))
+
+def create_mode_styles(taiwan_geojson, dataset=None, language=None):
+    """預先計算每種顯示模式下每個縣市代碼的樣式類別，供切換時直接替換
+
+    返回 ({模式: {縣市代碼: 類別}}, {類別: [填色, 透明度]})；不同的樣式只有少數幾種，
+    頁面為每個類別輸出一條CSS規則即可。指定 language 時為該語言的單一語言分布圖，
+    所有模式的樣式相同。
+    """
+    area_styles = create_area_styles((dataset or get_dataset()).analytics, language)
+    no_data = get_dominant_style(None)
+    mode_styles = {}
+    # 無數據的樣式也用在尚未載入的變化分布圖，一定要有對應的規則
+    style_classes = {style_class(no_data): [no_data['fillColor'], no_data['fillOpacity']]}
+    for mode, styles in area_styles.items():
+        classes = mode_styles[mode] = {}
+        for feature in taiwan_geojson['features']:
+            style = styles.get(feature['properties'].get('county_id'), no_data)
+            name = style_class(style)
+            style_classes.setdefault(name, [style['fillColor'], style['fillOpacity']])
+            classes[feature['properties'].get('county_id', '')] = name
+    return mode_styles, style_classes
+
+def create_map_data(taiwan_geojson, dataset=None, language=None):
+    """頁面所需的語言數據、備註、縣市名稱、統計指標與樣式類別表（內嵌在頁面中或由伺服器提供）"""
+    dataset = dataset or get_dataset()
+    mode_styles, style_classes = create_mode_styles(taiwan_geojson, dataset, language)
+    return {
+        'languageData': dataset.language_data,
+        'languageNotes': dataset.language_notes,
+        'countyNames': dataset.county_names,
+        'metrics': map_analytics.area_metrics(dataset.analytics),
+        'modeStyles': mode_styles,
+        'styleClasses': style_classes
+    }
+
+def create_year_data(dataset=None):
+    """各調查年份的頁面數據，返回 {年份: 數據}
+
+    每個年份包含語言數據、統計指標、與上一次調查相比的變化（delta）
+    以及各模式的樣式表；樣式只保留 [填色, 透明度]，其餘屬性在頁面中補上。
+    變化分布圖的模式名稱為 delta:<語言>。
+    """
+    dataset = dataset or get_dataset()
+    years = {}
+    previous = None
+    for year, language_data in dataset.series.items():
+        analytics = compute_analytics(language_data)
+        languages = analytics['languages']
+        styles = create_area_styles(analytics)
+        deltas = map_analytics.compute_deltas(analytics, previous[1]) if previous else None
+        changes = {}
+        for column, language in enumerate(languages):
+            mode_styles = styles['delta:' + language] = {}
+            for row, area_id in enumerate(analytics['ids']):
+                delta = deltas[row, column] if deltas is not None else None
+                mode_styles[area_id] = get_delta_style(delta)
+                if delta is not None and delta == delta:
+                    changes.setdefault(area_id, {})[language] = round(float(delta), 1)
+        years[year] = {
+            'year': year,
+            'base': previous[0] if previous else None,
+            'languageData': language_data,
+            'metrics': map_analytics.area_metrics(analytics),
+            'delta': changes,
+            'modeStyles': {mode: {area_id: [style['fillColor'], style['fillOpacity']]
+                                  for area_id, style in mode_styles.items()}
+                           for mode, mode_styles in styles.items()}
         }
-        
-        # 尋找第一個匹配的數據
-        lang_data = None
-        for name in possible_names:
-            if name in language_data:
-                lang_data = language_data[name]
-                display_name = name
-                break
-        
-        if lang_data:
-            popup_content = create_popup_content(display_name, lang_data, exclude_mandarin)
-            folium.GeoJson(
-                feature,
-                name=county_name,
-                style_function=style_func,
-                highlight_function=highlight_function,
-                popup=folium.Popup(popup_content, max_width=300)
-            ).add_to(layer)
-    
-    return layer
+        previous = (year, analytics)
+    return years
+
+def year_series_config(years, language_data=None):
+    """頁面時間滑桿的設定：所有年份、初始年份與變化選單的語言
+
+    初始年份是數據與 language_data（頁面內嵌的縣市數據）相同的年份，沒有相同的年份時為最近的年份。
+    """
+    initial = next((year for year, year_data in years.items() if year_data['languageData'] == language_data),
+                   max(years))
+    languages = []
+    for year_data in years.values():
+        for lang_data in year_data['languageData'].values():
+            languages.extend(lang for lang in lang_data if lang not in languages)
+    return {
+        'years': list(years),
+        'initial': initial,
+        'languages': languages
+    }
+
+def build_year_assets(asset_dir, dataset=None):
+    """將各調查年份的數據分別寫成小檔案（years/<年份>.json），移動時間滑桿時才載入
+
+    地理數據由所有年份共用，不重複輸出。返回頁面所需的設定（也寫入 index.json），
+    只有一個年份時返回None。資料庫在讀取前先更新（來源未變更時不重新編譯）。
+    """
+    dataset = dataset or get_dataset()
+    dataset.compile()
+    years = create_year_data(dataset)
+    if len(years) < 2:
+        print("只有一個調查年份，不產生時間序列數據")
+        return None
+    os.makedirs(asset_dir, exist_ok=True)
+    for year, year_data in years.items():
+        with open(os.path.join(asset_dir, f'{year}.json'), 'w', encoding='utf-8') as file:
+            json.dump(year_data, file, ensure_ascii=False, separators=(',', ':'))
+    config = year_series_config(years, dataset.language_data)
+    with open(os.path.join(asset_dir, 'index.json'), 'w', encoding='utf-8') as file:
+        json.dump(config, file, ensure_ascii=False, indent=2)
+    print(f"已產生 {len(years)} 個調查年份的數據到 '{asset_dir}'")
+    return config
+
+def township_key(name):
+    """鄉鎮市區名稱的比對鍵：統一異體字並去掉鄉、鎮、市、區字尾（縣市合併後鄉鎮多改制為區）"""
+    name = normalize_county_name(name.replace('\u3000', '').strip())
+    if len(name) > 2 and name[-1] in '鄉鎮市區':
+        name = name[:-1]
+    return name
+
+def _first_property(properties, keys):
+    for key in keys:
+        if properties.get(key):
+            return properties[key]
+    return None
+
+def group_township_geometry(township_geojson, county_ids):
+    """依縣市代碼分組鄉鎮市區邊界，返回 {county_id: {比對鍵: feature}}"""
+    grouped = {}
+    for feature in township_geojson['features']:
+        properties = feature.get('properties') or {}
+        county_id = resolve_county_id(_first_property(properties, TOWNSHIP_COUNTY_KEYS), county_ids)
+        town_name = _first_property(properties, TOWNSHIP_NAME_KEYS)
+        if county_id and town_name:
+            grouped.setdefault(county_id, {})[township_key(town_name)] = feature
+        else:
+            map_instrument.count('township_names_unmatched')
+    return grouped
+
+def build_township_assets(asset_dir, dataset=None, offline=False, cache_dir=GEOJSON_CACHE_DIR,
+                          precision=map_geometry.DEFAULT_PRECISION, simplify_method='dp', url=TOWNSHIP_GEOJSON_URL):
+    """由編譯資料庫產生精簡的鄉鎮市區數據檔（townships/<county_id>.json）
+
+    只有來源活頁簿內容、鄉鎮市區邊界或簡化選項改變的縣市才重新產生，
+    網頁點擊縣市時才載入對應的檔案。
+    """
+    dataset = dataset or get_dataset()
+    dataset.compile()
+    store = map_store.read_store(dataset.store_path)
+
+    os.makedirs(asset_dir, exist_ok=True)
+    manifest_path = os.path.join(asset_dir, 'index.json')
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as file:
+            manifest = json.load(file)
+    except (FileNotFoundError, ValueError):
+        manifest = {}
+
+    def asset_key(source_hash):
+        """每個縣市數據檔的依賴：活頁簿雜湊值、快取中鄉鎮市區邊界的雜湊值、簡化選項與語言登錄表"""
+        geometry_hash = _load_cache_index(cache_dir).get(url, {}).get('sha256')
+        key = json.dumps([source_hash, geometry_hash, precision, simplify_method, map_modes(),
+                          get_language_registry()], ensure_ascii=False)
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+    stale = []
+    for county_id, townships in store['townships'].items():
+        source_hash = store['sources'].get(townships[0]['source'])
+        if (manifest.get(county_id) == asset_key(source_hash)
+                and os.path.exists(os.path.join(asset_dir, county_id + '.json'))):
+            continue
+        stale.append((county_id, townships, source_hash))
+    if not stale:
+        return manifest
+
+    # 只有需要重新產生時才讀取鄉鎮市區邊界
+    township_geojson = download_taiwan_geojson(url=url, cache_dir=cache_dir, offline=offline)
+    geometry = group_township_geometry(township_geojson, dataset.county_ids) if township_geojson else {}
+    tolerance = map_geometry.zoom_tolerance(TOWNSHIP_TARGET_ZOOM)
+
+    for county_id, townships, source_hash in stale:
+        county_name = dataset.county_names.get(county_id, county_id)
+        county_geometry = geometry.get(county_id, {})
+        township_styles = create_area_styles(
+            compute_analytics({index: township['data'] for index, township in enumerate(townships)}))
+        features = []
+        missing = []
+        for index, township in enumerate(townships):
+            feature = county_geometry.get(township_key(township['name']))
+            if feature is None:
+                missing.append(township['name'])
+            features.append({
+                'type': 'Feature',
+                'properties': {
+                    'name': township['name'],
+                    'data': township['data'],
+                    'style': {mode: styles[index] for mode, styles in township_styles.items()}
+                },
+                'geometry': feature['geometry'] if feature else None
+            })
+        if not county_geometry:
+            print(f"沒有{county_name}的鄉鎮市區邊界")
+        elif missing:
+            print(f"{county_name}找不到以下鄉鎮市區的邊界：{'、'.join(missing)}")
+
+        township_collection = {'type': 'FeatureCollection', 'features': features}
+        if any(feature['geometry'] for feature in features):
+            township_collection = map_geometry.simplify_geojson(
+                township_collection, tolerance=tolerance, precision=precision, method=simplify_method)
+        with open(os.path.join(asset_dir, county_id + '.json'), 'w', encoding='utf-8') as file:
+            json.dump(township_collection, file, ensure_ascii=False, separators=(',', ':'))
+        manifest[county_id] = asset_key(source_hash)
+
+    with open(manifest_path, 'w', encoding='utf-8') as file:
+        json.dump(manifest, file, ensure_ascii=False, indent=2)
+    print(f"已產生 {len(stale)} 個縣市的鄉鎮市區數據到 '{asset_dir}'")
+    return manifest
+
+def prepare_map_geometry(taiwan_geojson, simplify_tolerance=None, precision=map_geometry.DEFAULT_PRECISION,
+                         simplify_method='dp', dataset=None):
+    """簡化地理數據並對應縣市代碼，回報有數據卻沒有邊界的縣市"""
+    dataset = dataset or get_dataset()
+    taiwan_geojson = preprocess_geometry(taiwan_geojson, simplify_tolerance, precision, simplify_method)
+    taiwan_geojson, _ = join_county_ids(taiwan_geojson, dataset.county_ids)
+    matched = {feature['properties'].get('county_id') for feature in taiwan_geojson['features']}
+    missing = [dataset.county_names.get(county_id, county_id)
+               for county_id in dataset.language_data if county_id not in matched]
+    if missing:
+        print(f"以下縣市有語言數據但沒有對應的地理區域：{'、'.join(missing)}")
+    return taiwan_geojson
+
+def build_township_tiles(tile_dir, dataset=None, offline=False, cache_dir=GEOJSON_CACHE_DIR,
+                         min_zoom=map_tiles.DEFAULT_MIN_ZOOM, max_zoom=map_tiles.DEFAULT_MAX_ZOOM,
+                         precision=map_geometry.DEFAULT_PRECISION, simplify_method='dp', url=TOWNSHIP_GEOJSON_URL):
+    """將鄉鎮市區邊界連同語言比例切成向量圖磚，返回頁面載入圖磚所需的設定
+
+    每個要素的屬性包含名稱、縣市代碼、各語言比例，以及每種顯示模式的填色與透明度。
+    """
+    dataset = dataset or get_dataset()
+    dataset.compile()
+    store = map_store.read_store(dataset.store_path)
+    township_geojson = download_taiwan_geojson(url=url, cache_dir=cache_dir, offline=offline)
+    if not township_geojson:
+        print("無法產生向量圖磚：缺少鄉鎮市區邊界")
+        return None
+
+    records = {(county_id, township_key(township['name'])): township
+               for county_id, townships in store['townships'].items() for township in townships}
+    township_styles = create_area_styles(compute_analytics(
+        {key: township['data'] for key, township in records.items()}, store['languages']))
+    no_data = get_dominant_style(None)
+    features = []
+    for feature in township_geojson['features']:
+        properties = feature.get('properties') or {}
+        county_id = resolve_county_id(_first_property(properties, TOWNSHIP_COUNTY_KEYS), dataset.county_ids)
+        town_name = _first_property(properties, TOWNSHIP_NAME_KEYS)
+        if not town_name:
+            continue
+        key = (county_id, township_key(town_name))
+        township = records.get(key)
+        tile_properties = {'name': township['name'] if township else town_name, 'county_id': county_id}
+        tile_properties.update(township['data'] if township else {})
+        for mode, styles in township_styles.items():
+            style = styles.get(key, no_data)
+            tile_properties['fill_' + mode] = style['fillColor']
+            tile_properties['opacity_' + mode] = style['fillOpacity']
+        features.append({'type': 'Feature', 'properties': tile_properties, 'geometry': feature.get('geometry')})
+
+    metadata = map_tiles.write_tiles({'type': 'FeatureCollection', 'features': features}, tile_dir, 'townships',
+                                     min_zoom, max_zoom, precision, simplify_method)
+    return {
+        'layer': metadata['layer'],
+        'minzoom': metadata['minzoom'],
+        'maxzoom': metadata['maxzoom'],
+        'languages': store['languages']
+    }
+
+# 漸進載入：頁面先繪製以 OUTLINE_ZOOM 簡化的輪廓，再依序載入完整解析度的區塊取代。
+# 區塊依 GEOMETRY_CHUNKS 的順序載入，未列出的縣市都屬於第一個（本島）；
+# 區域很多時每個區塊最多 CHUNK_FEATURES 個區域
+OUTLINE_ZOOM = 6
+GEOMETRY_CHUNKS = (('main', ()), ('penghu', ('澎湖縣',)), ('kinmen', ('金門縣',)), ('matsu', ('連江縣',)))
+CHUNK_FEATURES = 500
+
+def create_outline(taiwan_geojson, precision=map_geometry.DEFAULT_PRECISION, simplify_method='dp', zoom=OUTLINE_ZOOM):
+    """首次繪製用的低解析度輪廓，要素的順序與屬性不變"""
+    topology = map_geometry.build_topology(taiwan_geojson, precision)
+    topology = map_geometry.simplify_topology(topology, map_geometry.zoom_tolerance(zoom), simplify_method)
+    outline = map_geometry.topology_to_geojson(topology)
+    map_geometry.report_size('首次繪製的輪廓', map_geometry.geojson_size(taiwan_geojson),
+                             map_geometry.geojson_size(outline))
+    return outline
 
-def create_language_map():
-    """創建台灣語言分布地圖"""
+def split_geometry_chunks(taiwan_geojson, county_ids, max_features=CHUNK_FEATURES):
+    """依 GEOMETRY_CHUNKS 將區域分成依序載入的區塊，返回 [(名稱, [要素索引])]，沒有區域的區塊省略"""
+    chunk_names = {}
+    for name, counties in GEOMETRY_CHUNKS:
+        for county in counties:
+            county_id = resolve_county_id(county, county_ids)
+            if county_id:
+                chunk_names[county_id] = name
+    members = {name: [] for name, _ in GEOMETRY_CHUNKS}
+    for index, feature in enumerate(taiwan_geojson['features']):
+        county_id = feature['properties'].get('county_id')
+        members[chunk_names.get(county_id, GEOMETRY_CHUNKS[0][0])].append(index)
+    return [(name, members[name][start:start + max_features])
+            for name, _ in GEOMETRY_CHUNKS for start in range(0, len(members[name]), max_features)]
+
+def build_progressive_assets(asset_dir, taiwan_geojson, dataset=None, precision=map_geometry.DEFAULT_PRECISION,
+                             simplify_method='dp'):
+    """寫出漸進載入的地理數據區塊（<序號>-<名稱>.json）與語言數據（data.json），返回頁面的設定
+
+    taiwan_geojson 為已經過 prepare_map_geometry 的完整解析度地理數據。返回的 outline 是
+    內嵌在頁面中的輪廓，每個區域標記所屬區塊的序號（chunk），區塊載入後取代這些區域；
+    chunks 與 data 為相對於 asset_dir 的網址，附上內容雜湊以免瀏覽器使用舊的快取。
+    """
+    dataset = dataset or get_dataset()
+    os.makedirs(asset_dir, exist_ok=True)
+    outline = create_outline(taiwan_geojson, precision, simplify_method)
+
+    def write_asset(filename, content):
+        body = json.dumps(content, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        with open(os.path.join(asset_dir, filename), 'wb') as file:
+            file.write(body)
+        return f'{filename}?v={hashlib.sha256(body).hexdigest()[:12]}', len(body)
+
+    index = {'chunks': []}
+    for number, (name, members) in enumerate(split_geometry_chunks(taiwan_geojson, dataset.county_ids)):
+        url, size = write_asset(f'{number}-{name}.json', {
+            'type': 'FeatureCollection',
+            'features': [taiwan_geojson['features'][member] for member in members]
+        })
+        for member in members:
+            feature = outline['features'][member]
+            outline['features'][member] = dict(feature, properties=dict(feature['properties'], chunk=number))
+        index['chunks'].append({'name': name, 'url': url, 'features': len(members), 'bytes': size})
+    index['data'], _ = write_asset('data.json', create_map_data(taiwan_geojson, dataset))
+
+    # 移除之前產生、這次沒有用到的區塊
+    current = {entry['url'].split('?')[0] for entry in index['chunks']} | {'data.json', 'index.json'}
+    for path in glob.glob(os.path.join(asset_dir, '*.json')):
+        if os.path.basename(path) not in current:
+            os.remove(path)
+    with open(os.path.join(asset_dir, 'index.json'), 'w', encoding='utf-8') as file:
+        json.dump(index, file, ensure_ascii=False, indent=2)
+    print(f"已產生 {len(index['chunks'])} 個地理數據區塊與語言數據到 '{asset_dir}'")
+    return {'outline': outline, 'chunks': [entry['url'] for entry in index['chunks']], 'data': index['data']}
+
+def create_language_map(taiwan_geojson=None, simplify_tolerance=None, precision=map_geometry.DEFAULT_PRECISION,
+                        simplify_method='dp', geometry_asset=None, township_url=None, dataset=None,
+                        initial_mode='normal', language=None, counties=None, title=None,
+                        prepared=False, write_geometry=True, geometry_url=None, data_url=None, vector_tiles=None,
+                        time_series=None, geometry_chunks=None):
+    """創建台灣語言分布地圖，可傳入已取得的地理數據
+
+    地理數據只輸出一次：預設內嵌在頁面中；指定 geometry_asset 時改寫成
+    與HTML同目錄的外部檔案，頁面載入時再讀取（需經由HTTP開啟）。
+    指定 township_url（build_township_assets 輸出目錄的相對網址）時，
+    點擊縣市會載入該縣市的鄉鎮市區數據。
+
+    批次產生多種版本時：initial_mode 為初始顯示模式（map_modes() 之一），
+    language 產生單一語言分布圖，counties 只顯示指定縣市代碼的區域，
+    title 附加在圖例標題後。prepared 表示地理數據已經過 prepare_map_geometry，
+    write_geometry 為 False 時沿用已寫好的 geometry_asset。
+
+    由伺服器提供時：geometry_url 為頁面載入 geometry_asset 的網址，
+    data_url 為 create_map_data 內容的網址，頁面不再內嵌語言數據。
+
+    vector_tiles 為 build_township_tiles 返回的設定加上圖磚網址（url），
+    放大到 minzoom 以上時以向量圖磚顯示鄉鎮市區。
+
+    time_series 為 build_year_assets 返回的設定加上各年份數據的網址（url），
+    頁面會加上時間滑桿，移動時才載入該年份的數據並重新套用樣式。
+
+    漸進載入時（build_progressive_assets）：taiwan_geojson 為先繪製的低解析度輪廓，
+    geometry_chunks 為依序載入的完整解析度區塊網址，載入後取代對應的輪廓。
+    外部的JSON（語言數據、區塊、年份與鄉鎮市區）在 Web Worker 中下載與解析。
+    """
+    import folium
+    dataset = dataset or get_dataset()
+    registry = get_language_registry()
+    modes = map_modes()
+    
     # 創建地圖對象，將中心點設在台灣中心位置
     m = folium.Map(
         location=[23.5, 121], 
@@ -278,17 +1244,63 @@ def create_language_map():
         tiles='CartoDB positron'
     )
     
-    # 下載台灣縣市邊界的 GeoJSON 數據
-    taiwan_geojson = download_taiwan_geojson()
+    # 下載台灣縣市邊界的 GeoJSON 數據（優先使用本地快取）
+    if taiwan_geojson is None:
+        taiwan_geojson = download_taiwan_geojson()
     if not taiwan_geojson:
         print("無法創建地圖：缺少地理數據")
         return None
+    if not prepared:
+        with map_instrument.stage('geometry'):
+            taiwan_geojson = prepare_map_geometry(taiwan_geojson, simplify_tolerance, precision, simplify_method,
+                                                  dataset)
+    with map_instrument.stage('styles'):
+        map_data = create_map_data(taiwan_geojson, dataset, language)
+    initial_styles = map_data['modeStyles'][initial_mode]
+    
+    def style_function(feature):
+        """邊框相同，填色為初始模式的CSS類別（直接查詢預先計算的類別表）"""
+        return {
+            'color': 'black',
+            'weight': 1,
+            'className': 'lang-area ' + initial_styles[feature['properties'].get('county_id', '')]
+        }
+    
+    # 所有縣市共用一個圖層，切換模式時只替換CSS類別
+    if geometry_asset:
+        if write_geometry:
+            write_geometry_asset(taiwan_geojson, geometry_asset)
+        geo_layer = folium.GeoJson(
+            geometry_asset,
+            name='語言分布',
+            style_function=style_function,
+            embed=False
+        )
+        geo_layer.embed_link = geometry_url or os.path.basename(geometry_asset)
+    else:
+        geo_layer = folium.GeoJson(
+            taiwan_geojson,
+            name='語言分布',
+            style_function=style_function
+        )
+    geo_layer.add_to(m)
+    map_instrument.count('features_rendered', len(taiwan_geojson['features']))
     
-    # 默認只添加包含華語的圖層
-    normal_layer = create_language_layers(m, taiwan_geojson, False)
-    normal_layer.add_to(m)
+    # 向量圖磚圖層：樣式在數據載入後才設定，之前不繪製
+    tile_layer = None
+    if vector_tiles:
+        from folium.plugins import VectorGridProtobuf
+        tile_options = '''{
+            "vectorTileLayerStyles": {%s: function() { return {fill: false, weight: 0}; }},
+            "interactive": true,
+            "minZoom": %d,
+            "maxNativeZoom": %d,
+            "rendererFactory": L.canvas.tile
+        }''' % (json.dumps(vector_tiles['layer']), vector_tiles['minzoom'], vector_tiles['maxzoom'])
+        tile_layer = VectorGridProtobuf(vector_tiles['url'], '鄉鎮市區', tile_options)
+        tile_layer.add_to(m)
     
-    # 添加自定義的單選按鈕控制
+    # 添加自定義的單選按鈕控制（單一語言分布圖不需要切換）
     toggle_html = '''
     <div id="language-toggle" style="position: fixed; 
                 top: 10px; right: 10px; 
@@ -301,239 +1313,482 @@ def create_language_map():
                 font-family: Arial, sans-serif;">
         <div style="font-weight: bold; margin-bottom: 12px; color: #333; font-size: 14px;">
             語言顯示模式
-        </div>
-        <label style="display: block; margin-bottom: 10px; cursor: pointer; font-size: 13px;">
-            <input type="radio" name="language_mode" value="normal" checked 
-                   style="margin-right: 8px; transform: scale(1.2);">
-            <span style="color: #333;">包含華語</span>
-        </label>
-        <label style="display: block; cursor: pointer; font-size: 13px;">
-            <input type="radio" name="language_mode" value="exclude" 
+        </div>''' + ''.join('''
+        <label style="display: block;%s cursor: pointer; font-size: 13px;">
+            <input type="radio" name="language_mode" value="%s"%s
                    style="margin-right: 8px; transform: scale(1.2);">
-            <span style="color: #333;">排除華語</span>
-        </label>
+            <span style="color: #333;">%s</span>
+        </label>''' % ('' if index == len(modes) - 1 else ' margin-bottom: 10px;', mode,
+                     ' checked' if initial_mode == mode else '', label)
+                     for index, (mode, label) in enumerate(modes)) + '''
     </div>
+    ''' if not language else ''
     
+    # 時間滑桿與變化分布圖的語言選單（單一語言分布圖不提供）
+    if time_series and not language:
+        years = time_series['years']
+        toggle_html += '''
+    <div id="year-control" style="position: fixed;
+                bottom: 30px; left: 10px;
+                z-index: 1000;
+                background-color: white;
+                border: 2px solid #ccc;
+                border-radius: 8px;
+                padding: 12px 15px;
+                box-shadow: 0 2px 10px rgba(0,0,0,0.3);
+                font-family: Arial, sans-serif; font-size: 13px; color: #333;">
+        <div style="font-weight: bold; margin-bottom: 8px;">調查年份：<span id="year-label">''' + str(time_series['initial']) + '''</span></div>
+        <input type="range" id="year-slider" min="0" max="''' + str(len(years) - 1) + '''" step="1"
+               value="''' + str(years.index(time_series['initial'])) + '''" style="width: 200px;">
+        <div style="display: flex; justify-content: space-between; width: 200px; font-size: 11px; color: #666;">
+            ''' + ''.join(f'<span>{year}</span>' for year in years) + '''
+        </div>
+        <div style="margin-top: 10px;">
+            <select id="delta-language" style="font-size: 13px;">
+                <option value="">不顯示變化</option>''' + ''.join(f'''
+                <option value="{lang}">{lang}：與上一次調查相比</option>''' for lang in time_series['languages']) + '''
+            </select>
+        </div>
+        <div style="margin-top: 6px; font-size: 11px; color: #666;">
+            <span style="color: ''' + DELTA_COLORS[1] + ''';">■</span> 增加
+            <span style="color: ''' + DELTA_COLORS[0] + ''';">■</span> 減少（''' + str(DELTA_SCALE) + ''' 個百分點以上最深）
+        </div>
+    </div>
+    '''
+    
+    toggle_html += '''
+    <style>''' + POPUP_CSS + AREA_CSS + style_rules(map_data['styleClasses']) + '''</style>
     <script>
         // 等待地圖完全載入
         document.addEventListener('DOMContentLoaded', function() {
-            // 獲取地圖實例
-            var mapObj = window[Object.keys(window).find(key => key.startsWith('map_'))];
+            // 地圖實例與所有縣市共用的 folium 圖層
+            var mapObj = ''' + m.get_name() + ''';
+            var geoLayer = ''' + geo_layer.get_name() + ''';
+            var currentMode = ''' + json.dumps(initial_mode) + ''';
             
-            // 預先創建兩種模式的GeoJSON數據
-            var normalData = ''' + json.dumps(taiwan_geojson) + ''';
-            var excludeData = ''' + json.dumps(taiwan_geojson) + ''';
-            var languageData = ''' + json.dumps(language_data) + ''';
-            var languageNotes = ''' + json.dumps(language_notes) + ''';
+            // 語言數據、縣市名稱、統計指標與各模式的樣式表，皆以縣市代碼為鍵
+            // （地理數據已在圖層中，不再重複輸出）；指定 dataUrl 時由伺服器另外載入
+            var dataUrl = ''' + json.dumps(data_url) + ''';
+            var mapData = ''' + ('null' if data_url else json.dumps(map_data)) + ''';
+            var languageData = {};
+            var languageNotes = {};
+            var countyNames = {};
+            var countyMetrics = {};
+            var modeStyles = {};
+            var styleClasses = ''' + json.dumps(map_data['styleClasses']) + ''';
             
-            // 當前顯示的圖層
-            var currentLayers = [];
+            // 只顯示部分縣市時的縣市代碼列表（全部顯示時為null）
+            var visibleCounties = ''' + json.dumps(sorted(counties) if counties else None) + ''';
             
-            // 縣市名稱標準化函數
-            function normalizeCountyName(name) {
-                if (!name) return name;
-                
-                // 處理台/臺的轉換
-                name = name.replace(/台/g, '臺');
-                
-                // 處理簡繁體字轉換
-                name = name.replace(/云/g, '雲');  // 云林縣 -> 雲林縣
-                name = name.replace(/慄/g, '栗');  // 苗慄縣 -> 苗栗縣
-                
-                // 處理行政區劃變更
-                var mapping = {
-                    '桃園縣': '桃園市',
-                    '臺北縣': '新北市',
-                    '台北縣': '新北市'
-                };
-                return mapping[name] || name;
+            // 鄉鎮市區數據的位置（未啟用時為null），點擊縣市時才載入
+            var townshipUrl = ''' + json.dumps(township_url) + ''';
+            var townshipRequests = {};
+            var townshipLayer = null;
+            
+            // 鄉鎮市區向量圖磚（未啟用時為null），只下載目前視野內的圖磚
+            var vectorTiles = ''' + json.dumps({key: value for key, value in vector_tiles.items() if key != 'url'}
+                                             if vector_tiles else None, ensure_ascii=False) + ''';
+            var tileLayer = ''' + (tile_layer.get_name() if tile_layer else 'null') + ''';
+            
+            // 各調查年份（未啟用時為null），地理數據共用，移動滑桿時才載入該年份的數據
+            var timeSeries = ''' + (json.dumps(time_series, ensure_ascii=False) if time_series and not language
+                                    else 'null') + ''';
+            var yearRequests = {};
+            var currentYear = timeSeries ? timeSeries.initial : null;
+            var baseYear = null;
+            var yearChanges = {};
+            var noDataClass = ''' + json.dumps(style_class(get_dominant_style(None))) + ''';
+            
+            // 完整解析度的地理數據區塊（未啟用漸進載入時為null），依序取代先繪製的低解析度輪廓
+            var geometryChunks = ''' + json.dumps(geometry_chunks) + ''';
+            var started = false;
+            
+            // 首次繪製、語言數據與地理數據載入完成的時間（毫秒，自頁面開始載入起算），也以 performance.mark 記錄
+            var loadTimings = window.languageMapTimings = {};
+            
+            function markTiming(name) {
+                loadTimings[name] = Math.round(performance.now());
+                if (performance.mark) performance.mark('language-map:' + name);
             }
             
-            // 獲取主要語言
-            function getDominantLanguage(langData, excludeMandarin) {
-                if (!langData) return null;
-                var dataToCompare = {};
-                for (var lang in langData) {
-                    if (excludeMandarin && lang === "華語") continue;
-                    dataToCompare[lang] = langData[lang];
+            // 外部的JSON在 Web Worker 中下載與解析，不佔用主執行緒；無法建立 Worker 時改用 fetch
+            var jsonWorker = null;
+            var workerRequests = {};
+            var workerRequestCount = 0;
+            if (window.Worker) {
+                try {
+                    jsonWorker = new Worker(URL.createObjectURL(new Blob([
+                        'onmessage = function(event) {' +
+                        '    fetch(event.data.url).then(function(response) {' +
+                        '        if (!response.ok) throw new Error(response.status);' +
+                        '        return response.json();' +
+                        '    }).then(function(data) {' +
+                        '        postMessage({id: event.data.id, data: data});' +
+                        '    }, function(error) {' +
+                        '        postMessage({id: event.data.id, error: String(error)});' +
+                        '    });' +
+                        '};'
+                    ], {type: 'text/javascript'})));
+                    jsonWorker.onmessage = function(event) {
+                        var request = workerRequests[event.data.id];
+                        delete workerRequests[event.data.id];
+                        if ('error' in event.data) {
+                            request.reject(new Error(event.data.error));
+                        } else {
+                            request.resolve(event.data.data);
+                        }
+                    };
+                } catch (error) {
+                    jsonWorker = null;
                 }
-                if (Object.keys(dataToCompare).length === 0) return null;
-                
-                var maxLang = null;
-                var maxValue = -1;
-                for (var lang in dataToCompare) {
-                    if (dataToCompare[lang] > maxValue) {
-                        maxValue = dataToCompare[lang];
-                        maxLang = lang;
-                    }
+            }
+            
+            function loadJson(url) {
+                if (!jsonWorker) {
+                    return fetch(url).then(function(response) {
+                        if (!response.ok) throw new Error(response.status);
+                        return response.json();
+                    });
                 }
-                return maxLang ? [maxLang, maxValue] : null;
+                return new Promise(function(resolve, reject) {
+                    var id = ++workerRequestCount;
+                    workerRequests[id] = {resolve: resolve, reject: reject};
+                    // Worker 由 Blob 建立，相對網址要先以頁面的位置解析
+                    jsonWorker.postMessage({id: id, url: new URL(url, document.baseURI).href});
+                });
             }
             
-            // 創建彈窗內容
-            function createPopupContent(areaName, langData, excludeMandarin) {
-                if (!langData) return "<h4>" + areaName + "</h4>暫無語言數據";
-                
-                var content = '<div style="min-width: 300px"><h4 style="text-align: center">' + 
-                             areaName + '語言使用比例</h4><div style="padding: 10px;">';
-                
-                var sortedLangs = Object.keys(langData).map(function(lang) {
-                    return [lang, langData[lang]];
-                }).sort(function(a, b) { return b[1] - a[1]; });
-                
-                var colorMap = {
-                    '華語': '#FF6B6B',
-                    '閩南語': '#4ECB71', 
-                    '客家話': '#6B8EFF',
-                    '原住民語': '#FFD93D'
-                };
+            // 建置時沒有的樣式（其他年份、鄉鎮市區）在第一次用到時才加入CSS規則
+            var styleSheet = document.createElement('style');
+            document.head.appendChild(styleSheet);
+            
+            function defineStyle(fill, opacity) {
+                var className = 'ls-' + fill.replace(/[^0-9a-zA-Z]/g, '').toLowerCase() + '-' + Math.round(opacity * 1000);
+                if (!(className in styleClasses)) {
+                    styleClasses[className] = [fill, opacity];
+                    styleSheet.sheet.insertRule('.' + className + ' { fill: ' + fill + '; fill-opacity: ' + opacity + '; }',
+                                                styleSheet.sheet.cssRules.length);
+                }
+                return className;
+            }
+            
+            // 替換區域的填色類別；沒有SVG元素時（例如Canvas繪製）改以 setStyle 套用同樣的填色
+            function setStyleClass(layer, className) {
+                var element = layer.getElement && layer.getElement();
+                var previous = layer.styleClass || (layer.options.className || '').split(' ').pop();
+                if (previous === className) return;
+                layer.styleClass = className;
+                if (element) {
+                    if (previous) element.classList.remove(previous);
+                    element.classList.add(className);
+                } else if (styleClasses[className]) {
+                    layer.setStyle({fill: true, fillColor: styleClasses[className][0], fillOpacity: styleClasses[className][1]});
+                } else {
+                    layer.setStyle({fill: false});
+                }
+            }
+            
+            // 彈窗在開啟時才由語言數據產生，並依「區域 + 模式」保存結果，外觀由共用的CSS類別決定
+            // 語言的顏色、顯示順序（比例相同時的排列）與各模式排除的語言都來自語言登錄表
+            var languageColors = ''' + json.dumps(registry['colors'], ensure_ascii=False) + ''';
+            var defaultColor = ''' + json.dumps(registry['default_color']) + ''';
+            var languageOrder = ''' + json.dumps({lang: index for index, lang in enumerate(registry['languages'])},
+                                               ensure_ascii=False) + ''';
+            var modeExclusions = ''' + json.dumps({mode: dict.fromkeys(excluded, True)
+                                                for mode, excluded in registry['exclusions'].items()},
+                                               ensure_ascii=False) + ''';
+            var popupCache = {};
+            
+            function languageRank(lang) {
+                return lang in languageOrder ? languageOrder[lang] : Infinity;
+            }
+            
+            function renderPopup(areaName, langData, excluded, note, metrics, yearInfo) {
+                if (!langData) return '<div class="lang-popup"><h4>' + areaName + '</h4>暫無語言數據</div>';
                 
+                var sortedLangs = Object.keys(langData).sort(function(a, b) {
+                    return langData[b] - langData[a] || languageRank(a) - languageRank(b);
+                });
+                var rows = [];
                 for (var i = 0; i < sortedLangs.length; i++) {
-                    var lang = sortedLangs[i][0];
-                    var percentage = sortedLangs[i][1];
-                    if (excludeMandarin && lang === "華語") continue;
-                    
-                    var barColor = colorMap[lang] || '#4188e0';
-                    var widthPercent = Math.min(percentage, 100); // 確保寬度不超過100%
-                    content += '<div style="margin: 10px 0;">' +
-                              '<div style="display: flex; justify-content: space-between; margin-bottom: 2px;">' +
-                              '<span style="font-weight: bold; color: ' + barColor + '">' + lang + '</span>' +
-                              '<span>' + percentage + '%</span></div>' +
-                              '<div style="background-color: #f0f0f0; border-radius: 4px; height: 20px; overflow: hidden;">' +
-                              '<div style="width: ' + widthPercent + '%; height: 100%; background-color: ' + barColor + ';"></div>' +
-                              '</div></div>';
+                    var lang = sortedLangs[i];
+                    if (excluded[lang]) continue;
+                    var color = languageColors[lang] || defaultColor;
+                    var percentage = langData[lang];
+                    // 縣市另外顯示該語言在所有縣市中的名次與標準分數
+                    var details = metrics && metrics.rank[lang] ?
+                        '<span class="lang-rank">第' + metrics.rank[lang] + '名，z = ' + metrics.zscore[lang] + '</span>' : '';
+                    // 有上一次調查時顯示變化的百分點
+                    if (yearInfo && yearInfo.delta && lang in yearInfo.delta) {
+                        var delta = yearInfo.delta[lang];
+                        details += '<span class="lang-delta">較' + yearInfo.base + '年' + (delta > 0 ? '+' : delta === 0 ? '±' : '') + delta + '</span>';
+                    }
+                    // 確保寬度不超過100%
+                    rows.push('<div class="lang-row"><div class="lang-label"><b style="color: ' + color + '">' +
+                              lang + '</b><span>' + percentage + '%' + details + '</span></div><div class="lang-bar">' +
+                              '<div style="width: ' + Math.min(percentage, 100) + '%; background: ' + color +
+                              '"></div></div></div>');
+                }
+                var content = '<div class="lang-popup"><h4>' + areaName + '語言使用比例' +
+                              (yearInfo ? '（' + yearInfo.year + '年）' : '') + '</h4>' + rows.join('');
+                if (metrics) {
+                    content += '<div class="lang-metrics"><b>語言多樣性：</b>Shannon ' + metrics.shannon +
+                               '，Simpson ' + metrics.simpson +
+                               '<br><small>以各語言使用比例（可複選）正規化後的比重計算</small></div>';
                 }
-                
                 // 添加備註信息（如果有的話）
-                if (languageNotes[areaName]) {
-                    var note = languageNotes[areaName];
-                    content += '<hr style="margin: 15px 0; border: none; border-top: 1px solid #ddd;">' +
-                              '<div style="background-color: #f8f9fa; padding: 8px; border-radius: 4px; font-size: 12px;">' +
-                              '<span style="font-weight: bold; color: #6c757d;">📝 備註：</span>' +
-                              '<span style="color: #495057;">' + note + '</span>' +
-                              '</div>';
+                if (note) {
+                    content += '<div class="lang-note"><b>📝 備註：</b>' + note + '</div>';
                 }
-                
-                content += '</div></div>';
-                return content;
+                return content + '</div>';
             }
             
-            // 獲取樣式
-            function getStyle(feature, excludeMandarin) {
-                var countyName = feature.properties.COUNTYNAME;
-                var normalizedName = normalizeCountyName(countyName);
-                
-                var possibleNames = [
-                    normalizedName,
-                    countyName,
-                    normalizedName.replace('縣', '市'),
-                    countyName.replace('縣', '市')
-                ];
-                
+            function cachedPopup(key, render) {
+                key += '|' + currentMode;
+                if (!(key in popupCache)) popupCache[key] = render(modeExclusions[currentMode] || {});
+                return popupCache[key];
+            }
+            
+            // 鄉鎮市區沒有逐年數據，顯示變化時只畫邊界，透出下方縣市的顏色
+            var outlineStyle = {fill: false, color: 'black', weight: 0.5};
+            
+            function townshipClass(feature) {
+                var style = feature.properties.style[currentMode];
+                return style ? defineStyle(style.fillColor, style.fillOpacity) : 'ls-outline';
+            }
+            
+            function tileStyle(properties) {
+                if (!(('fill_' + currentMode) in properties)) return outlineStyle;
+                return {
+                    fill: true,
+                    fillColor: properties['fill_' + currentMode],
+                    fillOpacity: properties['opacity_' + currentMode],
+                    color: 'black',
+                    weight: 0.5
+                };
+            }
+            
+            function tilePopup(properties) {
                 var langData = null;
-                for (var i = 0; i < possibleNames.length; i++) {
-                    if (languageData[possibleNames[i]]) {
-                        langData = languageData[possibleNames[i]];
-                        break;
+                vectorTiles.languages.forEach(function(lang) {
+                    if (lang in properties) {
+                        langData = langData || {};
+                        langData[lang] = properties[lang];
                     }
+                });
+                return cachedPopup(properties.county_id + '/' + properties.name, function(excluded) {
+                    return renderPopup(properties.name, langData, excluded);
+                });
+            }
+            
+            function countyPopup(countyId) {
+                return cachedPopup(countyId, function(excluded) {
+                    var yearInfo = timeSeries ? {year: currentYear, base: baseYear, delta: yearChanges[countyId]} : null;
+                    return renderPopup(countyNames[countyId], languageData[countyId], excluded,
+                                       languageNotes[countyId], countyMetrics[countyId], yearInfo);
+                });
+            }
+            
+            // 切換模式：只替換每個區域的CSS類別（樣式表已預先算好），彈窗在下次開啟時依新模式產生
+            function applyMode(mode) {
+                // 變化分布圖的樣式在載入年份數據後才有，之前顯示為無數據
+                var styles = modeStyles[mode] || {};
+                currentMode = mode;
+                geoLayer.eachLayer(function(layer) {
+                    setStyleClass(layer, styles[layer.feature.properties.county_id || ''] || noDataClass);
+                });
+                if (townshipLayer) {
+                    townshipLayer.eachLayer(function(layer) {
+                        setStyleClass(layer, townshipClass(layer.feature));
+                    });
                 }
-                
-                if (langData) {
-                    var dominant = getDominantLanguage(langData, excludeMandarin);
-                    if (dominant) {
-                        var colorMap = {
-                            '華語': '#FF6B6B',
-                            '閩南語': '#4ECB71',
-                            '客家話': '#6B8EFF', 
-                            '原住民語': '#FFD93D'
-                        };
-                        return {
-                            fillColor: colorMap[dominant[0]] || '#cccccc',
-                            color: 'black',
-                            weight: 1,
-                            fillOpacity: 0.7
-                        };
-                    }
+                if (tileLayer) {
+                    tileLayer.redraw();
                 }
-                
-                return {
-                    fillColor: '#cccccc',
-                    color: 'black', 
-                    weight: 1,
-                    fillOpacity: 0.3
-                };
             }
             
-            // 清除當前圖層
-            function clearCurrentLayers() {
-                currentLayers.forEach(function(layer) {
-                    mapObj.removeLayer(layer);
+            // 年份數據中的樣式只有填色與透明度，載入時轉成CSS類別
+            function expandStyles(compactStyles) {
+                var styles = {};
+                Object.keys(compactStyles).forEach(function(mode) {
+                    styles[mode] = {};
+                    Object.keys(compactStyles[mode]).forEach(function(areaId) {
+                        var style = compactStyles[mode][areaId];
+                        styles[mode][areaId] = defineStyle(style[0], style[1]);
+                    });
                 });
-                currentLayers = [];
+                return styles;
             }
             
-            // 添加圖層
-            function addLanguageLayers(excludeMandarin) {
-                clearCurrentLayers();
-                
-                normalData.features.forEach(function(feature) {
-                    var countyName = feature.properties.COUNTYNAME;
-                    var normalizedName = normalizeCountyName(countyName);
-                    
-                    var possibleNames = [
-                        normalizedName,
-                        countyName,
-                        normalizedName.replace('縣', '市'),
-                        countyName.replace('縣', '市')
-                    ];
-                    
-                    var langData = null;
-                    var displayName = normalizedName;
-                    for (var i = 0; i < possibleNames.length; i++) {
-                        if (languageData[possibleNames[i]]) {
-                            langData = languageData[possibleNames[i]];
-                            displayName = possibleNames[i];
-                            break;
-                        }
-                    }
-                    
-                    if (langData) {
-                        var style = getStyle(feature, excludeMandarin);
-                        var popupContent = createPopupContent(displayName, langData, excludeMandarin);
-                        
-                        var layer = L.geoJson(feature, {
-                            style: style,
-                            onEachFeature: function(feature, layer) {
-                                layer.bindPopup(popupContent, {maxWidth: 300});
-                                layer.on('mouseover', function() {
-                                    this.setStyle({
-                                        fillColor: "#43484A",
-                                        color: 'black',
-                                        weight: 2,
-                                        fillOpacity: 0.7
-                                    });
-                                });
-                                layer.on('mouseout', function() {
-                                    this.setStyle(style);
+            // 切換調查年份：每個年份只下載一次，只替換數據與樣式表，圖層不重建
+            function showYear(year) {
+                if (!yearRequests[year]) {
+                    yearRequests[year] = loadJson(timeSeries.url + year + '.json');
+                }
+                currentYear = year;
+                document.getElementById('year-label').textContent = year;
+                yearRequests[year].then(function(data) {
+                    // 快速拖動滑桿時只套用最後選擇的年份
+                    if (year !== currentYear) return;
+                    languageData = data.languageData;
+                    countyMetrics = data.metrics;
+                    yearChanges = data.delta;
+                    baseYear = data.base;
+                    modeStyles = expandStyles(data.modeStyles);
+                    popupCache = {};
+                    mapObj.closePopup();
+                    applyMode(currentMode);
+                }).catch(function(error) {
+                    console.warn('無法載入調查年份數據：' + year, error);
+                });
+            }
+            
+            // 載入並顯示指定縣市的鄉鎮市區，每個縣市只下載一次
+            function showTownships(countyId) {
+                if (!townshipUrl || !countyId) return;
+                if (!townshipRequests[countyId]) {
+                    townshipRequests[countyId] = loadJson(townshipUrl + countyId + '.json');
+                }
+                townshipRequests[countyId].then(function(townships) {
+                    if (townshipLayer) mapObj.removeLayer(townshipLayer);
+                    townshipLayer = L.geoJson(townships, {
+                        style: function(feature) {
+                            return {color: 'black', weight: 1, className: townshipClass(feature)};
+                        },
+                        onEachFeature: function(feature, layer) {
+                            var properties = feature.properties;
+                            layer.bindPopup(function() {
+                                return cachedPopup(countyId + '/' + properties.name, function(excluded) {
+                                    return renderPopup(properties.name, properties.data, excluded);
                                 });
-                            }
-                        }).addTo(mapObj);
-                        
-                        currentLayers.push(layer);
-                    }
+                            }, {maxWidth: 300});
+                        }
+                    }).addTo(mapObj);
+                }).catch(function(error) {
+                    console.warn('無法載入鄉鎮市區數據：' + countyId, error);
+                });
+            }
+            
+            // 設定一個縣市區域：移除不顯示的縣市、綁定彈窗函數（每個區域只綁定一次）並套用目前模式的樣式
+            function prepareArea(layer) {
+                var countyId = layer.feature.properties.county_id || '';
+                layer.areaReady = true;
+                if (visibleCounties && visibleCounties.indexOf(countyId) === -1) {
+                    geoLayer.removeLayer(layer);
+                    return;
+                }
+                if (languageData[countyId] || (timeSeries && countyId)) {
+                    layer.bindPopup(function() {
+                        return countyPopup(countyId);
+                    }, {maxWidth: 300});
+                }
+                setStyleClass(layer, (modeStyles[currentMode] || {})[countyId] || noDataClass);
+            }
+            
+            // 以完整解析度的區塊取代同一區塊的輪廓；數據載入前到達的區域由 start 一併設定
+            function replaceOutline(index, chunk) {
+                geoLayer.eachLayer(function(layer) {
+                    if (layer.feature.properties.chunk === index) geoLayer.removeLayer(layer);
+                });
+                geoLayer.addData(chunk);
+                if (started) {
+                    geoLayer.eachLayer(function(layer) {
+                        if (!layer.areaReady) prepareArea(layer);
+                    });
+                }
+            }
+            
+            // 所有區塊同時請求，依序套用：本島先取代輪廓，離島其後
+            function loadGeometryChunks() {
+                geometryChunks.map(loadJson).reduce(function(previous, request, index) {
+                    return previous.then(function() {
+                        return request;
+                    }).then(function(chunk) {
+                        replaceOutline(index, chunk);
+                        markTiming('chunk' + index);
+                    }, function(error) {
+                        console.warn('無法載入地理數據區塊：' + geometryChunks[index], error);
+                    });
+                }, Promise.resolve()).then(function() {
+                    markTiming('geometry');
                 });
             }
             
-            // 初始化顯示正常模式
-            addLanguageLayers(false);
+            // 取得數據後才套用樣式與綁定事件
+            function start(data) {
+                languageData = data.languageData;
+                languageNotes = data.languageNotes;
+                countyNames = data.countyNames;
+                countyMetrics = data.metrics;
+                modeStyles = data.modeStyles;
+                // 由伺服器提供的數據可能比頁面新，補上頁面中沒有的類別
+                Object.keys(data.styleClasses).forEach(function(className) {
+                    defineStyle(data.styleClasses[className][0], data.styleClasses[className][1]);
+                });
+                
+                // 設定已繪製的區域，只顯示部分縣市時將視野縮放到這些區域
+                started = true;
+                geoLayer.eachLayer(prepareArea);
+                if (visibleCounties) {
+                    mapObj.fitBounds(geoLayer.getBounds());
+                }
+                markTiming('data');
+                
+                if (tileLayer) {
+                    tileLayer.options.vectorTileLayerStyles[vectorTiles.layer] = tileStyle;
+                    tileLayer.on('click', function(e) {
+                        L.popup({maxWidth: 300}).setLatLng(e.latlng)
+                            .setContent(tilePopup(e.layer.properties)).openOn(mapObj);
+                    });
+                }
+                
+                // 初始化顯示初始模式
+                applyMode(currentMode);
+                geoLayer.on('click', function(e) {
+                    showTownships(e.layer.feature.properties.county_id);
+                });
+                
+                // 監聽單選按鈕變化
+                var deltaSelect = document.getElementById('delta-language');
+                document.querySelectorAll('input[name="language_mode"]').forEach(function(radio) {
+                    radio.addEventListener('change', function() {
+                        if (deltaSelect) deltaSelect.value = '';
+                        applyMode(this.value);
+                    });
+                });
+                
+                if (timeSeries) {
+                    document.getElementById('year-slider').addEventListener('input', function() {
+                        showYear(timeSeries.years[this.value]);
+                    });
+                    // 選擇語言時顯示該語言與上一次調查相比的變化，選回「不顯示變化」時回到單選按鈕的模式
+                    deltaSelect.addEventListener('change', function() {
+                        var checked = document.querySelector('input[name="language_mode"]:checked');
+                        applyMode(this.value ? 'delta:' + this.value : (checked ? checked.value : 'normal'));
+                    });
+                    showYear(currentYear);
+                }
+            }
             
-            // 監聽單選按鈕變化
-            document.querySelectorAll('input[name="language_mode"]').forEach(function(radio) {
-                radio.addEventListener('change', function() {
-                    var excludeMandarin = this.value === 'exclude';
-                    addLanguageLayers(excludeMandarin);
+            if (dataUrl) {
+                loadJson(dataUrl).then(start).catch(function(error) {
+                    console.warn('無法載入語言數據：' + dataUrl, error);
                 });
-            });
+            } else {
+                start(mapData);
+            }
+            
+            // 輪廓（或內嵌的完整地理數據）在這段腳本結束後的第一個畫面繪製
+            if (window.requestAnimationFrame) {
+                requestAnimationFrame(function() {
+                    markTiming('firstPaint');
+                });
+            } else {
+                markTiming('firstPaint');
+            }
+            if (geometryChunks) {
+                loadGeometryChunks();
+            }
         });
     </script>
     '''
@@ -541,6 +1796,42 @@ def create_language_map():
     m.get_root().html.add_child(folium.Element(toggle_html))
     
     # 添加圖例
+    if language:
+        color_legend = '''        <p style="margin: 5px 0;"><b>顏色深淺代表''' + language + '''使用比例：</b></p>
+''' + ''.join('''        <div style="margin: 5px 0;">
+            <span style="display: inline-block; width: 20px; height: 20px; background-color: %s; opacity: %s; border: 1px solid black;"></span>
+            <span style="margin-left: 5px;">%d%%</span>
+        </div>
+''' % (language_color(language), round(0.1 + 0.8 * share / 100, 3), share)
+                  for share in (0, 50, 100))
+    else:
+        color_legend = '''        <p style="margin: 5px 0;"><b>顏色代表主要使用語言：</b></p>
+''' + ''.join('''        <div style="margin: 5px 0;">
+            <span style="display: inline-block; width: 20px; height: 20px; background-color: %s; border: 1px solid black;"></span>
+            <span style="margin-left: 5px;">%s</span>
+        </div>
+''' % (registry['colors'][lang], lang) for lang in registry['languages']) + '''        <p style="margin: 5px 0;"><b>多樣性模式的顏色深淺代表指數高低</b>（以可複選的使用比例正規化後計算）：</p>
+''' + ''.join('''        <div style="margin: 5px 0;">
+            <span style="display: inline-block; width: 20px; height: 20px; background-color: %s; opacity: %s; border: 1px solid black;"></span>
+            <span style="margin-left: 5px;">%s</span>
+        </div>
+''' % (DIVERSITY_COLOR, get_metric_style(value)['fillOpacity'], label)
+                  for value, label in ((0, '單一語言'), (0.5, '中等'), (1, '各語言比重相同')))
+    
+    instructions = [
+        '點擊區域查看詳細語言比例',
+        '部分縣市有額外備註說明',
+        '數據為主要+次要使用之和'
+    ]
+    if not language:
+        instructions.insert(0, f"右上角可切換{'／'.join(label for mode, label in registry['modes'])}或改看語言多樣性")
+    if township_url:
+        instructions.append('點擊縣市可載入鄉鎮市區數據')
+    if vector_tiles:
+        instructions.append(f"放大到第 {vector_tiles['minzoom']} 級以上可查看鄉鎮市區")
+    if time_series and not language:
+        instructions.append('左下角可切換調查年份，並顯示與上一次調查相比的變化')
+    
     legend_html = '''
     <div style="position: fixed; 
                 bottom: 50px; right: 50px; 
@@ -548,32 +1839,12 @@ def create_language_map():
                 background-color: white;
                 padding: 10px;
                 opacity: 0.9;">
-        <p style="margin-bottom: 5px;"><b>台澎金馬語言分布地圖</b></p>
+        <p style="margin-bottom: 5px;"><b>台澎金馬語言分布地圖''' + (f'（{title}）' if title else '') + '''</b></p>
         <p style="margin: 3px 0; font-size: 11px; color: #666;">(基於人口普查真實數據)</p>
-        <p style="margin: 5px 0;"><b>顏色代表主要使用語言：</b></p>
-        <div style="margin: 5px 0;">
-            <span style="display: inline-block; width: 20px; height: 20px; background-color: #FF6B6B; border: 1px solid black;"></span>
-            <span style="margin-left: 5px;">華語</span>
-        </div>
-        <div style="margin: 5px 0;">
-            <span style="display: inline-block; width: 20px; height: 20px; background-color: #4ECB71; border: 1px solid black;"></span>
-            <span style="margin-left: 5px;">閩南語</span>
-        </div>
-        <div style="margin: 5px 0;">
-            <span style="display: inline-block; width: 20px; height: 20px; background-color: #6B8EFF; border: 1px solid black;"></span>
-            <span style="margin-left: 5px;">客家話</span>
-        </div>
-        <div style="margin: 5px 0;">
-            <span style="display: inline-block; width: 20px; height: 20px; background-color: #FFD93D; border: 1px solid black;"></span>
-            <span style="margin-left: 5px;">原住民語</span>
-        </div>
-        <hr style="margin: 10px 0;">
+''' + color_legend + '''        <hr style="margin: 10px 0;">
         <p style="margin: 5px 0;"><b>使用說明：</b></p>
         <div style="font-size: 12px; margin-top: 5px; color: #666;">
-            1. 右上角可切換是否包含華語<br>
-            2. 點擊區域查看詳細語言比例<br>
-            3. 部分縣市有額外備註說明<br>
-            4. 數據為主要+次要使用之和
+            ''' + '<br>\n            '.join(f'{i}. {text}' for i, text in enumerate(instructions, 1)) + '''
         </div>
     </div>
     '''
@@ -581,11 +1852,369 @@ def create_language_map():
     
     return m
 
-if __name__ == '__main__':
+COMMANDS = ('build', 'batch', 'serve', 'export', 'locate', 'benchmark', 'synthetic', 'compile')
+
+# 影響輸出內容的命令列選項，變更時需要重新產生地圖
+BUILD_OPTIONS = ('township_geojson_url', 'simplify_tolerance', 'simplify_method', 'precision', 'external_geometry', 'townships',
+                 'topojson', 'zoom_levels_dir', 'vector_tiles', 'tile_min_zoom', 'tile_max_zoom', 'years', 'progressive')
+PAGE_SCRIPT_ROUNDS = 3  # 效能報告中量測頁面腳本的次數
+
+def geojson_digest(geojson):
+    """地理數據內容的雜湊值，與數據來自快取或網路無關"""
+    content = json.dumps(geojson, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+def build_inputs(args, taiwan_geojson, dataset):
+    """地圖依賴的所有輸入的雜湊值：數據檔、縣市代碼表、語言登錄表、地理數據、頁面模板（程式碼）與選項"""
+    from importlib import metadata
+    try:
+        folium_version = metadata.version('folium')
+    except metadata.PackageNotFoundError:
+        folium_version = None
+    paths = store_sources(dataset.data_dir) + [dataset.counties_path, LANGUAGES_PATH, __file__,
+                                                  map_geometry.__file__, map_analytics.__file__]
+    return {
+        'files': {os.path.abspath(path): map_store.file_sha256(path) for path in paths},
+        'geometry': geojson_digest(taiwan_geojson),
+        'folium': folium_version,
+        'options': {name: getattr(args, name) for name in BUILD_OPTIONS}
+    }
+
+def build_outputs(args):
+    """build 產生的檔案與目錄"""
+    outputs = [args.output]
+    if args.external_geometry and not args.progressive:
+        outputs.append(os.path.splitext(args.output)[0] + '.geojson')
+    if args.progressive:
+        outputs.append(os.path.join(os.path.dirname(os.path.abspath(args.output)), 'progressive', 'index.json'))
+    if args.townships:
+        outputs.append(os.path.join(os.path.dirname(os.path.abspath(args.output)), 'townships', 'index.json'))
+    if args.vector_tiles:
+        outputs.append(os.path.join(os.path.dirname(os.path.abspath(args.output)), 'tiles', 'metadata.json'))
+    if args.years:
+        outputs.append(os.path.join(os.path.dirname(os.path.abspath(args.output)), 'years', 'index.json'))
+    if args.topojson:
+        outputs.append(args.topojson)
+    if args.zoom_levels_dir:
+        outputs.append(args.zoom_levels_dir)
+    return outputs
+
+def build_stamp_path(output):
+    """記錄上次產生時輸入雜湊值的檔案（與HTML同目錄）"""
+    return os.path.splitext(output)[0] + '.build.json'
+
+def build_is_current(args, inputs):
+    """上次產生時的輸入與目前相同，且所有輸出都還在"""
+    try:
+        with open(build_stamp_path(args.output), 'r', encoding='utf-8') as file:
+            stamp = json.load(file)
+    except (FileNotFoundError, ValueError):
+        return False
+    return stamp.get('inputs') == inputs and all(os.path.exists(path) for path in build_outputs(args))
+
+def build_map(args):
+    """依命令列參數產生地圖，輸入未變更時保留既有的輸出
+
+    指定 --instrument（或 --profile、--trace-memory）時記錄各階段耗時與計數，
+    以及首次繪製前的位元組數與頁面腳本的時間（record_page_metrics），並將報告寫在地圖旁邊（<名稱>.report.json）。
+    """
+    instrument = args.instrument or args.profile or args.trace_memory
+    if instrument:
+        map_instrument.enable(profile=args.profile, trace_memory=args.trace_memory)
+    try:
+        with map_instrument.stage('build'):
+            _build_map(args)
+    finally:
+        if instrument:
+            map_instrument.write_report(args.output)
+            map_instrument.disable()
+
+def record_page_metrics(output, geometry_asset=None, rounds=PAGE_SCRIPT_ROUNDS):
+    """將頁面首次繪製前要載入的位元組數與頁面腳本的時間記入效能報告
+
+    首次繪製前必須下載HTML，外部地理數據（--external-geometry）以同步請求載入，也要計入。
+    時間以 Node.js 在 map_benchmark 的替身環境中執行頁面腳本量測，不是瀏覽器的繪製時間：
+    first_chunk_script_ms 為腳本開始執行到初始化完成（第一份地理數據加入圖層），
+    loaded_script_ms 為外部數據與地理數據區塊都套用完成；量測環境另記為 page_script_environment。
+    """
+    import map_benchmark
+    map_instrument.metric('first_paint_bytes', sum(os.path.getsize(path) for path in (output, geometry_asset) if path))
+    timings = map_benchmark.run_page_script(output, rounds) or {}
+    for name, metric in (('first_paint', 'first_chunk_script_ms'), ('loaded', 'loaded_script_ms')):
+        if name in timings:
+            map_instrument.metric(metric, round(timings[name]['median'] * 1000, 1))
+    if timings:
+        map_instrument.metric('page_script_environment', map_benchmark.JAVASCRIPT_ENVIRONMENT)
+
+def _build_map(args):
+    """build_map 的主體"""
+    with map_instrument.stage('download'):
+        taiwan_geojson = download_taiwan_geojson(url=args.geojson_url, cache_dir=args.cache_dir,
+                                                 ttl=args.cache_ttl, offline=args.offline, timeout=args.timeout)
+    if not taiwan_geojson:
+        print("地圖創建失敗：缺少地理數據")
+        return
+
+    with map_instrument.stage('data'):
+        dataset = get_dataset(args.data_dir, args.counties)
+        dataset.analytics
+    with map_instrument.stage('inputs'):
+        inputs = build_inputs(args, taiwan_geojson, dataset)
+    if not args.force and build_is_current(args, inputs):
+        print(f"輸入未變更，保留既有的地圖 '{args.output}'")
+        return
+
+    if args.topojson:
+        with map_instrument.stage('topojson'):
+            topology = map_geometry.build_topology(taiwan_geojson, args.precision)
+            tolerance = args.simplify_tolerance
+            if tolerance is None:
+                tolerance = map_geometry.zoom_tolerance(map_geometry.DEFAULT_TARGET_ZOOM)
+            if tolerance > 0:
+                topology = map_geometry.simplify_topology(topology, tolerance, args.simplify_method)
+            topojson = map_geometry.topology_to_topojson(topology)
+            with open(args.topojson, 'w', encoding='utf-8') as file:
+                json.dump(topojson, file, ensure_ascii=False, separators=(',', ':'))
+            map_geometry.report_size('TopoJSON', map_geometry.geojson_size(taiwan_geojson),
+                                     os.path.getsize(args.topojson))
+
+    if args.zoom_levels_dir:
+        with map_instrument.stage('zoom_levels'):
+            os.makedirs(args.zoom_levels_dir, exist_ok=True)
+            levels = map_geometry.build_zoom_levels(taiwan_geojson, precision=args.precision,
+                                                    method=args.simplify_method)
+            for zoom, level_geojson in levels.items():
+                level_path = os.path.join(args.zoom_levels_dir, f'geometry_z{zoom}.json')
+                with open(level_path, 'w', encoding='utf-8') as file:
+                    json.dump(level_geojson, file, ensure_ascii=False, separators=(',', ':'))
+
+    township_url = None
+    if args.townships:
+        township_dir = os.path.join(os.path.dirname(os.path.abspath(args.output)), 'townships')
+        with map_instrument.stage('townships'):
+            build_township_assets(township_dir, dataset, offline=args.offline, cache_dir=args.cache_dir,
+                                  precision=args.precision, simplify_method=args.simplify_method,
+                                  url=args.township_geojson_url)
+        township_url = 'townships/'
+
+    vector_tiles = None
+    if args.vector_tiles:
+        tile_dir = os.path.join(os.path.dirname(os.path.abspath(args.output)), 'tiles')
+        with map_instrument.stage('vector_tiles'):
+            vector_tiles = build_township_tiles(tile_dir, dataset, offline=args.offline, cache_dir=args.cache_dir,
+                                                min_zoom=args.tile_min_zoom, max_zoom=args.tile_max_zoom,
+                                                precision=args.precision, simplify_method=args.simplify_method,
+                                                url=args.township_geojson_url)
+        if vector_tiles:
+            vector_tiles['url'] = 'tiles/{z}/{x}/{y}.pbf'
+
+    time_series = None
+    if args.years:
+        with map_instrument.stage('years'):
+            time_series = build_year_assets(os.path.join(os.path.dirname(os.path.abspath(args.output)), 'years'),
+                                            dataset)
+        if time_series:
+            time_series['url'] = 'years/'
+
+    # 漸進載入：頁面只內嵌輪廓，完整的地理數據區塊與語言數據另外載入
+    progressive = None
+    if args.progressive:
+        with map_instrument.stage('progressive'):
+            prepared = prepare_map_geometry(taiwan_geojson, args.simplify_tolerance, args.precision,
+                                            args.simplify_method, dataset)
+            progressive = build_progressive_assets(
+                os.path.join(os.path.dirname(os.path.abspath(args.output)), 'progressive'), prepared, dataset,
+                args.precision, args.simplify_method)
+
     # 創建並保存地圖
-    m = create_language_map()
+    geometry_asset = None
+    if args.external_geometry and not progressive:
+        geometry_asset = os.path.splitext(args.output)[0] + '.geojson'
+    with map_instrument.stage('map'):
+        if progressive:
+            m = create_language_map(progressive['outline'], township_url=township_url, dataset=dataset,
+                                    prepared=True, data_url='progressive/' + progressive['data'],
+                                    vector_tiles=vector_tiles, time_series=time_series,
+                                    geometry_chunks=['progressive/' + url for url in progressive['chunks']])
+        else:
+            m = create_language_map(taiwan_geojson, args.simplify_tolerance, args.precision, args.simplify_method,
+                                    geometry_asset, township_url, dataset, vector_tiles=vector_tiles,
+                                    time_series=time_series)
     if m:
-        m.save('taiwan_language_map.html')
-        print("地圖已保存為 'taiwan_language_map.html'")
+        with map_instrument.stage('save'):
+            m.save(args.output)
+        # 附屬目錄在 build_outputs 中只列出索引檔，這裡計算整個目錄
+        output_dir = os.path.dirname(os.path.abspath(args.output))
+        for path in [args.output, geometry_asset, args.topojson, args.zoom_levels_dir] + [
+                os.path.join(output_dir, name) for name, enabled in
+                (('townships', args.townships), ('tiles', args.vector_tiles), ('years', args.years),
+                 ('progressive', args.progressive)) if enabled]:
+            if path:
+                map_instrument.count_bytes('bytes_emitted', path)
+        if map_instrument.enabled():
+            with map_instrument.stage('page_metrics'):
+                record_page_metrics(args.output, geometry_asset)
+        with open(build_stamp_path(args.output), 'w', encoding='utf-8') as file:
+            json.dump({'inputs': inputs, 'outputs': build_outputs(args)}, file, ensure_ascii=False, indent=2)
+        print(f"地圖已保存為 '{args.output}'（{os.path.getsize(args.output):,} bytes）")
     else:
-        print("地圖創建失敗")
\ No newline at end of file
+        print("地圖創建失敗")
+
+def add_data_arguments(parser):
+    """數據目錄、地理數據來源與簡化選項"""
+    parser.add_argument('--data-dir', default=DATA_DIR, help='語言數據目錄')
+    parser.add_argument('--counties', default=COUNTIES_PATH, help='縣市代碼表（GeoJSON，name 與 county_id）')
+    parser.add_argument('--geojson-url', default=GEOJSON_URL, help='縣市邊界 GeoJSON 的下載網址或本地檔案路徑')
+    parser.add_argument('--township-geojson-url', default=TOWNSHIP_GEOJSON_URL,
+                        help='鄉鎮市區邊界 GeoJSON 的下載網址')
+    parser.add_argument('--offline', action='store_true', help='不連網，只使用本地快取的地理數據（需要先連網下載過一次）')
+    parser.add_argument('--cache-dir', default=GEOJSON_CACHE_DIR, help='地理數據快取目錄')
+    parser.add_argument('--cache-ttl', type=float, default=GEOJSON_CACHE_TTL, help='快取有效期（秒）')
+    parser.add_argument('--timeout', type=float, default=GEOJSON_TIMEOUT, help='網路請求逾時（秒）')
+    parser.add_argument('--simplify-tolerance', type=float, default=None,
+                        help='邊界簡化容差（經緯度），預設依縮放等級 %d 換算，0 表示不簡化'
+                             % map_geometry.DEFAULT_TARGET_ZOOM)
+    parser.add_argument('--simplify-method', choices=sorted(map_geometry.SIMPLIFY_METHODS), default='dp',
+                        help='簡化演算法（dp: Douglas-Peucker，visvalingam: Visvalingam-Whyatt）')
+    parser.add_argument('--precision', type=int, default=map_geometry.DEFAULT_PRECISION,
+                        help='座標保留的小數位數')
+
+def add_map_arguments(parser):
+    """build、batch 與 serve 共用的選項"""
+    add_data_arguments(parser)
+    parser.add_argument('--townships', action='store_true',
+                        help='轉換各縣市活頁簿為鄉鎮市區數據（HTML同目錄的 townships/），點擊縣市時載入')
+
+def main(argv=None):
+    """命令列入口，未指定子命令時預設為 build"""
+    # 批次、匯出、效能基準與空間查詢模組需要引用本模組，執行時才載入
+    import map_batch
+    import map_benchmark
+    import map_export
+    import map_spatial
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or argv[0] not in COMMANDS + ('-h', '--help'):
+        argv.insert(0, 'build')
+
+    parser = argparse.ArgumentParser(description='產生台澎金馬語言分布地圖')
+    subparsers = parser.add_subparsers(dest='command')
+
+    build_parser = subparsers.add_parser('build', help='產生地圖（預設）')
+    build_parser.add_argument('--output', default='taiwan_language_map.html', help='輸出的HTML檔案路徑')
+    add_map_arguments(build_parser)
+    build_parser.add_argument('--topojson', help='另外輸出共用弧段的 TopoJSON 檔案')
+    build_parser.add_argument('--zoom-levels-dir', help='另外輸出各縮放等級的簡化 GeoJSON 到此目錄')
+    build_parser.add_argument('--external-geometry', action='store_true',
+                              help='將地理數據另存為與HTML同目錄的 .geojson 檔案，而不內嵌在頁面中')
+    build_parser.add_argument('--vector-tiles', action='store_true',
+                              help='將鄉鎮市區邊界與語言比例切成向量圖磚（HTML同目錄的 tiles/），放大時載入')
+    build_parser.add_argument('--tile-min-zoom', type=int, default=map_tiles.DEFAULT_MIN_ZOOM,
+                              help='向量圖磚的最小縮放等級')
+    build_parser.add_argument('--tile-max-zoom', type=int, default=map_tiles.DEFAULT_MAX_ZOOM,
+                              help='向量圖磚的最大縮放等級（更大時放大此等級的圖磚）')
+    build_parser.add_argument('--years', action='store_true',
+                              help='輸出各調查年份的數據（HTML同目錄的 years/），頁面加上時間滑桿與變化分布圖')
+    build_parser.add_argument('--progressive', action='store_true',
+                              help='頁面先繪製低解析度輪廓，再依序載入完整解析度的地理數據區塊（本島、澎湖、金門、馬祖）'
+                                   '與語言數據（HTML同目錄的 progressive/，取代 --external-geometry）')
+    build_parser.add_argument('--force', action='store_true', help='即使輸入未變更也重新產生')
+    build_parser.add_argument('--instrument', action='store_true',
+                              help='記錄各階段耗時與計數，寫成地圖旁的 <名稱>.report.json')
+    build_parser.add_argument('--profile', action='store_true',
+                              help='同時以 cProfile 剖析（原始結果另存為 <名稱>.prof），隱含 --instrument')
+    build_parser.add_argument('--trace-memory', action='store_true',
+                              help='同時以 tracemalloc 記錄記憶體用量與主要配置位置，隱含 --instrument')
+
+    batch_parser = subparsers.add_parser('batch', help='一次產生多種版本的地圖（共用地理數據）')
+    batch_parser.add_argument('--output-dir', default='maps', help='輸出目錄')
+    add_map_arguments(batch_parser)
+    batch_parser.add_argument('--variants', nargs='+', choices=map_batch.VARIANT_KINDS,
+                              default=list(map_batch.VARIANT_KINDS),
+                              help='要產生的版本：modes（包含／排除華語、語言多樣性）、languages（單一語言）、regions（各區域）')
+    batch_parser.add_argument('--workers', type=int, default=None, help='平行處理的程序數，預設為CPU核心數')
+
+    serve_parser = subparsers.add_parser('serve', help='啟動地圖伺服器（數據保存在記憶體中，檔案變更時自動重新載入）')
+    add_map_arguments(serve_parser)
+    serve_parser.add_argument('--host', default='127.0.0.1', help='監聽的位址')
+    serve_parser.add_argument('--port', type=int, default=8000, help='監聽的連接埠')
+    serve_parser.add_argument('--years', action='store_true', help='提供各調查年份的數據與時間滑桿')
+    serve_parser.add_argument('--poll-interval', type=float, default=2.0, help='檢查數據檔案變更的間隔（秒）')
+
+    export_parser = subparsers.add_parser('export', help='將縣市與鄉鎮市區的語言數據匯出為 CSV、Parquet 或 GeoPackage')
+    export_parser.add_argument('--output', help='輸出檔案路徑（預設為 language_data 加上格式的副檔名）')
+    export_parser.add_argument('--format', choices=sorted(map_export.EXPORT_FORMATS),
+                               help='輸出格式，預設依輸出檔案的副檔名判斷，否則為 csv')
+    export_parser.add_argument('--levels', nargs='+', choices=map_export.EXPORT_LEVELS,
+                               default=list(map_export.EXPORT_LEVELS[:2]),
+                               help='匯出的層級：county（縣市）、township（鄉鎮市區）、series（其他調查年份的縣市）')
+    export_parser.add_argument('--geometry', action='store_true', help='附上簡化後的邊界')
+    export_parser.add_argument('--chunk-size', type=int, default=map_export.CHUNK_SIZE, help='每批讀取與寫出的列數')
+    add_data_arguments(export_parser)
+
+    locate_parser = subparsers.add_parser('locate', help='查詢CSV中每個經緯度所在的縣市或鄉鎮市區與其語言使用比例')
+    locate_parser.add_argument('input', help='含經緯度欄位的CSV檔案')
+    locate_parser.add_argument('--output', default='located.csv', help='輸出的CSV檔案路徑')
+    locate_parser.add_argument('--level', choices=map_spatial.LEVELS, default='county',
+                               help='查詢的層級：county（縣市）或 township（鄉鎮市區）')
+    locate_parser.add_argument('--lon-column', default='lon', help='經度欄位名稱')
+    locate_parser.add_argument('--lat-column', default='lat', help='緯度欄位名稱')
+    locate_parser.add_argument('--workers', type=int, default=None, help='平行查詢的程序數，預設為CPU核心數')
+    locate_parser.add_argument('--chunk-size', type=int, default=map_spatial.CHUNK_SIZE,
+                               help='每個程序一次查詢的點數')
+    add_data_arguments(locate_parser)
+
+    benchmark_parser = subparsers.add_parser('benchmark', help='量測產生地圖各階段的耗時、輸出大小與頁面腳本的執行時間')
+    add_data_arguments(benchmark_parser)
+    benchmark_parser.add_argument('--rounds', type=int, default=map_benchmark.DEFAULT_ROUNDS, help='每個項目重複量測的次數')
+    benchmark_parser.add_argument('--baseline', default=map_benchmark.BASELINE_PATH, help='基準檔路徑')
+    benchmark_parser.add_argument('--update-baseline', action='store_true', help='將本次結果保存為新的基準')
+    benchmark_parser.add_argument('--time-tolerance', type=float, default=map_benchmark.TIME_TOLERANCE,
+                                  help='耗時中位數可比基準慢的比例')
+    benchmark_parser.add_argument('--size-tolerance', type=float, default=map_benchmark.SIZE_TOLERANCE,
+                                  help='輸出大小可比基準大的比例')
+    benchmark_parser.add_argument('--no-js', action='store_true', help='不以 Node.js 量測頁面腳本')
+
+    synthetic_parser = subparsers.add_parser('synthetic', help='產生大規模的合成邊界與語言數據，用於量測效能隨區域數量的變化')
+    synthetic_parser.add_argument('--output-dir', default='synthetic', help='輸出目錄（可直接作為 --data-dir）')
+    synthetic_parser.add_argument('--regions', type=map_synthetic.parse_size, default=map_synthetic.DEFAULT_REGIONS,
+                                  help='區域數量，例如 1k、10k、100k')
+    synthetic_parser.add_argument('--vertices', type=int, default=map_synthetic.DEFAULT_VERTICES,
+                                  help='每個區域邊界的頂點數')
+    synthetic_parser.add_argument('--seed', type=int, default=0, help='亂數種子，相同的種子產生相同的數據')
+    synthetic_parser.add_argument('--unmatched', type=float, default=0.0,
+                                  help='CSV中使用無法對應名稱的列所佔比例')
+    synthetic_parser.add_argument('--workbooks', type=int, default=0,
+                                  help='產生鄉鎮市區活頁簿的區域數（需要 openpyxl）')
+    synthetic_parser.add_argument('--township-rows', type=int, default=map_synthetic.DEFAULT_TOWNSHIP_ROWS,
+                                  help='每個活頁簿的鄉鎮市區數')
+
+    compile_parser = subparsers.add_parser('compile', help='將CSV與各縣市活頁簿編譯成單一資料庫')
+    compile_parser.add_argument('--data-dir', default=DATA_DIR, help='語言數據目錄')
+    compile_parser.add_argument('--counties', default=COUNTIES_PATH, help='縣市代碼表（GeoJSON，name 與 county_id）')
+    compile_parser.add_argument('--store', help='編譯資料庫的輸出路徑（預設為數據目錄中的 language_data.sqlite）')
+    compile_parser.add_argument('--force', action='store_true', help='即使來源未變更也重新編譯')
+    compile_parser.add_argument('--workers', type=int, help='同時解析活頁簿的程序數（預設為CPU核心數）')
+
+    args = parser.parse_args(argv)
+    if args.command == 'compile':
+        compile_language_store(args.data_dir, args.store or os.path.join(args.data_dir, 'language_data.sqlite'),
+                               args.force, args.counties, args.workers)
+    elif args.command == 'batch':
+        map_batch.run(args)
+    elif args.command == 'export':
+        map_export.run(args)
+    elif args.command == 'locate':
+        map_spatial.run(args)
+    elif args.command == 'synthetic':
+        map_synthetic.run(args)
+    elif args.command == 'benchmark':
+        if not map_benchmark.run(args):
+            sys.exit(1)
+    elif args.command == 'serve':
+        import map_server
+        map_server.run(args)
+    else:
+        build_map(args)
+
+if __name__ == '__main__':
+    main()